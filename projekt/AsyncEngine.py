@@ -0,0 +1,637 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import replace
+from random import random
+from socket import IPPROTO_IP
+from sys import platform
+from tempfile import TemporaryFile
+from typing import Awaitable, Callable
+
+from config import Config
+from Delta import apply_delta, delta_timeout, write_delta, write_signatures
+from FragmentWriter import load_resume, open_download
+from Protocol import IP_MTU_DISCOVER, IP_PMTUDISC_PROBE, IP_PMTUDISC_WANT, BaseConnection, BaseStream, KeepAliveState, RoundSender, WindowSender
+from Segment import AcceptMessage, AckSegment, DataSegment, DoneMessage, FileMessage, FinMessage, InitMessage, Message, NextMessage, OkMessage, ParitySegment, PingMessage, ProbeAckSegment, ProbeSegment, Segment, SegmentType, TextMessage, emit_segment, parse_datagram
+from Trace import TraceLevel, tracer
+
+
+class StreamClosed(Exception):
+    pass
+
+
+class AsyncStream(BaseStream):
+    async def receive(self, timeout: float | None = None):
+        segment = await asyncio.wait_for(self.queue.get(), Config.TIMEOUT if timeout == None else timeout)
+        if segment == None:
+            raise StreamClosed()
+        return segment
+
+    async def receive_message(self, timeout: float | None = None):
+        while True:
+            segment = await self.receive(timeout)
+            if isinstance(segment, Message):
+                if segment.id != self.next_message_id:
+                    tracer.trace(TraceLevel.Debug, "[ORD] Received fragment out of order {}", segment)
+                    self.metrics.count_out_of_order()
+                    continue
+                pass
+
+                self.next_message_id = (segment.id + 1) & self.owner.wire.id_mask
+                return segment
+            elif isinstance(segment, DataSegment):
+                if self.writer != None:
+                    self.recover(self.accept_fragment(segment, self.writer.write(segment.fragment_id, segment.data)))
+                    self.acknowledge()
+                pass
+            elif isinstance(segment, ParitySegment):
+                if self.writer != None and self.parity != None:
+                    self.recover(self.parity.add_parity(segment.first, segment.index, segment.count, segment.data, self.next_fragment))
+                    self.acknowledge()
+                pass
+            pass
+        pass
+
+    def recover(self, fragments: list[tuple[int, bytes]]):
+        assert self.writer != None
+        for fragment_id, data in fragments:
+            self.accept_recovered(fragment_id, data, self.writer.write(fragment_id, data))
+        pass
+
+    def delay_ack(self):
+        if self.ack_timer == None:
+            self.ack_timer = asyncio.get_running_loop().call_later(Config.ACK_DELAY, self.expire_ack)
+        pass
+
+    def expire_ack(self):
+        self.ack_timer = None
+        if self.acknowledging:
+            self.send_ack()
+        pass
+
+    def send_ack(self):
+        if self.ack_timer != None:
+            self.ack_timer.cancel()
+            self.ack_timer = None
+        pass
+        super().send_ack()
+
+    async def send_message(self, segment: Message, expect_type: SegmentType | None = None, measure=True, patience=0.0):
+        self.next_message_id = (segment.id + 1) & self.owner.wire.id_mask
+
+        recv: Message | None = None
+        for attempt in range(Config.REPEAT_LIMIT):
+            try:
+                sent_time = time.monotonic()
+                self.owner.send(segment)
+                if attempt > 0:
+                    self.owner.metrics.retransmissions += 1
+                pass
+                recv = await self.receive_message(max(self.owner.rtt.timeout(attempt), patience / Config.REPEAT_LIMIT))
+                if attempt == 0 and measure:
+                    self.owner.rtt.sample(time.monotonic() - sent_time)
+                pass
+                break
+            except asyncio.TimeoutError:
+                self.metrics.count_timeout()
+            pass
+        else:
+            tracer.trace(TraceLevel.Error, f"Reached REPEAT_LIMIT on stream {self.id}")
+            tracer.failure()
+            self.owner.close()
+            raise StreamClosed()
+        pass
+
+        if expect_type != None and recv.type != expect_type:
+            tracer.trace(TraceLevel.Error, "Received unexpected segment, expected type " + expect_type.name)
+            self.owner.close()
+            raise StreamClosed()
+        pass
+
+        return recv
+
+    async def send_ok(self, version=0):
+        receive_size = Config.RECEIVE_BUFFER_SIZE if version != 0 else 0
+        self.owner.send(OkMessage(self.id, self.next_message_id, version, receive_size))
+        try:
+            while True:
+                await self.receive()
+                self.owner.send(OkMessage(self.id, self.next_message_id, version, receive_size))
+            pass
+        except asyncio.TimeoutError:
+            return
+        pass
+
+    async def send_text(self, text: str):
+        length = max(1, self.owner.fragment_size() // 4)
+        for i in range(0, text.__len__(), length):
+            subtext = text[i : i + length]
+            await self.send_message(TextMessage(self.id, self.next_message_id, subtext), expect_type=SegmentType.Next)
+
+        await self.send_ok()
+
+    async def send_init(self):
+        reply = await self.send_message(InitMessage(self.id, self.next_message_id, Config.PROTOCOL_VERSION, Config.RECEIVE_BUFFER_SIZE), expect_type=SegmentType.OK)
+        assert isinstance(reply, OkMessage)
+        self.owner.set_version(max(1, min(reply.version, Config.PROTOCOL_VERSION)), reply.receive_size)
+        self.owner.discover_path()
+
+    async def probe(self, size: int):
+        for attempt in range(Config.PROBE_ATTEMPTS):
+            if not self.owner.send_probe(ProbeSegment(self.id, size, bytes(size - self.owner.wire.header_size))):
+                return False
+            pass
+
+            deadline = time.monotonic() + self.owner.rtt.timeout(attempt)
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                pass
+
+                try:
+                    segment = await self.receive(remaining)
+                except asyncio.TimeoutError:
+                    break
+                pass
+
+                if isinstance(segment, ProbeAckSegment) and segment.size == size:
+                    return True
+                pass
+            pass
+        pass
+
+        return False
+
+    async def probe_path(self):
+        low = Config.MIN_DATAGRAM_SIZE
+        high = min(self.owner.peer_receive_size, Config.MAX_PROBE_SIZE)
+        candidate = high
+        while high - low > Config.PROBE_PRECISION:
+            if await self.probe(candidate):
+                low = candidate
+            else:
+                high = candidate - 1
+            pass
+            candidate = (low + high + 1) // 2
+        pass
+
+        self.owner.max_datagram = low
+        tracer.trace(TraceLevel.Info, f"[MTU] Using datagram size {low}, fragment size {self.owner.fragment_size()}")
+
+    async def send_ping(self):
+        await self.send_message(PingMessage(self.id, self.next_message_id), expect_type=SegmentType.OK)
+
+    async def send_fin(self):
+        await self.send_message(FinMessage(self.id, self.next_message_id), expect_type=SegmentType.OK)
+        await asyncio.sleep(0.01)
+        self.owner.close()
+
+    async def send_file(self, source: str, dest: str, offset=0, length=-1, total=0, delta=False):
+        request = self.prepare_upload(source, dest, offset, length, total, delta)
+        if request == None:
+            return
+        pass
+
+        reply = await self.send_message(request, measure=request.delta == 0, patience=delta_timeout(request.size) if request.delta != 0 else 0)
+        if request.delta != 0 and isinstance(reply, FileMessage):
+            reply = await self.send_delta(request, reply)
+        pass
+
+        if not isinstance(reply, AcceptMessage):
+            if isinstance(reply, TextMessage):
+                tracer.trace(TraceLevel.Error, f"[FILE] Cannot send file {reply.text}")
+                self.close_file()
+                await self.send_ok()
+                return
+            else:
+                tracer.trace(TraceLevel.Error, f"Received unexpected segment {reply.type.name}")
+                self.owner.close()
+                raise StreamClosed()
+            pass
+        pass
+
+        self.start_upload(reply, dest)
+        if self.owner.version >= 2:
+            fragment_count = await self.send_fragments(reply.fec != 0)
+            if fragment_count == None:
+                self.close_file()
+                await self.send_ok()
+                return
+            pass
+            await self.send_message(DoneMessage(self.id, self.next_message_id), expect_type=SegmentType.Next)
+        else:
+            fragment_count = await self.send_fragments_in_rounds()
+        pass
+
+        self.finish_upload(request, fragment_count)
+        await self.send_ok()
+        self.record_upload(request, fragment_count)
+
+    async def send_fragments_in_rounds(self):
+        assert self.file != None
+        sender = RoundSender(self)
+        while True:
+            sender.fill()
+            if sender.finished():
+                return sender.next_fragment_id
+            pass
+
+            reply = await self.send_message(DoneMessage(self.id, self.next_message_id), expect_type=SegmentType.Next)
+            assert isinstance(reply, NextMessage)
+            sender.confirm(reply.ranges)
+        pass
+
+    async def send_fragments(self, protection=False):
+        assert self.file != None
+        sender = WindowSender(self, protection)
+        while True:
+            delay = sender.transmit()
+            self.owner.flush()
+            if delay == 0 and sender.finished():
+                return sender.finish()
+            pass
+
+            try:
+                segment = await self.receive(delay if delay > 0 else sender.timeout())
+            except asyncio.TimeoutError:
+                if delay > 0:
+                    continue
+                pass
+
+                if not sender.expire():
+                    tracer.trace(TraceLevel.Error, f"Reached REPEAT_LIMIT on stream {self.id}")
+                    tracer.failure()
+                    self.owner.close()
+                    raise StreamClosed()
+                pass
+                continue
+            pass
+
+            if isinstance(segment, AckSegment):
+                sender.acknowledge(segment)
+            elif self.refused(segment):
+                return None
+            pass
+        pass
+
+    async def receive_signatures(self, header: FileMessage):
+        signatures = TemporaryFile()
+        await self.send_message(self.open_signatures(header, signatures), expect_type=SegmentType.Done, measure=False)
+        self.acknowledging = False
+        self.writer = None
+        return signatures
+
+    async def send_delta(self, request: FileMessage, header: FileMessage):
+        assert self.file != None
+        signatures = await self.receive_signatures(header)
+        try:
+            encoded = await asyncio.to_thread(write_delta, self.file, signatures)
+        except (OSError, ValueError) as error:
+            tracer.trace(TraceLevel.Error, f"[FILE] Cannot compute delta: {error}")
+            encoded = None
+        pass
+        signatures.close()
+
+        return await self.send_message(self.delta_request(request, encoded))
+
+    async def send_signatures(self, segment: FileMessage):
+        signatures = await asyncio.to_thread(write_signatures, segment.path) if load_resume(segment) == None else None
+        if signatures == None:
+            return replace(segment, delta=0)
+        pass
+
+        await self.send_message(self.signature_request(segment, signatures), expect_type=SegmentType.Accept, measure=False)
+        await self.send_fragments()
+        self.close_file()
+        reply = await self.send_message(DoneMessage(self.id, self.next_message_id), expect_type=SegmentType.File, measure=False, patience=delta_timeout(segment.size))
+        assert isinstance(reply, FileMessage)
+        return reply
+
+    async def listen(self):
+        segment = await self.receive_message()
+
+        if isinstance(segment, TextMessage):
+            text = segment.text
+            while True:
+                response = await self.send_message(NextMessage(self.id, self.next_message_id, []))
+                if isinstance(response, OkMessage):
+                    break
+                elif isinstance(response, TextMessage):
+                    text += response.text
+                else:
+                    tracer.trace(TraceLevel.Error, f"Received unexpected segment {response.type.name}")  # type: ignore
+                    self.owner.close()
+                    raise StreamClosed()
+                pass
+            pass
+            print(text)
+        elif isinstance(segment, InitMessage):
+            version = max(1, min(segment.version, Config.PROTOCOL_VERSION))
+            self.owner.set_version(version, segment.receive_size)
+            self.owner.discover_path()
+            await self.send_ok(version)
+        elif isinstance(segment, PingMessage):
+            await self.send_ok()
+        elif isinstance(segment, FinMessage):
+            tracer.trace(TraceLevel.Info, "[SIG] Fin")
+            await self.send_ok()
+            self.owner.close()
+        elif isinstance(segment, FileMessage):
+            if segment.delta != 0:
+                segment = await self.send_signatures(segment)
+            pass
+            await self.receive_file(segment)
+        pass
+
+    async def receive_file(self, segment: FileMessage):
+        try:
+            self.file, self.writer = await asyncio.to_thread(open_download, segment)
+        except Exception as error:
+            error_text = f"Cannot receive file: {error}"
+            tracer.trace(TraceLevel.Error, f"[FILE] {error_text}")
+            await self.send_message(TextMessage(self.id, self.next_message_id, error_text), expect_type=SegmentType.OK)
+            return
+        pass
+
+        try:
+            reply = await self.send_message(self.accept_download(segment), measure=False)
+            while isinstance(reply, DoneMessage):
+                reply = await self.send_message(NextMessage(self.id, self.next_message_id, self.acknowledged_ranges()))
+            pass
+        except ValueError as error:
+            rejection = self.reject_download(segment, error)
+            await asyncio.to_thread(self.close_file)
+            await self.send_message(rejection, expect_type=SegmentType.OK)
+            return
+        pass
+
+        if not isinstance(reply, OkMessage):
+            tracer.trace(TraceLevel.Error, f"Received unexpected segment {reply.type.name}")
+            self.owner.close()
+            raise StreamClosed()
+        pass
+
+        self.acknowledging = False
+        if segment.delta != 0:
+            await self.complete_delta(segment)
+        else:
+            await asyncio.to_thread(self.close_file)
+            self.complete_download(segment)
+        pass
+
+    async def complete_delta(self, segment: FileMessage):
+        assert self.file != None
+        try:
+            size = await asyncio.to_thread(apply_delta, self.file, segment.path)
+        except (OSError, ValueError) as error:
+            await asyncio.to_thread(self.close_file)
+            tracer.trace(TraceLevel.Error, f"[FILE] Cannot apply delta: {error}")
+            return
+        pass
+
+        await asyncio.to_thread(self.close_file)
+        tracer.trace(TraceLevel.Info, f"[FILE] Download complete, destination: {segment.path}, size: {size}, fragment count: {self.next_fragment}, delta size: {segment.size}")
+
+    def run(self, method: Callable[[AsyncStream], Awaitable[None]]):
+        self.task = asyncio.get_running_loop().create_task(self.start(method))
+
+    async def start(self, method: Callable[[AsyncStream], Awaitable[None]]):
+        try:
+            await method(self)
+        except StreamClosed:
+            pass
+        finally:
+            if self.ack_timer != None:
+                self.ack_timer.cancel()
+            pass
+
+            await asyncio.to_thread(self.close_file)
+            self.owner.streams.pop(self.id, None)
+        pass
+
+    def __init__(self, owner: AsyncConnection, id: int) -> None:
+        super().__init__(owner, id)
+        self.owner = owner
+        self.queue = asyncio.Queue[Segment | None]()
+        self.task: asyncio.Task[None] | None = None
+        self.ack_timer: asyncio.TimerHandle | None = None
+        pass
+
+
+class AsyncConnection(BaseConnection):
+    def send(self, segment: Segment, flush=True):
+        tracer.trace(TraceLevel.Segment, "[-->] {}", segment)
+
+        data = emit_segment(segment, self.version)
+        self.metrics.segments_sent += 1
+        if self.version < 2 or not Config.COALESCE:
+            self.transmit(data)
+            return
+        pass
+
+        if self.pending.__len__() > 0 and self.pending.__len__() + data.__len__() > self.max_datagram:
+            self.transmit(self.pending)
+            self.pending = bytearray()
+        pass
+
+        self.pending += data
+        if flush:
+            self.flush()
+        pass
+
+    def flush(self):
+        if self.pending.__len__() > 0:
+            self.transmit(self.pending)
+            self.pending = bytearray()
+        pass
+
+    def transmit(self, datagram: bytearray):
+        self.metrics.datagrams_sent += 1
+        self.metrics.bytes_sent += datagram.__len__()
+        self.transport.sendto(datagram, self.target)
+
+    def send_probe(self, segment: ProbeSegment):
+        self.flush()
+        handle = self.transport.get_extra_info("socket")
+        if platform.startswith("linux"):
+            handle.setsockopt(IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_PROBE)
+        pass
+
+        self.transmit(emit_segment(segment, self.version))
+
+        if platform.startswith("linux"):
+            handle.setsockopt(IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_WANT)
+        pass
+
+        return True
+
+    def close(self):
+        if not self.open:
+            return
+        pass
+
+        self.open = False
+        tracer.trace(TraceLevel.Info, "[SIG] Close")
+        if self.keep_alive_timer != None:
+            self.keep_alive_timer.cancel()
+        pass
+
+        for stream in list(self.streams.values()):
+            stream.queue.put_nowait(None)
+        pass
+
+        self.on_close(self)
+
+    def next_stream(self):
+        id = self.next_stream_id
+        self.next_stream_id += 2
+        stream = AsyncStream(self, id)
+        self.streams[id] = stream
+        return stream
+
+    def wait_for_stripes(self, streams: list[AsyncStream], finish: Callable[[], None]):
+        async def wait():
+            await asyncio.gather(*(stream.task for stream in streams if stream.task != None))
+            finish()
+
+        task = asyncio.get_running_loop().create_task(wait())
+        self.uploads.add(task)
+        task.add_done_callback(self.uploads.discard)
+
+    def handle_segment(self, segment: Segment):
+        self.last_segment_time = time.monotonic() + (Config.PING_INTERVAL * 0.1 * random())
+        self.metrics.segments_received += 1
+        if not isinstance(segment, (PingMessage, OkMessage)):
+            self.last_activity_time = time.monotonic()
+        pass
+
+        if isinstance(segment, ProbeSegment):
+            self.send(ProbeAckSegment(segment.stream, segment.size))
+            return
+        pass
+
+        stream = self.streams.get(segment.stream)
+        if stream == None:
+            if not isinstance(segment, Message):
+                return
+            pass
+
+            stream = AsyncStream(self, segment.stream)
+            self.streams[segment.stream] = stream
+            stream.queue.put_nowait(segment)
+            stream.run(lambda v: v.listen())
+            return
+        pass
+
+        stream.queue.put_nowait(segment)
+
+    def keep_alive(self):
+        self.keep_alive_timer = None
+        if not self.open:
+            return
+        pass
+
+        if self.is_server and self.idle():
+            tracer.trace(TraceLevel.Info, f"[SIG] Idle timeout [{self.target[0]}]:{self.target[1]}")
+            self.close()
+            return
+        pass
+
+        time_since_last_segment = time.monotonic() - self.last_segment_time
+        if self.keep_alive_state == KeepAliveState.Normal:
+            if time_since_last_segment > Config.PING_INTERVAL:
+                self.next_stream().run(lambda v: v.send_ping())
+                self.keep_alive_state = KeepAliveState.Notified
+            pass
+        elif time_since_last_segment < Config.PING_INTERVAL:
+            self.keep_alive_state = KeepAliveState.Normal
+        elif time_since_last_segment > Config.PING_INTERVAL * 2:
+            self.close()
+            return
+        pass
+
+        self.keep_alive_timer = asyncio.get_running_loop().call_later(Config.PING_INTERVAL / 2, self.keep_alive)
+
+    def __init__(self, transport: asyncio.DatagramTransport, target: tuple[str, int], is_server: bool, on_close: Callable[[AsyncConnection], None]) -> None:
+        super().__init__(target, is_server)
+        self.transport = transport
+        self.on_close = on_close
+        self.streams: dict[int, AsyncStream] = {}
+        self.uploads: set[asyncio.Task[None]] = set()
+        self.keep_alive_timer: asyncio.TimerHandle | None = asyncio.get_running_loop().call_later(Config.PING_INTERVAL / 2, self.keep_alive)
+        pass
+
+
+class AsyncEndpoint(asyncio.DatagramProtocol):
+    def connection_made(self, transport: asyncio.DatagramTransport):  # type: ignore
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr: tuple[str, int]):
+        self.datagrams += 1
+        self.received_bytes += data.__len__()
+        connection = self.connections.get(addr)
+        metrics = connection.metrics if connection != None else None
+        if metrics != None:
+            metrics.datagrams_received += 1
+            metrics.bytes_received += data.__len__()
+        pass
+
+        for segment in parse_datagram(data, metrics):
+            tracer.trace(TraceLevel.Segment, "[<--] {}", segment)
+
+            connection = self.connections.get(addr)
+            if connection == None:
+                if not self.is_server or self.stopping or not isinstance(segment, InitMessage):
+                    continue
+                pass
+
+                connection = AsyncConnection(self.transport, addr, True, self.closed)
+                self.connections[addr] = connection
+                self.connection_count += 1
+                self.controller = connection
+                tracer.trace(TraceLevel.Info, f"New client [{addr[0]}]:{addr[1]}")
+            pass
+
+            connection.handle_segment(segment)
+        pass
+
+    def connect(self, target: tuple[str, int]):
+        connection = AsyncConnection(self.transport, target, False, self.closed)
+        self.connections[target] = connection
+        self.controller = connection
+        connection.next_stream().run(lambda v: v.send_init())
+        return connection
+
+    def shutdown(self):
+        self.stopping = True
+        for connection in list(self.connections.values()):
+            connection.request_fin()
+        pass
+
+        if self.connections.__len__() == 0 and not self.finished.done():
+            self.finished.set_result(None)
+        pass
+
+    def closed(self, connection: AsyncConnection):
+        self.connections.pop(connection.target, None)
+        if self.controller == connection:
+            self.controller = next(reversed(self.connections.values()), None)
+        pass
+
+        if (not self.is_server or self.stopping and self.connections.__len__() == 0) and not self.finished.done():
+            self.finished.set_result(None)
+        pass
+
+    def __init__(self, is_server: bool) -> None:
+        self.is_server = is_server
+        self.transport: asyncio.DatagramTransport | None = None
+        self.connections: dict[tuple[str, int], AsyncConnection] = {}
+        self.controller: AsyncConnection | None = None
+        self.stopping = False
+        self.connection_count = 0
+        self.datagrams = 0
+        self.received_bytes = 0
+        self.finished = asyncio.get_running_loop().create_future()
+        pass
@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import runpy
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from itertools import product
+from queue import Empty, Queue
+from socket import AF_INET, SOCK_DGRAM, socket
+from threading import Thread
+from typing import Any
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+@dataclass
+class BenchmarkResult:
+    size: int
+    fragment_size: int
+    window_size: int
+    loss: float
+    ok: bool
+    fec: bool = False
+    seconds: float = 0.0
+    throughput: float = 0.0
+    fragments: int = 0
+    retransmissions: int = 0
+    retransmission_ratio: float = 0.0
+    client_cpu: float = 0.0
+    server_cpu: float = 0.0
+    error: str = ""
+
+
+class Node:
+    def pump(self):
+        assert self.process.stdout != None
+        for line in self.process.stdout:
+            self.lines.put(line.rstrip("\n"))
+        pass
+
+    def command(self, text: str):
+        assert self.process.stdin != None
+        try:
+            self.process.stdin.write(text + "\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, ValueError):
+            pass
+        pass
+
+    def wait_for(self, text: str, timeout: float):
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            pass
+
+            try:
+                line = self.lines.get(timeout=remaining)
+            except Empty:
+                return None
+            pass
+
+            if text in line:
+                return line
+            pass
+        pass
+
+    def finish(self, timeout: float):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            pid, status, usage = os.wait4(self.process.pid, os.WNOHANG)
+            if pid != 0:
+                self.process.returncode = status
+                return usage.ru_utime + usage.ru_stime
+            pass
+            time.sleep(0.05)
+        pass
+
+        self.process.kill()
+        _, _, usage = os.wait4(self.process.pid, 0)
+        return usage.ru_utime + usage.ru_stime
+
+    def __init__(self, arguments: list[str], overrides: dict[str, Any]) -> None:
+        environment = dict(os.environ, PYTHONUNBUFFERED="1")
+        command = [sys.executable, os.path.abspath(__file__), "--node", json.dumps(overrides), *arguments]
+        self.process = subprocess.Popen(command, cwd=ROOT, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=environment)
+        self.lines = Queue[str]()
+        Thread(target=self.pump, daemon=True).start()
+        pass
+
+
+def free_port():
+    handle = socket(AF_INET, SOCK_DGRAM)
+    handle.bind(("127.0.0.1", 0))
+    port = handle.getsockname()[1]
+    handle.close()
+    return port
+
+
+def digest(path: str):
+    hash = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            hash.update(block)
+        pass
+    pass
+
+    return hash.digest()
+
+
+def run_case(directory: str, source: str, size: int, fragment_size: int, window_size: int, loss: float, seed: int, timeout: float, overrides: dict[str, Any], impairment: str):
+    from Impairment import ImpairmentProxy
+
+    result = BenchmarkResult(size, fragment_size, window_size, loss, False, bool(overrides.get("FEC", False)))
+    overrides = {"TRACE_LEVEL": 2, "FRAGMENT_SIZE": fragment_size, "WINDOW_SIZE": window_size, "INITIAL_WINDOW": window_size, **overrides}
+    destination = os.path.join(directory, "received.bin")
+    statistics = os.path.join(directory, "stats.json")
+    for path in (destination, statistics):
+        if os.path.exists(path):
+            os.remove(path)
+        pass
+    pass
+
+    port = free_port()
+    server = Node(["server", str(port)], overrides)
+    time.sleep(0.3)
+    profile = ",".join(item for item in (impairment, f"loss={loss}" if loss > 0 else "") if item != "")
+    relay = ImpairmentProxy(("127.0.0.1", port), profile, seed).start() if profile != "" else None
+    client = Node(["client", "127.0.0.1", str(relay.port if relay != None else port)], overrides)
+    try:
+        if client.wait_for("Using protocol version", timeout) == None:
+            result.error = "handshake timed out"
+            return result
+        pass
+        client.wait_for("[MTU]", 2)
+
+        started = time.monotonic()
+        client.command(f"FILE {source}, {destination}")
+        line = client.wait_for("Upload finished", timeout)
+        result.seconds = time.monotonic() - started
+        if line == None:
+            result.error = "transfer timed out"
+            return result
+        pass
+
+        result.fragments = int(line.rsplit(":", 1)[1])
+        result.throughput = size / result.seconds / 1e6 if result.seconds > 0 else 0.0
+
+        client.command(f"STATS json {statistics}")
+        if client.wait_for("Exported statistics", timeout) != None:
+            with open(statistics) as file:
+                connections = json.load(file)["connections"]
+            pass
+            result.retransmissions = sum(connection["retransmissions"] for connection in connections)
+            result.retransmission_ratio = result.retransmissions / max(1, result.fragments)
+        pass
+
+        server.wait_for("Download complete", timeout)
+        expected = digest(source)
+        deadline = time.monotonic() + 2
+        while not result.ok and time.monotonic() < deadline:
+            result.ok = os.path.exists(destination) and digest(destination) == expected
+            if not result.ok:
+                time.sleep(0.05)
+            pass
+        pass
+        if not result.ok:
+            result.error = "received file differs"
+        pass
+    finally:
+        client.command("FIN")
+        result.client_cpu = client.finish(timeout)
+        server.command("FIN")
+        result.server_cpu = server.finish(timeout)
+        if relay != None:
+            relay.stop()
+        pass
+    pass
+
+    return result
+
+
+def parse_sizes(text: str):
+    sizes: list[int] = []
+    for item in text.split(","):
+        item = item.strip().upper()
+        multiplier = 1
+        for suffix, value in (("K", 1 << 10), ("M", 1 << 20), ("G", 1 << 30)):
+            if item.endswith(suffix):
+                multiplier = value
+                item = item[:-1]
+            pass
+        pass
+        sizes.append(int(float(item) * multiplier))
+    pass
+
+    return sizes
+
+
+def format_table(results: list[BenchmarkResult]):
+    header = f"{'size':>10} {'fragment':>8} {'window':>6} {'loss':>6} {'fec':>3} {'ok':>3} {'MB/s':>8} {'time s':>8} {'retrans':>8} {'ratio':>7} {'cli cpu':>8} {'srv cpu':>8}"
+    lines = [header, "-" * header.__len__()]
+    for result in results:
+        fragment = str(result.fragment_size) if result.fragment_size > 0 else "auto"
+        lines.append(f"{result.size:>10} {fragment:>8} {result.window_size:>6} {result.loss:>6.3f} {'on' if result.fec else 'off':>3} {'yes' if result.ok else 'no':>3} {result.throughput:>8.2f} {result.seconds:>8.3f} {result.retransmissions:>8} {result.retransmission_ratio:>7.3f} {result.client_cpu:>8.3f} {result.server_cpu:>8.3f}" + (f"  {result.error}" if result.error != "" else ""))
+    pass
+
+    return "\n".join(lines)
+
+
+def find_regressions(results: list[BenchmarkResult], tolerance: float):
+    regressions: list[str] = []
+    for baseline, protected in zip(results[::2], results[1::2]):
+        if not protected.ok or (baseline.ok and protected.seconds > baseline.seconds * (1 + tolerance)):
+            regressions.append(f"size {protected.size} fragment {protected.fragment_size} window {protected.window_size} loss {protected.loss}: {protected.seconds:.3f} s with FEC, {baseline.seconds:.3f} s without" + (f" ({protected.error})" if protected.error != "" else ""))
+        pass
+    pass
+
+    return regressions
+
+
+def run_node(overrides: str, arguments: list[str]):
+    sys.path.insert(0, ROOT)
+    from config import Config
+
+    for name, value in json.loads(overrides).items():
+        if not hasattr(Config, name):
+            exit(f"Unknown configuration option {name}")
+        pass
+        setattr(Config, name, value)
+    pass
+
+    sys.argv = [os.path.join(ROOT, "main.py"), *arguments]
+    runpy.run_path(sys.argv[0], run_name="__main__")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Loopback throughput benchmark for the UDP communicator")
+    parser.add_argument("--sizes", default="1M,16M", help="comma separated file sizes, K/M/G suffixes allowed")
+    parser.add_argument("--fragment-sizes", default="0,1024", help="comma separated FRAGMENT_SIZE values, 0 is automatic")
+    parser.add_argument("--window-sizes", default="10,64", help="comma separated WINDOW_SIZE values")
+    parser.add_argument("--loss", help="comma separated datagram loss rates, defaults to 0,0.01 or 0.02,0.05 with --regression")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per combination")
+    parser.add_argument("--impairment", default="", help="impairment proxy profile applied to every run, e.g. delay=0.02,jitter=0.005,down:rate=10M")
+    parser.add_argument("--seed", type=int, default=1, help="seed for the impairment proxy")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds before a run is abandoned")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE", help="extra Config override as JSON value, may repeat")
+    parser.add_argument("--regression", action="store_true", help="run every combination with FEC off and on and fail when FEC is slower")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="relative slowdown allowed for FEC runs with --regression")
+    parser.add_argument("--format", choices=["table", "json"], default="table")
+    parser.add_argument("--output", help="write the report to this file instead of stdout")
+    arguments = parser.parse_args()
+
+    overrides: dict[str, Any] = {}
+    for item in arguments.set:
+        name, _, value = item.partition("=")
+        try:
+            overrides[name] = json.loads(value)
+        except ValueError:
+            overrides[name] = value
+        pass
+    pass
+
+    results: list[BenchmarkResult] = []
+    with tempfile.TemporaryDirectory(prefix="udp-benchmark-") as directory:
+        sources: dict[int, str] = {}
+        sizes = parse_sizes(arguments.sizes)
+        fragment_sizes = [int(value) for value in arguments.fragment_sizes.split(",")]
+        window_sizes = [int(value) for value in arguments.window_sizes.split(",")]
+        losses = [float(value) for value in (arguments.loss or ("0.02,0.05" if arguments.regression else "0,0.01")).split(",")]
+        modes = [False, True] if arguments.regression else [overrides.get("FEC")]
+        for size, fragment_size, window_size, loss, run, fec in product(sizes, fragment_sizes, window_sizes, losses, range(arguments.repeat), modes):
+            if size not in sources:
+                sources[size] = os.path.join(directory, f"source-{size}.bin")
+                with open(sources[size], "wb") as file:
+                    file.write(random.Random(size).randbytes(size))
+                pass
+            pass
+
+            result = run_case(directory, sources[size], size, fragment_size, window_size, loss, arguments.seed + run, arguments.timeout, overrides if fec == None else {**overrides, "FEC": fec}, arguments.impairment)
+            print(f"[BENCH] size {size} fragment {fragment_size} window {window_size} loss {loss} fec {'on' if result.fec else 'off'}: {result.throughput:.2f} MB/s" + (f" ({result.error})" if result.error != "" else ""), file=sys.stderr)
+            results.append(result)
+        pass
+    pass
+
+    report = json.dumps([asdict(result) for result in results], indent=2) if arguments.format == "json" else format_table(results)
+    if arguments.output != None:
+        with open(arguments.output, "w") as file:
+            file.write(report + "\n")
+        pass
+    else:
+        print(report)
+    pass
+
+    if arguments.regression:
+        regressions = find_regressions(results, arguments.tolerance)
+        for regression in regressions:
+            print(f"[BENCH] FEC regression at {regression}", file=sys.stderr)
+        pass
+        if regressions.__len__() > 0:
+            exit(1)
+        pass
+    pass
+
+
+if __name__ == "__main__":
+    if sys.argv.__len__() > 2 and sys.argv[1] == "--node":
+        run_node(sys.argv[2], sys.argv[3:])
+    else:
+        main()
+    pass
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from threading import Lock
+
+
+class PooledBuffer:
+    def hold(self):
+        with self.pool.lock:
+            self.references += 1
+        pass
+
+    def release(self):
+        with self.pool.lock:
+            self.references -= 1
+            if self.references > 0:
+                return
+            pass
+
+            if self.pool.free.__len__() < self.pool.capacity and self.data.__len__() == self.pool.size:
+                self.pool.free.append(self)
+            pass
+        pass
+
+    def __init__(self, pool: BufferPool, size: int) -> None:
+        self.pool = pool
+        self.data = bytearray(size)
+        self.view = memoryview(self.data)
+        self.references = 1
+        pass
+
+
+class BufferPool:
+    def acquire(self):
+        with self.lock:
+            if self.free.__len__() > 0:
+                buffer = self.free.pop()
+                buffer.references = 1
+                return buffer
+            pass
+        pass
+
+        return PooledBuffer(self, self.size)
+
+    def __init__(self, size: int, capacity: int) -> None:
+        self.size = size
+        self.capacity = capacity
+        self.free: list[PooledBuffer] = []
+        self.lock = Lock()
+        pass
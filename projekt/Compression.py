@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import os
+import time
+import zlib
+from dataclasses import dataclass
+from struct import Struct
+from typing import Any, Callable
+
+from config import Config
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+pass
+
+zstd: Any = None
+try:
+    from compression import zstd  # type: ignore
+except ImportError:
+    try:
+        import zstandard as zstd  # type: ignore
+    except ImportError:
+        pass
+    pass
+pass
+
+FRAME = Struct(">BI")
+FRAME_RAW = 0
+FRAME_COMPRESSED = 1
+
+
+@dataclass
+class Codec:
+    id: int
+    name: str
+    compress: Callable[[bytes | memoryview], bytes]
+    decompress: Callable[[bytes], bytes]
+
+
+def available_codecs():
+    available = {1: Codec(1, "zlib", lambda data: zlib.compress(data, 1), zlib.decompress)}
+    if lzma != None:
+        available[2] = Codec(2, "lzma", lambda data: lzma.compress(data, preset=0), lzma.decompress)
+    pass
+
+    if zstd != None:
+        available[3] = Codec(3, "zstd", lambda data: zstd.compress(data, 3), zstd.decompress)
+    pass
+
+    return available
+
+
+codecs = available_codecs()
+
+
+def preferred_codecs():
+    names = [name.strip() for name in Config.COMPRESSION.split(",")]
+    return [codec for name in names for codec in codecs.values() if codec.name == name]
+
+
+def offered_codecs():
+    return sum(1 << codec.id for codec in preferred_codecs())
+
+
+def select_codec(offer: int):
+    for codec in preferred_codecs():
+        if offer & (1 << codec.id):
+            return codec.id
+        pass
+    pass
+
+    return 0
+
+
+def worth_compressing(descriptor: int, offset: int, size: int, throughput: float):
+    if offered_codecs() == 0 or size < Config.COMPRESSION_CHUNK_SIZE:
+        return False
+    pass
+
+    length = Config.COMPRESSION_CHUNK_SIZE // 4
+    count = max(1, min(Config.COMPRESSION_SAMPLES, size // length))
+    raw = 0
+    compressed = 0
+    started = time.perf_counter()
+    for index in range(count):
+        data = os.pread(descriptor, length, offset + (size - length) * index // max(1, count - 1))
+        raw += data.__len__()
+        compressed += zlib.compress(data, 1).__len__()
+    pass
+    elapsed = time.perf_counter() - started
+
+    ratio = compressed / raw
+    if ratio > Config.COMPRESSION_MIN_RATIO:
+        return False
+    pass
+
+    return throughput <= 0 or elapsed <= 0 or throughput < raw / elapsed * (1 - ratio)
+
+
+def encoded_bound(size: int):
+    return size + (size + Config.COMPRESSION_CHUNK_SIZE - 1) // Config.COMPRESSION_CHUNK_SIZE * FRAME.size
+
+
+class FrameEncoder:
+    def encode(self, chunk: bytes | memoryview):
+        self.raw += chunk.__len__()
+        if self.skip > 0:
+            self.skip -= 1
+            return self.frame(FRAME_RAW, chunk)
+        pass
+
+        compressed = self.codec.compress(chunk)
+        if compressed.__len__() <= chunk.__len__() * Config.COMPRESSION_MIN_RATIO:
+            self.backoff = 0
+            return self.frame(FRAME_COMPRESSED, compressed)
+        pass
+
+        self.backoff = min(Config.COMPRESSION_MAX_BACKOFF, self.backoff * 2 or 1)
+        self.skip = self.backoff
+        return self.frame(FRAME_RAW, chunk)
+
+    def frame(self, kind: int, data: bytes | memoryview):
+        self.encoded += FRAME.size + data.__len__()
+        return FRAME.pack(kind, data.__len__()), data
+
+    def read(self, length: int):
+        while self.pending.__len__() - self.offset < length:
+            chunk = self.source(Config.COMPRESSION_CHUNK_SIZE)
+            if chunk.__len__() == 0:
+                break
+            pass
+
+            self.pending = b"".join((self.pending[self.offset :], *self.encode(chunk)))
+            self.offset = 0
+        pass
+
+        data = self.pending[self.offset : self.offset + length]
+        self.offset += data.__len__()
+        return data
+
+    def __init__(self, codec: Codec, source: Callable[[int], bytes | memoryview]) -> None:
+        self.codec = codec
+        self.source = source
+        self.pending = b""
+        self.offset = 0
+        self.backoff = 0
+        self.skip = 0
+        self.raw = 0
+        self.encoded = 0
+        pass
+
+
+class FrameDecoder:
+    def decode(self, data: bytes | memoryview):
+        self.pending += data
+        output: list[bytes] = []
+        while self.pending.__len__() >= FRAME.size:
+            kind, length = FRAME.unpack_from(self.pending)
+            if self.pending.__len__() < FRAME.size + length:
+                break
+            pass
+
+            body = bytes(self.pending[FRAME.size : FRAME.size + length])
+            del self.pending[: FRAME.size + length]
+            if kind == FRAME_COMPRESSED:
+                try:
+                    body = self.codec.decompress(body)
+                except Exception as error:
+                    raise ValueError(f"Invalid {self.codec.name} frame: {error}") from error
+                pass
+            elif kind != FRAME_RAW:
+                raise ValueError(f"Invalid compression frame {kind}")
+            pass
+            output.append(body)
+        pass
+
+        return b"".join(output)
+
+    def __init__(self, codec: Codec) -> None:
+        self.codec = codec
+        self.pending = bytearray()
+        pass
@@ -0,0 +1,72 @@
+from config import Config
+from Trace import TraceLevel, tracer
+
+
+class CongestionController:
+    def on_ack(self, acknowledged: int):
+        pass
+
+    def on_loss(self, lost_sequence: int, sent_sequence: int):
+        pass
+
+    def on_timeout(self, sent_sequence: int):
+        pass
+
+    def limit(self):
+        return max(1, int(self.window))
+
+    def __init__(self) -> None:
+        self.window = float(Config.WINDOW_SIZE)
+        pass
+
+
+class FixedWindow(CongestionController):
+    pass
+
+
+class NewReno(CongestionController):
+    def on_ack(self, acknowledged: int):
+        if self.window < self.threshold:
+            self.window += acknowledged
+        else:
+            self.window += acknowledged / self.window
+        pass
+
+        self.window = min(self.window, Config.MAX_WINDOW)
+
+    def on_loss(self, lost_sequence: int, sent_sequence: int):
+        if lost_sequence <= self.recovery_sequence:
+            return
+        pass
+
+        self.recovery_sequence = sent_sequence
+        self.threshold = max(self.window / 2, Config.MIN_WINDOW)
+        self.window = self.threshold
+
+    def on_timeout(self, sent_sequence: int):
+        self.recovery_sequence = sent_sequence
+        self.threshold = max(self.window / 2, Config.MIN_WINDOW)
+        self.window = Config.MIN_WINDOW
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.window = float(Config.INITIAL_WINDOW)
+        self.threshold = float(Config.MAX_WINDOW)
+        self.recovery_sequence = 0
+        pass
+
+
+controllers: dict[str, type[CongestionController]] = {
+    "fixed": FixedWindow,
+    "newreno": NewReno,
+}
+
+
+def create_congestion_controller():
+    factory = controllers.get(Config.CONGESTION_CONTROL)
+    if factory == None:
+        tracer.trace(TraceLevel.Error, f"Unknown congestion control {Config.CONGESTION_CONTROL}, using fixed window")
+        factory = FixedWindow
+    pass
+
+    return factory()
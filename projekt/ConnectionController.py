@@ -1,132 +1,187 @@
 from __future__ import annotations
 
-import heapq
 import time
-from dataclasses import dataclass
-from enum import Enum
-from io import BufferedIOBase, FileIO
-from os import fstat
+from dataclasses import replace
 from queue import Empty, Queue
 from random import random
-from socket import socket
-from sys import exit
-from threading import Semaphore, Thread
+from socket import IPPROTO_IP, socket
+from sys import exit, platform
+from tempfile import TemporaryFile
+from threading import Event, Lock, Semaphore, Thread
 from typing import Callable
 
 from config import Config
-from Segment import AcceptMessage, DataSegment, DoneMessage, FileMessage, FinMessage, InitMessage, Message, NextMessage, OkMessage, PingMessage, Segment, SegmentType, TextMessage, emit_segment
-
-
-class KeepAliveState(Enum):
-    Normal = 0
-    Notified = 1
-    Terminating = 2
-
-
-@dataclass
-class PendingFragment:
-    age = 0
-    data: bytes
+from Delta import apply_delta, delta_timeout, write_delta, write_signatures
+from FragmentWriter import load_resume, open_download
+from Offload import GSO_MAX_BYTES, GSO_MAX_SEGMENTS, gso_supported, send_segments
+from Protocol import IP_MTU_DISCOVER, IP_PMTUDISC_PROBE, IP_PMTUDISC_WANT, BaseConnection, BaseStream, KeepAliveState, RoundSender, WindowSender
+from Segment import AcceptMessage, AckSegment, DataSegment, DoneMessage, FileMessage, FinMessage, InitMessage, Message, NextMessage, OkMessage, ParitySegment, PingMessage, ProbeAckSegment, ProbeSegment, Segment, SegmentType, TextMessage, emit_segment
+from Trace import TraceLevel, tracer
+
+
+class Stream(BaseStream):
+    def receive(self, timeout: float | None = None):
+        if timeout == None:
+            timeout = Config.TIMEOUT
+        pass
 
+        if self.acknowledging and self.unacknowledged > 0:
+            try:
+                segment = self.queue.get(timeout=Config.ACK_DELAY)
+                if segment == None:
+                    exit()
+                return segment
+            except Empty:
+                self.send_ack()
+                timeout = max(0, timeout - Config.ACK_DELAY)
+            pass
+        pass
 
-class Stream:
-    def receive(self):
-        segment = self.queue.get(timeout=Config.TIMEOUT)
+        segment = self.queue.get(timeout=timeout)
         if segment == None:
             exit()
         return segment
 
-    def receive_message(self):
+    def receive_message(self, timeout: float | None = None):
         while True:
-            segment = self.receive()
+            segment = self.receive(timeout)
             if isinstance(segment, Message):
                 if segment.id != self.next_message_id:
-                    print(f"[ORD] Received fragment out of order {segment.get_printable()}")
+                    tracer.trace(TraceLevel.Debug, "[ORD] Received fragment out of order {}", segment)
+                    self.metrics.count_out_of_order()
                     continue
                 pass
 
-                self.next_message_id = segment.id + 1
+                self.next_message_id = (segment.id + 1) & self.owner.wire.id_mask
                 return segment
-            else:
-                assert isinstance(segment, DataSegment)
-                if self.file == None:
-                    continue
-                pass
-
-                self.received_segments.append(segment.fragment_id)
-
-                if segment.fragment_id < self.next_fragment:
-                    print(f"[ORD] Received fragment out of order {segment.get_printable()}")
-                    continue
-                pass
-
-                if segment.fragment_id == self.next_fragment:
-                    self.next_fragment += 1
-                    self.file.write(segment.data)
-                else:
-                    heapq.heappush(self.fragment_queue, (segment.fragment_id, segment.data))
+            elif isinstance(segment, DataSegment):
+                try:
+                    if self.writer != None:
+                        self.recover(self.accept_fragment(segment, self.writer.write(segment.fragment_id, segment.data)))
+                        self.acknowledge()
+                    pass
+                finally:
+                    segment.release()
                 pass
-
-                while self.fragment_queue.__len__() > 0 and self.fragment_queue[0][0] <= self.next_fragment:
-                    id, data = heapq.heappop(self.fragment_queue)
-                    if id < self.next_fragment:
-                        continue
-                    self.next_fragment += 1
-                    self.file.write(data)
+            elif isinstance(segment, ParitySegment):
+                if self.writer != None and self.parity != None:
+                    self.recover(self.parity.add_parity(segment.first, segment.index, segment.count, segment.data, self.next_fragment))
+                    self.acknowledge()
                 pass
-
             pass
         pass
 
-    def send_message(self, segment: Message, expect_type: SegmentType | None = None, repeat=0):
-        self.next_message_id = segment.id + 1
+    def recover(self, fragments: list[tuple[int, bytes]]):
+        assert self.writer != None
+        for fragment_id, data in fragments:
+            self.accept_recovered(fragment_id, data, self.writer.write(fragment_id, data))
+        pass
+
+    def send_message(self, segment: Message, expect_type: SegmentType | None = None, repeat=0, measure=True, patience=0.0):
+        self.next_message_id = (segment.id + 1) & self.owner.wire.id_mask
 
         for _ in range(repeat):
             self.owner.send(segment)
 
         recv: Message | None = None
-        for _ in range(Config.REPEAT_LIMIT):
+        for attempt in range(Config.REPEAT_LIMIT):
             try:
+                sent_time = time.monotonic()
                 self.owner.send(segment)
-                recv = self.receive_message()
+                if attempt > 0:
+                    self.owner.metrics.retransmissions += 1
+                pass
+                recv = self.receive_message(max(self.owner.rtt.timeout(attempt), patience / Config.REPEAT_LIMIT))
+                if attempt == 0 and measure:
+                    self.owner.rtt.sample(time.monotonic() - sent_time)
+                pass
                 break
             except Empty:
-                pass
+                self.metrics.count_timeout()
             pass
         else:
-            print(f"Reached REPEAT_LIMIT on stream {self.id}")
+            tracer.trace(TraceLevel.Error, f"Reached REPEAT_LIMIT on stream {self.id}")
+            tracer.failure()
             self.owner.close()
             exit()
         pass
 
         if expect_type != None and recv.type != expect_type:
-            print("Received unexpected segment, expected type " + expect_type.name)
+            tracer.trace(TraceLevel.Error, "Received unexpected segment, expected type " + expect_type.name)
             self.owner.close()
             exit()
         pass
 
         return recv
 
-    def send_ok(self):
-        self.owner.send(OkMessage(self.id, self.next_message_id))
+    def send_ok(self, version=0):
+        receive_size = Config.RECEIVE_BUFFER_SIZE if version != 0 else 0
+        self.owner.send(OkMessage(self.id, self.next_message_id, version, receive_size))
         try:
             while True:
                 recv = self.receive()
-                self.owner.send(OkMessage(self.id, self.next_message_id))
+                self.owner.send(OkMessage(self.id, self.next_message_id, version, receive_size))
             pass
         except Empty:
             return
         pass
 
     def send_text(self, text: str):
-        for i in range(0, text.__len__(), Config.FRAGMENT_SIZE):
-            subtext = text[i : i + Config.FRAGMENT_SIZE]
+        length = max(1, self.owner.fragment_size() // 4)
+        for i in range(0, text.__len__(), length):
+            subtext = text[i : i + length]
             self.send_message(TextMessage(self.id, self.next_message_id, subtext), expect_type=SegmentType.Next, repeat=Config.FORCE_REPEAT)
 
         self.send_ok()
 
     def send_init(self):
-        self.send_message(InitMessage(self.id, self.next_message_id), expect_type=SegmentType.OK)
+        reply = self.send_message(InitMessage(self.id, self.next_message_id, Config.PROTOCOL_VERSION, Config.RECEIVE_BUFFER_SIZE), expect_type=SegmentType.OK)
+        assert isinstance(reply, OkMessage)
+        self.owner.set_version(max(1, min(reply.version, Config.PROTOCOL_VERSION)), reply.receive_size)
+        self.owner.discover_path()
+
+    def probe(self, size: int):
+        for attempt in range(Config.PROBE_ATTEMPTS):
+            if not self.owner.send_probe(ProbeSegment(self.id, size, bytes(size - self.owner.wire.header_size))):
+                return False
+            pass
+
+            deadline = time.monotonic() + self.owner.rtt.timeout(attempt)
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                pass
+
+                try:
+                    segment = self.receive(remaining)
+                except Empty:
+                    break
+                pass
+
+                if isinstance(segment, ProbeAckSegment) and segment.size == size:
+                    return True
+                pass
+            pass
+        pass
+
+        return False
+
+    def probe_path(self):
+        low = Config.MIN_DATAGRAM_SIZE
+        high = min(self.owner.peer_receive_size, Config.MAX_PROBE_SIZE)
+        candidate = high
+        while high - low > Config.PROBE_PRECISION:
+            if self.probe(candidate):
+                low = candidate
+            else:
+                high = candidate - 1
+            pass
+            candidate = (low + high + 1) // 2
+        pass
+
+        self.owner.max_datagram = low
+        tracer.trace(TraceLevel.Info, f"[MTU] Using datagram size {low}, fragment size {self.owner.fragment_size()}")
 
     def send_ping(self):
         self.send_message(PingMessage(self.id, self.next_message_id), expect_type=SegmentType.OK)
@@ -136,78 +191,127 @@ class Stream:
         time.sleep(0.01)
         self.owner.close()
 
-    def send_file(self, source: str, dest: str):
-        try:
-            self.file = open(source, "rb")
-        except Exception as error:
-            print(f"[FILE] Cannot open file: {error}")
+    def send_file(self, source: str, dest: str, offset=0, length=-1, total=0, delta=False):
+        request = self.prepare_upload(source, dest, offset, length, total, delta)
+        if request == None:
             return
         pass
 
-        size = fstat(self.file.fileno()).st_size
-        reply = self.send_message(FileMessage(self.id, self.next_message_id, dest, size))
+        reply = self.send_message(request, measure=request.delta == 0, patience=delta_timeout(request.size) if request.delta != 0 else 0)
+        if request.delta != 0 and isinstance(reply, FileMessage):
+            reply = self.send_delta(request, reply)
+        pass
 
         if not isinstance(reply, AcceptMessage):
             if isinstance(reply, TextMessage):
-                print(f"[FILE] Cannot send file {reply.text}")
+                tracer.trace(TraceLevel.Error, f"[FILE] Cannot send file {reply.text}")
+                self.close_file()
                 self.send_ok()
                 return
             else:
-                print(f"Received unexpected segment {reply.type.name}")
+                tracer.trace(TraceLevel.Error, f"Received unexpected segment {reply.type.name}")
                 self.owner.close()
                 exit()
             pass
         pass
 
-        next_fragment_id = 0
-        fragment_buffer: dict[int, PendingFragment] = {}
-        send_limit = Config.WINDOW_SIZE
-        reading_finished = False
-        while True:
-            if not reading_finished:
-                while fragment_buffer.__len__() < Config.WINDOW_SIZE and send_limit > 0:
-                    fragment_data = self.file.read(Config.FRAGMENT_SIZE)
-                    if fragment_data.__len__() == 0:
-                        reading_finished = True
-                        break
-                    pass
-
-                    fragment_buffer[next_fragment_id] = PendingFragment(fragment_data)
-                    for _ in range(Config.FORCE_REPEAT):
-                        self.owner.send(DataSegment(self.id, next_fragment_id, fragment_data))
-                    send_limit -= 1
-                    next_fragment_id += 1
-                pass
-            pass
-
-            if fragment_buffer.__len__() == 0:
-                print(f"[FILE] Upload finished, destination: {dest}, size: {size}, fragment count: {next_fragment_id}")
-                self.file.close()
-                self.file = None
+        self.start_upload(reply, dest)
+        if self.owner.version >= 2:
+            fragment_count = self.send_fragments(reply.fec != 0)
+            if fragment_count == None:
+                self.close_file()
                 self.send_ok()
                 return
             pass
+            self.send_message(DoneMessage(self.id, self.next_message_id), expect_type=SegmentType.Next)
+        else:
+            fragment_count = self.send_fragments_in_rounds()
+        pass
+
+        self.finish_upload(request, fragment_count)
+        self.send_ok()
+        self.record_upload(request, fragment_count)
+
+    def send_fragments_in_rounds(self):
+        assert self.file != None
+        sender = RoundSender(self)
+        while True:
+            sender.fill()
+            if sender.finished():
+                return sender.next_fragment_id
+            pass
 
             reply = self.send_message(DoneMessage(self.id, self.next_message_id), expect_type=SegmentType.Next)
-            send_limit = Config.WINDOW_SIZE
             assert isinstance(reply, NextMessage)
-            for confirmed_fragment in reply.fragments:
-                if not confirmed_fragment in fragment_buffer:
-                    continue
-                fragment_buffer.pop(confirmed_fragment)
+            sender.confirm(reply.ranges)
+        pass
+
+    def send_fragments(self, protection=False):
+        assert self.file != None
+        sender = WindowSender(self, protection)
+        while True:
+            delay = sender.transmit()
+            self.owner.flush()
+            if delay == 0 and sender.finished():
+                return sender.finish()
             pass
 
-            for fragment_id in fragment_buffer:
-                fragment = fragment_buffer[fragment_id]
-                fragment.age += 1
-                if fragment.age > Config.FRAGMENT_MAX_AGE and send_limit > 0:
-                    self.owner.send(DataSegment(self.id, fragment_id, fragment.data))
-                    fragment.age = 0
-                    send_limit -= 1
+            try:
+                segment = self.receive(delay if delay > 0 else sender.timeout())
+            except Empty:
+                if delay > 0:
+                    continue
                 pass
+
+                if not sender.expire():
+                    tracer.trace(TraceLevel.Error, f"Reached REPEAT_LIMIT on stream {self.id}")
+                    tracer.failure()
+                    self.owner.close()
+                    exit()
+                pass
+                continue
+            pass
+
+            if isinstance(segment, AckSegment):
+                sender.acknowledge(segment)
+            elif self.refused(segment):
+                return None
             pass
         pass
 
+    def receive_signatures(self, header: FileMessage):
+        signatures = TemporaryFile()
+        self.send_message(self.open_signatures(header, signatures), expect_type=SegmentType.Done, measure=False)
+        self.acknowledging = False
+        self.writer = None
+        return signatures
+
+    def send_delta(self, request: FileMessage, header: FileMessage):
+        assert self.file != None
+        signatures = self.receive_signatures(header)
+        try:
+            encoded = write_delta(self.file, signatures)
+        except (OSError, ValueError) as error:
+            tracer.trace(TraceLevel.Error, f"[FILE] Cannot compute delta: {error}")
+            encoded = None
+        pass
+        signatures.close()
+
+        return self.send_message(self.delta_request(request, encoded))
+
+    def send_signatures(self, segment: FileMessage):
+        signatures = write_signatures(segment.path) if load_resume(segment) == None else None
+        if signatures == None:
+            return replace(segment, delta=0)
+        pass
+
+        self.send_message(self.signature_request(segment, signatures), expect_type=SegmentType.Accept, measure=False)
+        self.send_fragments()
+        self.close_file()
+        reply = self.send_message(DoneMessage(self.id, self.next_message_id), expect_type=SegmentType.File, measure=False, patience=delta_timeout(segment.size))
+        assert isinstance(reply, FileMessage)
+        return reply
+
     def listen(self):
         segment = self.receive_message()
 
@@ -221,79 +325,107 @@ class Stream:
                 elif isinstance(response, TextMessage):
                     text += response.text
                 else:
-                    print(f"Received unexpected segment {response.type.name}")  # type: ignore
+                    tracer.trace(TraceLevel.Error, f"Received unexpected segment {response.type.name}")  # type: ignore
                     self.owner.close()
                     exit()
                 pass
             pass
             print(text)
         elif isinstance(segment, InitMessage):
-            self.send_ok()
+            version = max(1, min(segment.version, Config.PROTOCOL_VERSION))
+            self.owner.set_version(version, segment.receive_size)
+            self.owner.discover_path()
+            self.send_ok(version)
         elif isinstance(segment, PingMessage):
             self.send_ok()
         elif isinstance(segment, FinMessage):
-            print("[SIG] Fin")
+            tracer.trace(TraceLevel.Info, "[SIG] Fin")
             self.send_ok()
             self.owner.close()
         elif isinstance(segment, FileMessage):
-            path = segment.path
-            size = segment.size
-
-            try:
-                self.file = open(path, mode="wb")
-            except Exception as error:
-                error_text = f"Cannot receive file: {error}"
-                print("[FILE]", error_text)
-                self.send_message(TextMessage(self.id, self.next_message_id, error_text), expect_type=SegmentType.OK)
-                return
+            if segment.delta != 0:
+                segment = self.send_signatures(segment)
             pass
+            self.receive_file(segment)
+        pass
 
-            self.fragment_queue = []
-            reply = self.send_message(AcceptMessage(self.id, self.next_message_id))
-            while True:
-                if isinstance(reply, OkMessage):
-                    print(f"[FILE] Download complete, destination: {path}, size: {size}, fragment count: {self.next_fragment}")
-                    self.file.close()
-                    self.file = None
-                    return
-                elif isinstance(reply, DoneMessage):
-                    received_segments = self.received_segments
-                    self.received_segments = []
-                    reply = self.send_message(NextMessage(self.id, self.next_message_id, received_segments))
-                else:
-                    print(f"Received unexpected segment {reply.type.name}")
-                    self.owner.close()
-                    exit()
-                pass
+    def receive_file(self, segment: FileMessage):
+        try:
+            self.file, self.writer = open_download(segment)
+        except Exception as error:
+            error_text = f"Cannot receive file: {error}"
+            tracer.trace(TraceLevel.Error, f"[FILE] {error_text}")
+            self.send_message(TextMessage(self.id, self.next_message_id, error_text), expect_type=SegmentType.OK)
+            return
+        pass
+
+        try:
+            reply = self.send_message(self.accept_download(segment), measure=False)
+            while isinstance(reply, DoneMessage):
+                reply = self.send_message(NextMessage(self.id, self.next_message_id, self.acknowledged_ranges()))
             pass
+        except ValueError as error:
+            rejection = self.reject_download(segment, error)
+            self.close_file()
+            self.send_message(rejection, expect_type=SegmentType.OK)
+            return
+        pass
+
+        if not isinstance(reply, OkMessage):
+            tracer.trace(TraceLevel.Error, f"Received unexpected segment {reply.type.name}")
+            self.owner.close()
+            exit()
+        pass
+
+        self.acknowledging = False
+        if segment.delta != 0:
+            self.complete_delta(segment)
+        else:
+            self.close_file()
+            self.complete_download(segment)
         pass
 
+    def complete_delta(self, segment: FileMessage):
+        assert self.file != None
+        try:
+            size = apply_delta(self.file, segment.path)
+        except (OSError, ValueError) as error:
+            self.close_file()
+            tracer.trace(TraceLevel.Error, f"[FILE] Cannot apply delta: {error}")
+            return
+        pass
+
+        self.close_file()
+        tracer.trace(TraceLevel.Info, f"[FILE] Download complete, destination: {segment.path}, size: {size}, fragment count: {self.next_fragment}, delta size: {segment.size}")
+
     def run(self, method: Callable[[Stream], None]):
         self.action = method
         self.thread.start()
         pass
 
     def __init__(self, owner: ConnectionController, id: int) -> None:
+        super().__init__(owner, id)
         self.owner = owner
-        self.id = id
         self.queue = Queue[Segment | None]()
-        self.next_message_id = 0
         self.action: Callable[[Stream], None] | None = None
-        self.file: BufferedIOBase | None = None
-
-        self.next_fragment = 0
-        self.fragment_queue: list[tuple[int, bytes]] = []
-        self.fragment_count = 0
-        self.received_segments: list[int] = []
+        self.finished = Event()
 
         def start():
             assert self.action != None
-            self.action(self)
+            try:
+                self.action(self)
+            finally:
+                self.close_file()
+                self.finished.set()
+            pass
             self.owner.streams.pop(self.id)
 
             try:
                 while True:
-                    self.receive()
+                    segment = self.receive()
+                    if isinstance(segment, DataSegment):
+                        segment.release()
+                    pass
                 pass
             except Empty:
                 return
@@ -303,19 +435,124 @@ class Stream:
         pass
 
 
-class ConnectionController:
-    def send(self, segment: Segment):
-        print("[-->]", segment.get_printable())
+class ConnectionController(BaseConnection):
+    def send(self, segment: Segment, flush=True):
+        tracer.trace(TraceLevel.Segment, "[-->] {}", segment)
 
-        self.handle.sendto(emit_segment(segment), self.target)
+        data = emit_segment(segment, self.version)
+        self.metrics.segments_sent += 1
+        if self.version < 2 or not Config.COALESCE:
+            self.metrics.datagrams_sent += 1
+            self.metrics.bytes_sent += data.__len__()
+            self.handle.sendto(data, self.target)
+            return
+        pass
+
+        with self.send_lock:
+            if self.pending.__len__() > 0 and self.pending.__len__() + data.__len__() > self.max_datagram:
+                self.transmit(self.pending)
+                self.pending = bytearray()
+            pass
+
+            self.pending += data
+            if flush:
+                self.transmit(self.pending)
+                self.pending = bytearray()
+                self.transmit_batch()
+            pass
+        pass
+
+    def flush(self):
+        with self.send_lock:
+            if self.pending.__len__() > 0:
+                self.transmit(self.pending)
+                self.pending = bytearray()
+            pass
+            self.transmit_batch()
+        pass
+
+    def transmit(self, datagram: bytearray):
+        self.metrics.datagrams_sent += 1
+        self.metrics.bytes_sent += datagram.__len__()
+        if not self.gso:
+            self.handle.sendto(datagram, self.target)
+            return
         pass
 
+        if self.batch_count > 0 and (datagram.__len__() > self.batch_size or self.batch_count >= GSO_MAX_SEGMENTS or self.batch.__len__() + datagram.__len__() > GSO_MAX_BYTES):
+            self.transmit_batch()
+        pass
+
+        if self.batch_count == 0:
+            self.batch_size = datagram.__len__()
+        pass
+
+        self.batch += datagram
+        self.batch_count += 1
+        if datagram.__len__() < self.batch_size:
+            self.transmit_batch()
+        pass
+
+    def transmit_batch(self):
+        if self.batch_count == 0:
+            return
+        pass
+
+        batch = self.batch
+        self.batch = bytearray()
+        count = self.batch_count
+        self.batch_count = 0
+        if count == 1:
+            self.handle.sendto(batch, self.target)
+            return
+        pass
+
+        try:
+            send_segments(self.handle, batch, self.batch_size, self.target)
+        except OSError as error:
+            tracer.trace(TraceLevel.Info, f"[GSO] Segmentation offload unavailable, falling back to plain sends: {error}")
+            self.gso = False
+            for offset in range(0, batch.__len__(), self.batch_size):
+                self.handle.sendto(batch[offset : offset + self.batch_size], self.target)
+            pass
+        pass
+
+    def send_probe(self, segment: ProbeSegment):
+        data = emit_segment(segment, self.version)
+        with self.send_lock:
+            if self.pending.__len__() > 0:
+                self.transmit(self.pending)
+                self.pending = bytearray()
+            pass
+            self.transmit_batch()
+
+            if platform.startswith("linux"):
+                self.handle.setsockopt(IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_PROBE)
+            pass
+
+            try:
+                self.handle.sendto(data, self.target)
+                self.metrics.datagrams_sent += 1
+                self.metrics.bytes_sent += data.__len__()
+            except OSError:
+                return False
+            finally:
+                if platform.startswith("linux"):
+                    self.handle.setsockopt(IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_WANT)
+                pass
+            pass
+        pass
+
+        return True
+
     def close(self):
         if not self.dispose_lock.acquire(blocking=False):
             exit()
         self.open = False
-        print("[SIG] Close")
-        self.handle.close()
+        tracer.trace(TraceLevel.Info, "[SIG] Close")
+        if not self.is_server:
+            self.handle.close()
+        pass
 
     def dispose(self):
         for stream in self.streams.values():
@@ -338,17 +575,38 @@ class ConnectionController:
         self.streams[id] = stream
         return stream
 
-    def request_fin(self):
-        self.next_stream().run(lambda v: v.send_fin())
-        print("[SIG] Sending fin.")
+    def wait_for_stripes(self, streams: list[Stream], finish: Callable[[], None]):
+        def wait():
+            for stream in streams:
+                stream.finished.wait()
+            pass
+            finish()
+
+        Thread(target=wait, daemon=True).start()
 
     def handle_segment(self, segment: Segment):
         self.last_segment_time = time.monotonic() + (Config.PING_INTERVAL * 0.1 * random())
+        self.metrics.segments_received += 1
+        if not isinstance(segment, (PingMessage, OkMessage)):
+            self.last_activity_time = time.monotonic()
+        pass
+
+        if isinstance(segment, ProbeSegment):
+            self.send(ProbeAckSegment(segment.stream, segment.size))
+            return
+        pass
 
         streamID = segment.stream
         stream = self.streams.get(streamID)
 
         if stream == None:
+            if not isinstance(segment, Message):
+                if isinstance(segment, DataSegment):
+                    segment.release()
+                pass
+                return
+            pass
+
             stream = Stream(self, streamID)
             stream.queue.put(segment)
             stream.run(lambda v: v.listen())
@@ -360,6 +618,12 @@ class ConnectionController:
         pass
 
     def tick(self):
+        if self.is_server and self.idle():
+            tracer.trace(TraceLevel.Info, f"[SIG] Idle timeout [{self.target[0]}]:{self.target[1]}")
+            self.close()
+            return
+        pass
+
         time_since_last_segment = time.monotonic() - self.last_segment_time
         if self.keep_alive_state == KeepAliveState.Normal:
             if time_since_last_segment > Config.PING_INTERVAL:
@@ -378,16 +642,14 @@ class ConnectionController:
         pass
 
     def __init__(self, handle: socket, target: tuple[str, int], is_server: bool) -> None:
+        super().__init__(target, is_server)
         self.handle = handle
-        self.is_server = is_server
-        self.target = target
-
-        self.open = True
+        self.send_lock = Lock()
+        self.gso = Config.UDP_GSO and gso_supported(handle)
+        self.batch = bytearray()
+        self.batch_size = 0
+        self.batch_count = 0
         self.streams: dict[int, Stream] = {}
-        self.next_stream_id = 0 if is_server else 1
         self.target_next_stream_id = 1 if is_server else 0
         self.dispose_lock = Semaphore(1)
-
-        self.last_segment_time = time.monotonic()
-        self.keep_alive_state = KeepAliveState.Normal
         pass
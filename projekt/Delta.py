@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import mmap
+import os
+import shutil
+from hashlib import blake2b
+from io import BufferedIOBase
+from math import isqrt
+from struct import Struct
+from tempfile import TemporaryFile, mkstemp
+from zlib import adler32
+
+from config import Config
+
+SIGNATURE_MAGIC = b"UDPSIG01"
+SIGNATURE_HEADER = Struct(">8sQI")
+SIGNATURE = Struct(">I8s")
+DELTA_MAGIC = b"UDPDLT01"
+DELTA_HEADER = Struct(">8sQI")
+COPY = Struct(">II")
+LITERAL = Struct(">I")
+OPERATION_END = 0
+OPERATION_COPY = 1
+OPERATION_LITERAL = 2
+DIGEST_SIZE = 16
+CHUNK_SIZE = 1 << 20
+MODULUS = 65521
+
+
+def block_size(size: int):
+    return min(Config.DELTA_MAX_BLOCK, max(Config.DELTA_MIN_BLOCK, isqrt(size)))
+
+
+def delta_timeout(size: int):
+    return Config.DELTA_TIMEOUT + size / Config.DELTA_MIN_RATE
+
+
+def strong_hash(data: bytes | memoryview):
+    return blake2b(data, digest_size=SIGNATURE.size - 4).digest()
+
+
+def write_signatures(path: str):
+    try:
+        basis = open(path, "rb")
+    except OSError:
+        return None
+    pass
+
+    with basis:
+        size = os.fstat(basis.fileno()).st_size
+        block = block_size(size)
+        if size < block:
+            return None
+        pass
+
+        output = TemporaryFile()
+        output.write(SIGNATURE_HEADER.pack(SIGNATURE_MAGIC, size, block))
+        while True:
+            data = basis.read(block)
+            if data.__len__() < block:
+                break
+            pass
+            output.write(SIGNATURE.pack(adler32(data), strong_hash(data)))
+        pass
+    pass
+
+    output.flush()
+    output.seek(0)
+    return output
+
+
+def read_signatures(signatures: BufferedIOBase):
+    signatures.seek(0)
+    data = signatures.read()
+    if data.__len__() < SIGNATURE_HEADER.size:
+        raise ValueError("Truncated signatures")
+    pass
+
+    magic, _, block = SIGNATURE_HEADER.unpack_from(data)
+    if magic != SIGNATURE_MAGIC or block == 0:
+        raise ValueError("Invalid signatures")
+    pass
+
+    table: dict[int, dict[bytes, int]] = {}
+    for index, (weak, strong) in enumerate(SIGNATURE.iter_unpack(data[SIGNATURE_HEADER.size :])):
+        table.setdefault(weak, {}).setdefault(strong, index)
+    pass
+
+    return block, table
+
+
+class DeltaEncoder:
+    def copy(self, index: int):
+        if self.copy_count > 0 and index == self.copy_start + self.copy_count:
+            self.copy_count += 1
+            return
+        pass
+
+        self.flush_copy()
+        self.copy_start = index
+        self.copy_count = 1
+
+    def flush_copy(self):
+        if self.copy_count > 0:
+            self.output.write(bytes((OPERATION_COPY,)) + COPY.pack(self.copy_start, self.copy_count))
+            self.matched += self.copy_count * self.block
+            self.copy_count = 0
+        pass
+
+    def literal(self, start: int, end: int):
+        if start >= end:
+            return
+        pass
+
+        self.flush_copy()
+        for offset in range(start, end, CHUNK_SIZE):
+            data = self.view[offset : min(end, offset + CHUNK_SIZE)]
+            self.output.write(bytes((OPERATION_LITERAL,)) + LITERAL.pack(data.__len__()))
+            self.output.write(data)
+        pass
+        self.literal_bytes += end - start
+
+    def horizon(self, literal_start: int):
+        allowed = self.budget - self.literal_bytes
+        if self.matched == 0 and self.copy_count == 0:
+            allowed = min(allowed, self.probe)
+        pass
+
+        return literal_start + allowed
+
+    def encode(self):
+        view = self.view
+        block = self.block
+        table = self.table
+        size = view.__len__()
+        position = 0
+        literal_start = 0
+        horizon = self.horizon(literal_start)
+        a = b = -1
+        while position + block <= size:
+            if a < 0:
+                checksum = adler32(view[position : position + block])
+                a = checksum & 0xFFFF
+                b = checksum >> 16
+            pass
+
+            candidates = table.get(b << 16 | a)
+            if candidates != None:
+                index = candidates.get(strong_hash(view[position : position + block]))
+                if index != None:
+                    self.literal(literal_start, position)
+                    self.copy(index)
+                    position += block
+                    literal_start = position
+                    horizon = self.horizon(literal_start)
+                    a = -1
+                    continue
+                pass
+            pass
+
+            if position + block >= size or position > horizon:
+                break
+            pass
+
+            removed = view[position]
+            a = (a - removed + view[position + block]) % MODULUS
+            b = (b + a - 1 - block * removed) % MODULUS
+            position += 1
+        pass
+
+        if size > self.horizon(literal_start):
+            return False
+        pass
+
+        self.literal(literal_start, size)
+        self.flush_copy()
+        self.output.write(bytes((OPERATION_END,)) + blake2b(view, digest_size=DIGEST_SIZE).digest())
+        self.output.flush()
+        return True
+
+    def __init__(self, view: memoryview, block: int, table: dict[int, dict[bytes, int]], output: BufferedIOBase) -> None:
+        self.view = view
+        self.block = block
+        self.table = table
+        self.output = output
+        self.copy_start = 0
+        self.copy_count = 0
+        self.matched = 0
+        self.literal_bytes = 0
+        self.budget = int(view.__len__() * Config.DELTA_MAX_LITERAL)
+        self.probe = Config.DELTA_PROBE_BLOCKS * block
+        pass
+
+
+def write_delta(source: BufferedIOBase, signatures: BufferedIOBase):
+    block, table = read_signatures(signatures)
+    size = os.fstat(source.fileno()).st_size
+    if size == 0 or table.__len__() == 0:
+        return None
+    pass
+
+    output = TemporaryFile()
+    output.write(DELTA_HEADER.pack(DELTA_MAGIC, size, block))
+    with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as map:
+        view = memoryview(map)
+        encoder = DeltaEncoder(view, block, table, output)
+        encoded = encoder.encode()
+        view.release()
+    pass
+
+    if not encoded:
+        output.close()
+        return None
+    pass
+
+    output.seek(0)
+    return output, encoder.literal_bytes
+
+
+def apply_delta(delta: BufferedIOBase, path: str):
+    delta.seek(0)
+    magic, size, block = DELTA_HEADER.unpack(delta.read(DELTA_HEADER.size))
+    if magic != DELTA_MAGIC:
+        raise ValueError("Invalid delta stream")
+    pass
+
+    digest = blake2b(digest_size=DIGEST_SIZE)
+    descriptor, temporary = mkstemp(prefix=os.path.basename(path) + ".", suffix=".delta", dir=os.path.dirname(path) or ".")
+    try:
+        with open(path, "rb") as basis, os.fdopen(descriptor, "wb") as output:
+            while True:
+                operation = delta.read(1)
+                if operation == bytes((OPERATION_END,)):
+                    expected = delta.read(DIGEST_SIZE)
+                    break
+                elif operation == bytes((OPERATION_COPY,)):
+                    index, count = COPY.unpack(delta.read(COPY.size))
+                    basis.seek(index * block)
+                    remaining = count * block
+                    while remaining > 0:
+                        data = basis.read(min(remaining, CHUNK_SIZE))
+                        if data.__len__() == 0:
+                            raise ValueError("Delta references data beyond the destination file")
+                        pass
+                        output.write(data)
+                        digest.update(data)
+                        remaining -= data.__len__()
+                    pass
+                elif operation == bytes((OPERATION_LITERAL,)):
+                    (length,) = LITERAL.unpack(delta.read(LITERAL.size))
+                    data = delta.read(length)
+                    output.write(data)
+                    digest.update(data)
+                else:
+                    raise ValueError("Invalid delta operation")
+                pass
+            pass
+
+            if output.tell() != size or digest.digest() != expected:
+                raise ValueError("Delta verification failed")
+            pass
+        pass
+        shutil.copymode(path, temporary)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+    pass
+
+    return size
@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from struct import Struct
+
+from config import Config
+
+LENGTH = Struct(">H")
+POLYNOMIAL = 0x11D
+
+
+def build_tables():
+    exponents = [0] * 510
+    logarithms = [0] * 256
+    value = 1
+    for power in range(255):
+        exponents[power] = exponents[power + 255] = value
+        logarithms[value] = power
+        value <<= 1
+        if value & 0x100:
+            value ^= POLYNOMIAL
+        pass
+    pass
+
+    return exponents, logarithms
+
+
+EXPONENTS, LOGARITHMS = build_tables()
+tables: dict[int, bytes] = {}
+
+
+def multiply(a: int, b: int):
+    return 0 if a == 0 or b == 0 else EXPONENTS[LOGARITHMS[a] + LOGARITHMS[b]]
+
+
+def inverse(value: int):
+    return EXPONENTS[255 - LOGARITHMS[value]]
+
+
+def coefficient(row: int, column: int):
+    return multiply(255 ^ column, inverse((255 - row) ^ column))
+
+
+def multiplication_table(factor: int):
+    table = tables.get(factor)
+    if table == None:
+        table = bytes(multiply(factor, value) for value in range(256))
+        tables[factor] = table
+    pass
+
+    return table
+
+
+def combine(terms: list[tuple[int, bytes]], length: int):
+    accumulator = 0
+    for factor, symbol in terms:
+        if factor != 0:
+            accumulator ^= int.from_bytes(symbol if factor == 1 else symbol.translate(multiplication_table(factor)), "little")
+        pass
+    pass
+
+    return accumulator.to_bytes(length, "little")
+
+
+def invert(matrix: list[list[int]]):
+    size = matrix.__len__()
+    rows = [row + [1 if column == index else 0 for column in range(size)] for index, row in enumerate(matrix)]
+    for column in range(size):
+        pivot = next(index for index in range(column, size) if rows[index][column] != 0)
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        factor = inverse(rows[column][column])
+        rows[column] = [multiply(factor, value) for value in rows[column]]
+        for index in range(size):
+            if index != column and rows[index][column] != 0:
+                factor = rows[index][column]
+                rows[index] = [value ^ multiply(factor, pivot_value) for value, pivot_value in zip(rows[index], rows[column])]
+            pass
+        pass
+    pass
+
+    return [row[size:] for row in rows]
+
+
+def parity_count(loss: float, count: int):
+    for parities in range(Config.FEC_MAX_PARITY + 1):
+        total = count + parities
+        probability = (1 - loss) ** total
+        recoverable = probability
+        for losses in range(1, parities + 1):
+            probability *= (total - losses + 1) / losses * loss / (1 - loss)
+            recoverable += probability
+        pass
+
+        if 1 - recoverable <= Config.FEC_RESIDUAL:
+            return parities
+        pass
+    pass
+
+    return Config.FEC_MAX_PARITY
+
+
+class ParityEncoder:
+    def add(self, fragment_id: int, data: bytes | memoryview, window: int):
+        output: list[tuple[int, int, int, bytes]] = []
+        if self.symbols.__len__() > 0 and fragment_id != self.first + self.symbols.__len__():
+            output = self.flush()
+        pass
+
+        if self.symbols.__len__() == 0:
+            self.first = fragment_id
+            self.size = max(1, min(Config.FEC_GROUP_SIZE, window))
+            self.parities = parity_count(self.loss, self.size)
+            if self.parities == 0:
+                return output
+            pass
+        pass
+
+        self.symbols.append(LENGTH.pack(data.__len__()) + data)
+        if self.symbols.__len__() >= self.size:
+            output += self.flush()
+        pass
+
+        return output
+
+    def flush(self):
+        symbols = self.symbols
+        self.symbols = []
+        if symbols.__len__() == 0:
+            return []
+        pass
+
+        length = max(symbol.__len__() for symbol in symbols)
+        return [(self.first, row, symbols.__len__(), combine([(coefficient(row, column), symbol) for column, symbol in enumerate(symbols)], length)) for row in range(min(self.parities, symbols.__len__()))]
+
+    def observe(self, delivered: int, lost: int, recovered: int):
+        lost += max(0, recovered - self.recovered)
+        self.recovered = max(self.recovered, recovered)
+        if delivered + lost == 0:
+            return
+        pass
+
+        decay = (1 - Config.FEC_LOSS_GAIN) ** (delivered + lost)
+        self.loss = min(0.5, self.loss * decay + lost / (delivered + lost) * (1 - decay))
+
+    def __init__(self, loss: float) -> None:
+        self.loss = loss
+        self.first = 0
+        self.size = 0
+        self.parities = 0
+        self.recovered = 0
+        self.symbols: list[bytes] = []
+        pass
+
+
+@dataclass
+class ParityGroup:
+    count: int
+    parities: dict[int, bytes] = field(default_factory=dict)
+
+
+class ParityDecoder:
+    def add_data(self, fragment_id: int, data: bytes | bytearray | memoryview, next_fragment: int):
+        self.prune(next_fragment)
+        if fragment_id >= self.floor:
+            self.fragments[fragment_id] = bytes(data)
+        pass
+
+        for first, group in list(self.groups.items()):
+            if first <= fragment_id < first + group.count:
+                return self.recover(first)
+            pass
+        pass
+
+        return []
+
+    def add_parity(self, first: int, index: int, count: int, data: bytes | bytearray | memoryview, next_fragment: int):
+        self.prune(next_fragment)
+        if count == 0 or first + count <= self.floor:
+            return []
+        pass
+
+        group = self.groups.setdefault(first, ParityGroup(count))
+        group.parities[index] = bytes(data)
+        return self.recover(first)
+
+    def recover(self, first: int):
+        group = self.groups[first]
+        members = range(first, first + group.count)
+        missing = [fragment_id for fragment_id in members if fragment_id >= self.floor and fragment_id not in self.fragments]
+        if missing.__len__() == 0:
+            self.groups.pop(first)
+            return []
+        elif missing.__len__() > group.parities.__len__():
+            return []
+        pass
+
+        rows = sorted(group.parities)[: missing.__len__()]
+        length = max(group.parities[row].__len__() for row in rows)
+        syndromes = [combine([(1, group.parities[row])] + [(coefficient(row, fragment_id - first), LENGTH.pack(self.fragments[fragment_id].__len__()) + self.fragments[fragment_id]) for fragment_id in members if fragment_id in self.fragments], length) for row in rows]
+        solution = invert([[coefficient(row, fragment_id - first) for fragment_id in missing] for row in rows])
+        self.groups.pop(first)
+
+        recovered: list[tuple[int, bytes]] = []
+        for fragment_id, factors in zip(missing, solution):
+            symbol = combine(list(zip(factors, syndromes)), length)
+            (size,) = LENGTH.unpack_from(symbol)
+            if size > length - LENGTH.size:
+                continue
+            pass
+
+            self.fragments[fragment_id] = symbol[LENGTH.size : LENGTH.size + size]
+            recovered.append((fragment_id, self.fragments[fragment_id]))
+        pass
+
+        self.recovered += recovered.__len__()
+        return recovered
+
+    def prune(self, next_fragment: int):
+        floor = next_fragment - Config.FEC_GROUP_SIZE
+        if floor <= self.floor:
+            return
+        pass
+
+        if floor - self.floor > self.fragments.__len__():
+            self.fragments = {fragment_id: data for fragment_id, data in self.fragments.items() if fragment_id >= floor}
+        else:
+            for fragment_id in range(self.floor, floor):
+                self.fragments.pop(fragment_id, None)
+            pass
+        pass
+
+        for first in [first for first, group in self.groups.items() if first + group.count <= floor]:
+            self.groups.pop(first)
+        pass
+        self.floor = floor
+
+    def __init__(self) -> None:
+        self.fragments: dict[int, bytes] = {}
+        self.groups: dict[int, ParityGroup] = {}
+        self.floor = 0
+        self.recovered = 0
+        pass
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import mmap
+from io import BufferedIOBase
+
+from config import Config
+
+
+class FileMap:
+    def slice(self, offset: int, length: int):
+        return self.view[offset : offset + length]
+
+    def close(self):
+        self.view.release()
+        try:
+            self.map.close()
+        except BufferError:
+            pass
+        pass
+
+    def __init__(self, file: BufferedIOBase) -> None:
+        self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            self.map.madvise(mmap.MADV_SEQUENTIAL)
+        pass
+        self.view = memoryview(self.map)
+        pass
+
+
+def map_file(file: BufferedIOBase):
+    if not Config.MMAP_SENDER:
+        return None
+    pass
+
+    try:
+        return FileMap(file)
+    except (ValueError, OSError):
+        return None
+    pass
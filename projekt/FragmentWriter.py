@@ -0,0 +1,386 @@
+from __future__ import annotations
+
+import os
+import re
+import time
+from hashlib import blake2b
+from io import BufferedIOBase
+from struct import Struct
+from tempfile import TemporaryFile
+
+from Compression import FrameDecoder, codecs, encoded_bound, select_codec
+from config import Config
+from Segment import FileMessage, to_ranges
+from Striping import open_stripe
+
+RESUME_MAGIC = b"UDPRSM01"
+RESUME_HEADER = Struct(">8sQQQQQ")
+PRESENT = re.compile(rb"[^\x00]")
+ABSENT = re.compile(rb"[^\xff]")
+
+records: dict[str, FragmentWriter] = {}
+
+
+def transfer_identity(status: os.stat_result):
+    digest = blake2b(f"{status.st_dev}:{status.st_ino}:{status.st_size}:{status.st_mtime_ns}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") >> 1 or 1
+
+
+def resume_path(segment: FileMessage):
+    return f"{segment.path}.{segment.offset}{Config.RESUME_SUFFIX}" if segment.total != 0 else segment.path + Config.RESUME_SUFFIX
+
+
+def resume_records(path: str):
+    directory, name = os.path.split(path)
+    pattern = re.compile(re.escape(name) + r"(?:\.(\d+))?" + re.escape(Config.RESUME_SUFFIX))
+    try:
+        entries = set(os.listdir(directory or "."))
+    except OSError:
+        entries = set()
+    pass
+    entries.update(os.path.basename(record_path) for record_path in list(records) if os.path.dirname(record_path) == directory)
+
+    found: list[tuple[str, tuple | None]] = []
+    for entry in entries:
+        match = pattern.fullmatch(entry)
+        if match == None:
+            continue
+        pass
+
+        record_path = os.path.join(directory, entry)
+        writer = records.get(record_path)
+        header = read_header(record_path) if writer == None else (RESUME_MAGIC, writer.identity, writer.offset, writer.size, writer.total, writer.fragment_size)
+        if match.group(1) != None and (header == None or header[4] == 0 or header[2] != int(match.group(1))):
+            continue
+        pass
+
+        found.append((record_path, header))
+    pass
+
+    return found
+
+
+def read_header(path: str):
+    try:
+        with open(path, "rb") as record:
+            data = record.read(RESUME_HEADER.size)
+        pass
+    except OSError:
+        return None
+    pass
+
+    if data.__len__() < RESUME_HEADER.size or data[: RESUME_MAGIC.__len__()] != RESUME_MAGIC:
+        return None
+    pass
+
+    return RESUME_HEADER.unpack(data)
+
+
+def remove_record(path: str):
+    writer = records.get(path)
+    if writer != None:
+        writer.discard()
+        return
+    pass
+
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    pass
+
+
+def discard_records(path: str):
+    for record_path, _ in resume_records(path):
+        remove_record(record_path)
+    pass
+
+
+def discard_stale_records(segment: FileMessage):
+    current = resume_path(segment)
+    for record_path, header in resume_records(segment.path):
+        if record_path != current and (header == None or (header[1], header[4]) != (segment.resume, segment.total)):
+            remove_record(record_path)
+        pass
+    pass
+
+
+def load_resume(segment: FileMessage):
+    path = resume_path(segment)
+    if segment.resume == 0 or segment.fragment_size == 0 or not os.path.exists(segment.path):
+        return None
+    pass
+
+    try:
+        with open(path, "rb") as record:
+            data = record.read()
+        pass
+    except OSError:
+        return None
+    pass
+
+    if data.__len__() < RESUME_HEADER.size:
+        return None
+    pass
+
+    magic, identity, offset, size, total, fragment_size = RESUME_HEADER.unpack_from(data)
+    if magic != RESUME_MAGIC or (identity, offset, size, total, fragment_size) != (segment.resume, segment.offset, segment.size, segment.total, segment.fragment_size):
+        return None
+    pass
+
+    return bytearray(data[RESUME_HEADER.size :])
+
+
+def open_download(segment: FileMessage):
+    bitmap = load_resume(segment) if segment.delta == 0 else None
+    if segment.delta == 0 and bitmap == None:
+        discard_stale_records(segment)
+    pass
+    codec = select_codec(segment.compression) if bitmap == None else 0
+    if segment.delta != 0:
+        file = TemporaryFile()
+    elif segment.total != 0:
+        file = open_stripe(segment.path, segment.offset, segment.total)
+    else:
+        file = open(segment.path, mode="wb" if bitmap == None else "r+b")
+    pass
+
+    writer = FragmentWriter(file, segment.offset, segment.size, segment.fragment_size, codec)
+    if segment.delta == 0 and segment.resume != 0 and writer.fragment_size != 0:
+        writer.record(resume_path(segment), segment.resume, segment.total, bitmap)
+    pass
+
+    return file, writer
+
+
+class FragmentWriter:
+    def received(self, fragment_id: int):
+        if fragment_id < self.next_fragment:
+            return True
+        pass
+
+        if self.fragment_size == 0:
+            return fragment_id in self.pending
+        pass
+
+        return fragment_id < self.fragment_total and self.present(fragment_id)
+
+    def present(self, fragment_id: int):
+        return self.bitmap[fragment_id >> 3] & (1 << (fragment_id & 7)) != 0
+
+    def write(self, fragment_id: int, data: bytes | bytearray | memoryview):
+        if self.received(fragment_id):
+            return False
+        pass
+
+        if self.fragment_size == 0:
+            self.write_sequential(fragment_id, data)
+            return True
+        pass
+
+        if fragment_id >= self.fragment_total:
+            return False
+        pass
+
+        if self.spool == None:
+            os.pwrite(self.descriptor, data, self.offset + fragment_id * self.fragment_size)
+        elif fragment_id == self.next_fragment:
+            self.emit(data)
+        else:
+            os.pwrite(self.spool.fileno(), data, fragment_id * self.fragment_size)
+            if data.__len__() < self.fragment_size:
+                self.short[fragment_id] = data.__len__()
+            pass
+        pass
+        self.bitmap[fragment_id >> 3] |= 1 << (fragment_id & 7)
+        self.end = max(self.end, fragment_id + 1)
+        self.advance()
+
+        if self.record_path != "" and time.monotonic() >= self.next_save and records.get(self.record_path) == self:
+            self.save()
+        pass
+
+        return True
+
+    def write_sequential(self, fragment_id: int, data: bytes | bytearray | memoryview):
+        if fragment_id != self.next_fragment:
+            self.pending[fragment_id] = bytes(data)
+            return
+        pass
+
+        self.emit(data)
+        self.next_fragment += 1
+        while self.next_fragment in self.pending:
+            self.emit(self.pending.pop(self.next_fragment))
+            self.next_fragment += 1
+        pass
+
+    def emit(self, data: bytes | bytearray | memoryview):
+        if self.decoder != None:
+            data = self.decoder.decode(data)
+        pass
+        if self.decoded + data.__len__() > self.size > 0:
+            raise ValueError(f"Decoded data exceeds file size {self.size}")
+        pass
+        self.file.write(data)
+        self.decoded += data.__len__()
+
+    def unspool(self, fragment_id: int):
+        assert self.spool != None
+        return os.pread(self.spool.fileno(), self.short.pop(fragment_id, self.fragment_size), fragment_id * self.fragment_size)
+
+    def advance(self):
+        while self.next_fragment < self.fragment_total and self.present(self.next_fragment):
+            self.next_fragment += 1
+            if self.spool != None and self.next_fragment < self.fragment_total and self.present(self.next_fragment):
+                self.emit(self.unspool(self.next_fragment))
+            pass
+        pass
+
+    def scan(self, fragment_id: int, present: bool):
+        pattern = PRESENT if present else ABSENT
+        while fragment_id < self.end:
+            if fragment_id & 7 == 0:
+                match = pattern.search(self.bitmap, fragment_id >> 3, (self.end + 7) >> 3)
+                if match == None:
+                    return self.end
+                pass
+                fragment_id = match.start() << 3
+            pass
+
+            if self.present(fragment_id) == present:
+                return min(fragment_id, self.end)
+            pass
+            fragment_id += 1
+        pass
+
+        return self.end
+
+    def received_ranges(self, limit: int):
+        ranges = [(0, self.next_fragment)] if self.next_fragment > 0 else []
+        if self.fragment_size == 0:
+            return (ranges + to_ranges(self.pending))[:limit]
+        pass
+
+        fragment_id = self.next_fragment
+        while ranges.__len__() < limit:
+            start = self.scan(fragment_id, True)
+            if start >= self.end:
+                break
+            pass
+
+            fragment_id = self.scan(start, False)
+            ranges.append((start, fragment_id))
+        pass
+
+        return ranges
+
+    def complete(self):
+        if self.spool != None:
+            return self.decoded >= self.size
+        pass
+
+        return self.fragment_size == 0 or self.next_fragment >= self.fragment_total
+
+    def resume_bitmap(self):
+        if self.spool == None:
+            return self.bitmap
+        pass
+
+        total = (self.size + self.fragment_size - 1) // self.fragment_size
+        count = min(self.decoded // self.fragment_size, total)
+        bitmap = bytearray((total + 7) // 8)
+        bitmap[: count >> 3] = b"\xff" * (count >> 3)
+        if count & 7:
+            bitmap[count >> 3] = (1 << (count & 7)) - 1
+        pass
+
+        return bitmap
+
+    def record(self, path: str, identity: int, total: int, bitmap: bytearray | None):
+        self.record_path = path
+        self.identity = identity
+        self.total = total
+        records[path] = self
+        if bitmap != None and bitmap.__len__() == self.bitmap.__len__():
+            self.bitmap = bitmap
+            self.end = min(self.fragment_total, bitmap.rstrip(b"\0").__len__() * 8)
+            self.advance()
+        elif os.path.exists(path):
+            os.remove(path)
+        pass
+
+    def save(self):
+        self.next_save = time.monotonic() + Config.RESUME_SAVE_INTERVAL
+        self.file.flush()
+        os.fdatasync(self.descriptor)
+        temporary = self.record_path + ".tmp"
+        with open(temporary, "wb") as record:
+            record.write(RESUME_HEADER.pack(RESUME_MAGIC, self.identity, self.offset, self.size, self.total, self.fragment_size))
+            record.write(self.resume_bitmap())
+        pass
+        os.replace(temporary, self.record_path)
+
+    def discard(self):
+        if self.record_path != "" and records.get(self.record_path) == self:
+            if os.path.exists(self.record_path):
+                os.remove(self.record_path)
+            pass
+            records.pop(self.record_path)
+        pass
+        self.record_path = ""
+
+    def close(self):
+        if self.record_path != "" and records.get(self.record_path) == self:
+            if self.complete():
+                if os.path.exists(self.record_path):
+                    os.remove(self.record_path)
+                pass
+            else:
+                self.save()
+            pass
+            records.pop(self.record_path)
+        pass
+        self.record_path = ""
+
+        if self.spool != None:
+            self.spool.close()
+            self.spool = None
+        pass
+
+    def preallocate(self):
+        if self.size <= 0:
+            return
+        pass
+
+        try:
+            os.posix_fallocate(self.descriptor, self.offset, self.size)
+        except (AttributeError, OSError):
+            if self.offset == 0:
+                self.file.truncate(self.size)
+            pass
+        pass
+
+    def __init__(self, file: BufferedIOBase, offset: int, size: int, fragment_size: int, codec=0) -> None:
+        self.file = file
+        self.descriptor = file.fileno()
+        self.offset = offset
+        self.size = size
+        self.fragment_size = fragment_size
+        self.fragment_total = ((encoded_bound(size) if codec != 0 else size) + fragment_size - 1) // fragment_size if fragment_size > 0 else 0
+        self.bitmap = bytearray((self.fragment_total + 7) // 8)
+        self.pending: dict[int, bytes] = {}
+        self.codec = codec
+        self.decoder = FrameDecoder(codecs[codec]) if codec != 0 else None
+        self.spool = TemporaryFile() if codec != 0 and fragment_size > 0 else None
+        self.short: dict[int, int] = {}
+        self.decoded = 0
+        self.next_fragment = 0
+        self.end = 0
+        self.record_path = ""
+        self.identity = 0
+        self.total = 0
+        self.next_save = time.monotonic() + Config.RESUME_SAVE_INTERVAL
+        if fragment_size > 0:
+            self.preallocate()
+        pass
@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import heapq
+import random
+import time
+from dataclasses import dataclass, fields, replace
+from select import select
+from socket import AF_INET, SO_RCVBUF, SOCK_DGRAM, SOL_SOCKET, socket
+from threading import Thread
+
+from Trace import TraceLevel, tracer
+
+BUFFER_SIZE = 1 << 22
+SIZE_SUFFIXES = {"K": 1e3, "M": 1e6, "G": 1e9}
+
+
+@dataclass
+class LinkProfile:
+    delay: float = 0.0
+    jitter: float = 0.0
+    loss: float = 0.0
+    burst_enter: float = 0.0
+    burst_exit: float = 1.0
+    burst_loss: float = 1.0
+    reorder: float = 0.0
+    reorder_gap: float = 0.01
+    duplicate: float = 0.0
+    corrupt: float = 0.0
+    rate: float = 0.0
+    queue: int = 0
+
+    def describe(self):
+        values = [f"{item.name}={getattr(self, item.name)}" for item in fields(self) if getattr(self, item.name) != item.default]
+        return ",".join(values) if values.__len__() > 0 else "clean"
+
+
+def parse_value(text: str):
+    text = text.strip().upper()
+    multiplier = 1.0
+    if text[-1:] in SIZE_SUFFIXES:
+        multiplier = SIZE_SUFFIXES[text[-1]]
+        text = text[:-1]
+    pass
+
+    return float(text) * multiplier
+
+
+def parse_profile(text: str, up: LinkProfile | None = None, down: LinkProfile | None = None):
+    up = replace(up) if up != None else LinkProfile()
+    down = replace(down) if down != None else LinkProfile()
+    names = {item.name: item.type for item in fields(LinkProfile)}
+    for item in text.split(","):
+        if item.strip() == "":
+            continue
+        pass
+
+        key, separator, value = item.partition("=")
+        direction, _, name = key.strip().rpartition(":")
+        if separator == "" or name not in names or direction not in ("", "up", "down"):
+            raise ValueError(f"Invalid impairment option {item.strip()!r}")
+        pass
+
+        number = parse_value(value)
+        for profile, selected in ((up, "up"), (down, "down")):
+            if direction in ("", selected):
+                setattr(profile, name, int(number) if names[name] == "int" else number)
+            pass
+        pass
+    pass
+
+    return up, down
+
+
+class Link:
+    def admit(self, size: int, now: float):
+        profile = self.profile
+        if profile.burst_enter > 0:
+            if self.bad:
+                self.bad = self.random.random() >= profile.burst_exit
+            else:
+                self.bad = self.random.random() < profile.burst_enter
+            pass
+        pass
+
+        if self.random.random() < (profile.burst_loss if self.bad else profile.loss):
+            self.dropped += 1
+            return None
+        pass
+
+        departure = now
+        if profile.rate > 0:
+            backlog = max(0.0, self.link_free - now)
+            if profile.queue > 0 and backlog * profile.rate + size > profile.queue:
+                self.queue_dropped += 1
+                return None
+            pass
+            self.link_free = now + backlog + size / profile.rate
+            departure = self.link_free
+        pass
+
+        return departure
+
+    def schedule(self, departure: float):
+        profile = self.profile
+        delay = profile.delay
+        if profile.jitter > 0:
+            delay = max(0.0, delay + self.random.gauss(0, profile.jitter))
+        pass
+
+        if profile.reorder > 0 and self.random.random() < profile.reorder:
+            self.reordered += 1
+            return departure + delay + profile.reorder_gap
+        pass
+
+        self.last_delivery = max(self.last_delivery, departure + delay)
+        return self.last_delivery
+
+    def corrupt(self, data: bytes):
+        if self.profile.corrupt <= 0 or self.random.random() >= self.profile.corrupt or data.__len__() == 0:
+            return data
+        pass
+
+        self.corrupted += 1
+        output = bytearray(data)
+        output[self.random.randrange(output.__len__())] ^= 1 << self.random.randrange(8)
+        return bytes(output)
+
+    def process(self, data: bytes, now: float):
+        self.received += 1
+        departure = self.admit(data.__len__(), now)
+        if departure == None:
+            return []
+        pass
+
+        deliveries = [(self.schedule(departure), self.corrupt(data))]
+        if self.profile.duplicate > 0 and self.random.random() < self.profile.duplicate:
+            self.duplicated += 1
+            deliveries.append((self.schedule(departure), data))
+        pass
+
+        self.forwarded += deliveries.__len__()
+        return deliveries
+
+    def statistics(self):
+        return f"{self.name}: received {self.received} forwarded {self.forwarded} dropped {self.dropped} queue drops {self.queue_dropped} corrupted {self.corrupted} duplicated {self.duplicated} reordered {self.reordered}"
+
+    def __init__(self, name: str, profile: LinkProfile, seed: int) -> None:
+        self.name = name
+        self.profile = profile
+        self.random = random.Random(seed)
+        self.bad = False
+        self.link_free = 0.0
+        self.last_delivery = 0.0
+        self.received = 0
+        self.forwarded = 0
+        self.dropped = 0
+        self.queue_dropped = 0
+        self.corrupted = 0
+        self.duplicated = 0
+        self.reordered = 0
+        pass
+
+
+class ImpairmentProxy:
+    def peer_socket(self, client: tuple[str, int]):
+        handle = self.peers.get(client)
+        if handle == None:
+            handle = socket(AF_INET, SOCK_DGRAM)
+            handle.setsockopt(SOL_SOCKET, SO_RCVBUF, BUFFER_SIZE)
+            handle.bind((self.front.getsockname()[0], 0))
+            self.peers[client] = handle
+            self.clients[handle] = client
+            tracer.trace(TraceLevel.Debug, "[IMP] New client [{}]:{} via port {}", client[0], client[1], handle.getsockname()[1])
+        pass
+
+        return handle
+
+    def enqueue(self, link: Link, data: bytes, handle: socket, destination: tuple[str, int], now: float):
+        for deliver, payload in link.process(data, now):
+            heapq.heappush(self.pending, (deliver, self.sequence, payload, handle, destination))
+            self.sequence += 1
+        pass
+
+    def deliver(self, now: float):
+        while self.pending.__len__() > 0 and self.pending[0][0] <= now:
+            _, _, payload, handle, destination = heapq.heappop(self.pending)
+            try:
+                handle.sendto(payload, destination)
+            except OSError as error:
+                tracer.trace(TraceLevel.Debug, "[IMP] Cannot forward datagram: {}", error)
+            pass
+        pass
+
+    def forward(self):
+        while self.running:
+            now = time.monotonic()
+            self.deliver(now)
+            timeout = min(0.1, max(0.0, self.pending[0][0] - now)) if self.pending.__len__() > 0 else 0.1
+            readable, _, _ = select([self.front, *self.clients], [], [], timeout)
+            now = time.monotonic()
+            for handle in readable:
+                try:
+                    data, addr = handle.recvfrom(65535)
+                except OSError:
+                    continue
+                pass
+
+                if handle == self.front:
+                    self.enqueue(self.up, data, self.peer_socket(addr), self.target, now)
+                else:
+                    self.enqueue(self.down, data, self.front, self.clients[handle], now)
+                pass
+            pass
+        pass
+
+    def configure(self, text: str):
+        up, down = parse_profile(text, self.up.profile, self.down.profile)
+        self.up.profile = up
+        self.down.profile = down
+        tracer.trace(TraceLevel.Info, "[IMP] Up {}, down {}", up.describe(), down.describe())
+
+    def statistics(self):
+        return f"[IMP] {self.up.statistics()}\n[IMP] {self.down.statistics()}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thread.is_alive():
+            self.thread.join()
+        pass
+
+        for handle in [self.front, *self.clients]:
+            handle.close()
+        pass
+
+    def __init__(self, target: tuple[str, int], profile="", seed=1, listen: tuple[str, int] = ("127.0.0.1", 0)) -> None:
+        self.target = target
+        up, down = parse_profile(profile)
+        self.up = Link("up", up, seed * 2)
+        self.down = Link("down", down, seed * 2 + 1)
+        self.front = socket(AF_INET, SOCK_DGRAM)
+        self.front.setsockopt(SOL_SOCKET, SO_RCVBUF, BUFFER_SIZE)
+        self.front.bind(listen)
+        self.address: tuple[str, int] = self.front.getsockname()
+        self.port = self.address[1]
+        self.peers: dict[tuple[str, int], socket] = {}
+        self.clients: dict[socket, tuple[str, int]] = {}
+        self.pending: list[tuple[float, int, bytes, socket, tuple[str, int]]] = []
+        self.sequence = 0
+        self.running = True
+        self.thread = Thread(target=self.forward, daemon=True)
+        pass
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import json
+import time
+from dataclasses import dataclass, field, fields
+from typing import Any
+
+PROMETHEUS_PREFIX = "udp_communicator"
+
+
+@dataclass
+class ConnectionMetrics:
+    bytes_sent: int = 0
+    datagrams_sent: int = 0
+    segments_sent: int = 0
+    bytes_received: int = 0
+    datagrams_received: int = 0
+    segments_received: int = 0
+    bytes_delivered: int = 0
+    retransmissions: int = 0
+    parity_sent: int = 0
+    recovered: int = 0
+    timeouts: int = 0
+    crc_failures: int = 0
+    malformed: int = 0
+    out_of_order: int = 0
+    window: int = 0
+    started: float = field(default_factory=time.monotonic, repr=False)
+
+    def goodput(self):
+        elapsed = time.monotonic() - self.started
+        return self.bytes_delivered / elapsed if elapsed > 0 else 0.0
+
+
+@dataclass
+class StreamMetrics:
+    connection: ConnectionMetrics = field(repr=False)
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    bytes_acknowledged: int = 0
+    fragments_sent: int = 0
+    retransmissions: int = 0
+    parity_sent: int = 0
+    recovered: int = 0
+    out_of_order: int = 0
+    timeouts: int = 0
+    window: int = 0
+    started: float = field(default_factory=time.monotonic, repr=False)
+
+    def goodput(self):
+        elapsed = time.monotonic() - self.started
+        return (self.bytes_acknowledged + self.bytes_received) / elapsed if elapsed > 0 else 0.0
+
+    def count_sent(self, size: int, retransmission=False):
+        self.bytes_sent += size
+        self.fragments_sent += 1
+        if retransmission:
+            self.retransmissions += 1
+            self.connection.retransmissions += 1
+        pass
+
+    def count_parity(self, size: int):
+        self.bytes_sent += size
+        self.parity_sent += 1
+        self.connection.parity_sent += 1
+
+    def count_recovered(self, size: int):
+        self.count_received(size)
+        self.recovered += 1
+        self.connection.recovered += 1
+
+    def count_acknowledged(self, size: int):
+        self.bytes_acknowledged += size
+        self.connection.bytes_delivered += size
+
+    def count_received(self, size: int):
+        self.bytes_received += size
+        self.connection.bytes_delivered += size
+
+    def count_out_of_order(self):
+        self.out_of_order += 1
+        self.connection.out_of_order += 1
+
+    def count_timeout(self):
+        self.timeouts += 1
+        self.connection.timeouts += 1
+
+    def set_window(self, window: int):
+        self.window = window
+        self.connection.window = window
+
+
+counters = {"bytes_sent", "datagrams_sent", "segments_sent", "bytes_received", "datagrams_received", "segments_received", "bytes_delivered", "bytes_acknowledged", "fragments_sent", "retransmissions", "parity_sent", "recovered", "timeouts", "crc_failures", "malformed", "out_of_order"}
+
+
+def metric_values(metrics: StreamMetrics | ConnectionMetrics):
+    values: dict[str, Any] = {metric.name: getattr(metrics, metric.name) for metric in fields(metrics) if metric.repr}
+    values["goodput"] = metrics.goodput()
+    return values
+
+
+def snapshot(connection: Any):
+    values = metric_values(connection.metrics)
+    values["peer"] = f"{connection.target[0]}:{connection.target[1]}"
+    values["version"] = connection.version
+    values["datagram_size"] = connection.max_datagram
+    values["srtt"] = connection.rtt.srtt if connection.rtt.srtt != None else 0.0
+    values["rto"] = connection.rtt.rto
+    values["streams"] = {str(id): metric_values(stream.metrics) for id, stream in list(connection.streams.items())}
+    return values
+
+
+def format_text(snapshots: list[dict[str, Any]]):
+    lines: list[str] = []
+    for values in snapshots:
+        lines.append(f"[STATS] {values['peer']} v{values['version']} datagram {values['datagram_size']} srtt {values['srtt'] * 1000:.2f} ms rto {values['rto'] * 1000:.0f} ms window {values['window']} goodput {values['goodput'] / 1e6:.2f} MB/s")
+        lines.append(f"[STATS]   sent {values['bytes_sent']} B / {values['datagrams_sent']} datagrams / {values['segments_sent']} segments, received {values['bytes_received']} B / {values['datagrams_received']} datagrams / {values['segments_received']} segments")
+        lines.append(f"[STATS]   retransmissions {values['retransmissions']} parity {values['parity_sent']} recovered {values['recovered']} timeouts {values['timeouts']} crc failures {values['crc_failures']} malformed {values['malformed']} out of order {values['out_of_order']}")
+        for id, stream in values["streams"].items():
+            lines.append(f"[STATS]   stream {id}: sent {stream['bytes_sent']} B acknowledged {stream['bytes_acknowledged']} B received {stream['bytes_received']} B retransmissions {stream['retransmissions']} window {stream['window']} goodput {stream['goodput'] / 1e6:.2f} MB/s")
+        pass
+    pass
+
+    if lines.__len__() == 0:
+        lines.append("[STATS] No connections")
+    pass
+
+    return "\n".join(lines)
+
+
+def format_json(snapshots: list[dict[str, Any]]):
+    return json.dumps({"time": time.time(), "connections": snapshots}, indent=2)
+
+
+def format_prometheus(snapshots: list[dict[str, Any]]):
+    samples: dict[str, list[str]] = {}
+    for values in snapshots:
+        peer = values["peer"]
+        for key, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                samples.setdefault(key, []).append(f'{{peer="{peer}"}} {value}')
+            pass
+        pass
+
+        for id, stream in values["streams"].items():
+            for key, value in stream.items():
+                samples.setdefault(f"stream_{key}", []).append(f'{{peer="{peer}",stream="{id}"}} {value}')
+            pass
+        pass
+    pass
+
+    lines: list[str] = []
+    for key, entries in samples.items():
+        name = f"{PROMETHEUS_PREFIX}_{key}" + ("_total" if key.removeprefix("stream_") in counters else "")
+        lines.append(f"# TYPE {name} {'counter' if key.removeprefix('stream_') in counters else 'gauge'}")
+        for entry in entries:
+            lines.append(name + entry)
+        pass
+    pass
+
+    return "\n".join(lines) + "\n"
+
+
+formatters = {
+    "text": format_text,
+    "json": format_json,
+    "prometheus": format_prometheus,
+}
+
+
+def export(snapshots: list[dict[str, Any]], format: str, path: str):
+    with open(path, "w") as output:
+        output.write(formatters[format](snapshots))
+    pass
@@ -0,0 +1,55 @@
+from socket import CMSG_SPACE, socket
+from struct import Struct
+from sys import platform
+
+SOL_UDP = 17
+UDP_SEGMENT = 103
+UDP_GRO = 104
+GSO_MAX_SEGMENTS = 64
+GSO_MAX_BYTES = 65000
+SEGMENT_SIZE = Struct("=H")
+GRO_SIZE = Struct("=i")
+
+
+def gso_supported(handle: socket):
+    if not platform.startswith("linux"):
+        return False
+    pass
+
+    try:
+        handle.getsockopt(SOL_UDP, UDP_SEGMENT)
+    except OSError:
+        return False
+    pass
+
+    return True
+
+
+def enable_gro(handle: socket):
+    if not platform.startswith("linux"):
+        return False
+    pass
+
+    try:
+        handle.setsockopt(SOL_UDP, UDP_GRO, 1)
+    except OSError:
+        return False
+    pass
+
+    return True
+
+
+def send_segments(handle: socket, data: bytearray, segment_size: int, target: tuple[str, int]):
+    handle.sendmsg([data], [(SOL_UDP, UDP_SEGMENT, SEGMENT_SIZE.pack(segment_size))], 0, target)
+
+
+def receive_segments(handle: socket, buffer: bytearray):
+    size, ancdata, _, addr = handle.recvmsg_into([buffer], CMSG_SPACE(GRO_SIZE.size))
+    segment_size = size
+    for level, type, data in ancdata:
+        if level == SOL_UDP and type == UDP_GRO and data.__len__() >= GRO_SIZE.size:
+            segment_size = GRO_SIZE.unpack_from(data)[0]
+        pass
+    pass
+
+    return size, max(1, segment_size), addr
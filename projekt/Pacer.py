@@ -0,0 +1,36 @@
+import time
+
+from config import Config
+
+
+class Pacer:
+    def interval(self, window: int, rtt: float | None, size: int):
+        interval = 0.0
+        if rtt != None and window > 0:
+            interval = rtt / (window * Config.PACING_GAIN)
+        pass
+
+        if Config.PACING_RATE > 0:
+            interval = max(interval, size / Config.PACING_RATE)
+        pass
+
+        return interval
+
+    def delay(self, window: int, rtt: float | None, size: int):
+        interval = self.interval(window, rtt, size)
+        if interval <= 0:
+            return 0.0
+        pass
+
+        now = time.monotonic()
+        if self.release < now - Config.PACING_QUANTUM:
+            self.release = now
+        pass
+        self.release += interval
+
+        delay = self.release - now
+        return delay if delay > Config.PACING_QUANTUM else 0.0
+
+    def __init__(self) -> None:
+        self.release = time.monotonic()
+        pass
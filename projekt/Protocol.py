@@ -0,0 +1,676 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass, replace
+from enum import Enum
+from io import BufferedIOBase
+from os import fstat, stat
+from typing import Any, Callable
+
+from Compression import FrameEncoder, codecs, offered_codecs, worth_compressing
+from config import Config
+from CongestionControl import create_congestion_controller
+from FEC import ParityDecoder, ParityEncoder
+from FileMap import FileMap, map_file
+from FragmentWriter import FragmentWriter, discard_records, transfer_identity
+from Metrics import ConnectionMetrics, StreamMetrics
+from Pacer import Pacer
+from RttEstimator import RttEstimator, timestamp
+from Segment import ACCEPT_OPTIONS, RANGE, RECOVERED, TIMESTAMP, AcceptMessage, AckSegment, DataSegment, FileMessage, ParitySegment, Segment, TextMessage, formats, merge_ranges, to_ranges
+from Striping import StripePlanner, StripeTracker, split
+from Trace import TraceLevel, tracer
+
+
+IP_MTU_DISCOVER = 10
+IP_PMTUDISC_WANT = 1
+IP_PMTUDISC_PROBE = 3
+
+
+class KeepAliveState(Enum):
+    Normal = 0
+    Notified = 1
+    Terminating = 2
+
+
+@dataclass
+class PendingFragment:
+    data: bytes | memoryview
+    age: int = 0
+    sequence: int = 0
+    transmissions: int = 0
+
+
+def confirm_fragments(fragment_buffer: dict[int, PendingFragment], ranges: list[tuple[int, int]]):
+    confirmed: list[PendingFragment] = []
+    for start, end in ranges:
+        if end - start > fragment_buffer.__len__():
+            confirmed_fragments = [fragment_id for fragment_id in fragment_buffer if start <= fragment_id < end]
+        else:
+            confirmed_fragments = range(start, end)
+        pass
+
+        for confirmed_fragment in confirmed_fragments:
+            fragment = fragment_buffer.pop(confirmed_fragment, None)
+            if fragment != None:
+                confirmed.append(fragment)
+            pass
+        pass
+    pass
+
+    return confirmed
+
+
+class RoundSender:
+    def fill(self):
+        while not self.reading_finished and self.fragment_buffer.__len__() < Config.WINDOW_SIZE and self.send_limit > 0:
+            fragment_data = self.stream.read_fragment()
+            if fragment_data.__len__() == 0:
+                self.reading_finished = True
+                break
+            pass
+
+            fragment = PendingFragment(fragment_data)
+            self.fragment_buffer[self.next_fragment_id] = fragment
+            for _ in range(Config.FORCE_REPEAT):
+                self.send_fragment(self.next_fragment_id, fragment)
+            self.send_limit -= 1
+            self.next_fragment_id += 1
+        pass
+
+    def send_fragment(self, fragment_id: int, fragment: PendingFragment):
+        self.owner.send(DataSegment(self.stream.id, fragment_id, fragment.data), flush=False)
+        self.metrics.count_sent(fragment.data.__len__(), fragment.transmissions > 0)
+        fragment.transmissions += 1
+
+    def confirm(self, ranges: list[tuple[int, int]]):
+        self.send_limit = Config.WINDOW_SIZE
+        self.metrics.count_acknowledged(sum(fragment.data.__len__() for fragment in confirm_fragments(self.fragment_buffer, ranges)))
+
+        for fragment_id, fragment in self.fragment_buffer.items():
+            fragment.age += 1
+            if fragment.age > Config.FRAGMENT_MAX_AGE and self.send_limit > 0:
+                self.send_fragment(fragment_id, fragment)
+                fragment.age = 0
+                self.send_limit -= 1
+            pass
+        pass
+
+    def finished(self):
+        return self.fragment_buffer.__len__() == 0
+
+    def __init__(self, stream: BaseStream) -> None:
+        self.stream = stream
+        self.owner = stream.owner
+        self.metrics = stream.metrics
+        self.next_fragment_id = 0
+        self.fragment_buffer: dict[int, PendingFragment] = {}
+        self.send_limit = Config.WINDOW_SIZE
+        self.reading_finished = False
+        pass
+
+
+class WindowSender:
+    def pace(self, size: int):
+        if self.pacer == None:
+            return 0.0
+        pass
+
+        if self.release == 0:
+            delay = self.pacer.delay(self.congestion.limit(), self.owner.rtt.min_rtt, size)
+            if delay <= 0:
+                return 0.0
+            pass
+            self.release = time.monotonic() + delay
+        pass
+
+        return max(0.0, self.release - time.monotonic())
+
+    def stage(self):
+        if self.reading_finished or self.fragment_buffer.__len__() >= self.congestion.limit():
+            return False
+        pass
+
+        if self.staged == None:
+            self.next_fragment_id = self.stream.skip_received(self.next_fragment_id)
+            self.staged = self.stream.read_fragment()
+        pass
+
+        if self.staged.__len__() == 0:
+            self.staged = None
+            self.reading_finished = True
+            if self.parity != None:
+                self.parities += self.parity.flush()
+            pass
+            return False
+        pass
+
+        return True
+
+    def transmit(self):
+        while True:
+            if self.parities.__len__() > 0:
+                self.send_parity(*self.parities.pop(0))
+            elif self.lost.__len__() > 0:
+                fragment = self.fragment_buffer.get(self.lost[0])
+                if fragment == None:
+                    self.lost.pop(0)
+                    continue
+                pass
+
+                delay = self.pace(fragment.data.__len__())
+                if delay > 0:
+                    return delay
+                pass
+
+                self.sequence += 1
+                fragment.sequence = self.sequence
+                fragment.transmissions += 1
+                self.send_fragment(self.lost.pop(0), fragment.data, True)
+            elif self.stage():
+                assert self.staged != None
+                delay = self.pace(self.staged.__len__())
+                if delay > 0:
+                    return delay
+                pass
+
+                self.sequence += 1
+                self.fragment_buffer[self.next_fragment_id] = PendingFragment(self.staged, sequence=self.sequence)
+                for repeat in range(1 + Config.FORCE_REPEAT):
+                    self.send_fragment(self.next_fragment_id, self.staged, repeat > 0)
+                pass
+
+                if self.parity != None:
+                    self.parities += self.parity.add(self.next_fragment_id, self.staged, self.congestion.limit())
+                pass
+                self.next_fragment_id += 1
+                self.staged = None
+            elif self.parities.__len__() == 0:
+                return 0.0
+            pass
+        pass
+
+    def send_fragment(self, fragment_id: int, data: bytes | memoryview, retransmission: bool):
+        self.release = 0.0
+        self.owner.send(DataSegment(self.stream.id, fragment_id, data, timestamp()), flush=False)
+        self.metrics.count_sent(data.__len__(), retransmission)
+
+    def send_parity(self, first: int, index: int, count: int, data: bytes):
+        self.sequence += 1
+        self.owner.send(ParitySegment(self.stream.id, first, index, count, data), flush=False)
+        self.metrics.count_parity(data.__len__())
+        for fragment_id in range(first, first + count):
+            fragment = self.fragment_buffer.get(fragment_id)
+            if fragment != None and fragment.sequence != 0:
+                fragment.sequence = self.sequence
+            pass
+        pass
+
+    def timeout(self):
+        if self.deadline == 0:
+            self.deadline = time.monotonic() + self.owner.rtt.timeout(self.timeouts)
+        pass
+
+        return max(0.0, self.deadline - time.monotonic())
+
+    def expire(self):
+        self.deadline = 0.0
+        self.timeouts += 1
+        self.metrics.count_timeout()
+        if self.timeouts >= Config.REPEAT_LIMIT:
+            return False
+        pass
+
+        self.congestion.on_timeout(self.sequence)
+        self.metrics.set_window(self.congestion.limit())
+        pending = list(self.fragment_buffer.items())
+        for fragment_id, fragment in pending[: self.congestion.limit()]:
+            self.sequence += 1
+            fragment.sequence = self.sequence
+            fragment.transmissions += 1
+            self.owner.send(DataSegment(self.stream.id, fragment_id, fragment.data, timestamp()), flush=False)
+            self.metrics.count_sent(fragment.data.__len__(), True)
+        pass
+        self.lost = [fragment_id for fragment_id, fragment in pending[self.congestion.limit() :] if fragment.sequence == 0]
+
+        return True
+
+    def acknowledge(self, segment: AckSegment):
+        self.deadline = 0.0
+        self.owner.rtt.echo(segment.echo)
+
+        confirmed_fragments = confirm_fragments(self.fragment_buffer, segment.ranges)
+        for confirmed in confirmed_fragments:
+            self.timeouts = 0
+            if confirmed.transmissions == 0:
+                self.acknowledged_sequence = max(self.acknowledged_sequence, confirmed.sequence)
+            pass
+        pass
+        self.congestion.on_ack(confirmed_fragments.__len__())
+        self.metrics.count_acknowledged(sum(fragment.data.__len__() for fragment in confirmed_fragments))
+
+        lost = 0
+        for fragment_id, fragment in self.fragment_buffer.items():
+            if fragment.sequence != 0 and fragment.sequence + Config.REORDER_THRESHOLD <= self.acknowledged_sequence:
+                self.congestion.on_loss(fragment.sequence, self.sequence)
+                lost += 1
+                fragment.sequence = 0
+                self.lost.append(fragment_id)
+            pass
+        pass
+        self.metrics.set_window(self.congestion.limit())
+
+        if self.parity != None:
+            self.parity.observe(confirmed_fragments.__len__(), lost, segment.recovered)
+        pass
+
+    def finished(self):
+        return self.reading_finished and self.fragment_buffer.__len__() == 0
+
+    def finish(self):
+        if self.parity != None:
+            tracer.trace(TraceLevel.Debug, f"[FEC] Sent {self.metrics.parity_sent} parity fragments on stream {self.stream.id}, loss estimate: {self.parity.loss:.3f}")
+            self.owner.loss = self.parity.loss
+        pass
+
+        return self.next_fragment_id
+
+    def __init__(self, stream: BaseStream, protection: bool) -> None:
+        self.stream = stream
+        self.owner = stream.owner
+        self.metrics = stream.metrics
+        self.next_fragment_id = 0
+        self.fragment_buffer: dict[int, PendingFragment] = {}
+        self.staged: bytes | memoryview | None = None
+        self.lost: list[int] = []
+        self.parities: list[tuple[int, int, int, bytes]] = []
+        self.reading_finished = False
+        self.sequence = 0
+        self.acknowledged_sequence = 0
+        self.timeouts = 0
+        self.deadline = 0.0
+        self.release = 0.0
+        self.congestion = create_congestion_controller()
+        self.pacer = Pacer() if Config.PACING else None
+        self.parity = ParityEncoder(self.owner.loss) if protection else None
+        pass
+
+
+class BaseStream:
+    def read_fragment(self):
+        if self.encoder != None:
+            return self.encoder.read(self.fragment_length)
+        pass
+
+        return self.read_source(self.fragment_length)
+
+    def read_source(self, length: int):
+        assert self.file != None
+        length = min(length, self.remaining)
+        fragment_data = self.map.slice(self.position, length) if self.map != None else self.file.read(length)
+        self.position += fragment_data.__len__()
+        self.remaining -= fragment_data.__len__()
+        return fragment_data
+
+    def skip_received(self, fragment_id: int):
+        while self.resumed.__len__() > 0 and fragment_id >= self.resumed[0][0]:
+            start, end = self.resumed.pop(0)
+            if fragment_id < end:
+                skipped = min(self.remaining, (end - fragment_id) * self.fragment_length)
+                self.position += skipped
+                self.remaining -= skipped
+                if self.map == None and self.file != None:
+                    self.file.seek(self.position)
+                pass
+                fragment_id = end
+            pass
+        pass
+
+        return fragment_id
+
+    def close_file(self):
+        if self.writer != None:
+            self.writer.close()
+            self.writer = None
+        pass
+        self.parity = None
+
+        if self.map != None:
+            self.map.close()
+            self.map = None
+        pass
+
+        if self.file != None:
+            self.file.close()
+            self.file = None
+        pass
+
+    def accept_fragment(self, segment: DataSegment, written: bool):
+        assert self.writer != None
+        if self.owner.version < 2:
+            self.received_segments.append(segment.fragment_id)
+        pass
+        self.echo = segment.timestamp
+
+        if not written:
+            tracer.trace(TraceLevel.Debug, "[ORD] Received fragment out of order {}", segment)
+            self.metrics.count_out_of_order()
+            if self.acknowledging:
+                self.send_ack()
+            pass
+            return []
+        pass
+
+        self.metrics.count_received(segment.data.__len__())
+        if segment.fragment_id == self.next_fragment:
+            self.unacknowledged += 1
+        else:
+            self.unacknowledged = Config.ACK_FREQUENCY
+        pass
+        self.next_fragment = self.writer.next_fragment
+
+        if self.parity == None:
+            return []
+        pass
+
+        return self.parity.add_data(segment.fragment_id, segment.data, self.next_fragment)
+
+    def accept_recovered(self, fragment_id: int, data: bytes, written: bool):
+        assert self.writer != None
+        if written:
+            tracer.trace(TraceLevel.Debug, f"[FEC] Recovered fragment {fragment_id} on stream {self.id}")
+            self.metrics.count_recovered(data.__len__())
+            self.unacknowledged = Config.ACK_FREQUENCY
+        pass
+        self.next_fragment = self.writer.next_fragment
+
+    def acknowledge(self):
+        if not self.acknowledging or self.unacknowledged == 0:
+            return
+        pass
+
+        if self.unacknowledged >= Config.ACK_FREQUENCY:
+            self.send_ack()
+        else:
+            self.delay_ack()
+        pass
+
+    def delay_ack(self):
+        pass
+
+    def send_ack(self):
+        self.unacknowledged = 0
+        self.owner.send(AckSegment(self.id, self.acknowledged_ranges(), self.echo, self.parity.recovered if self.parity != None else 0))
+
+    def acknowledged_ranges(self):
+        if self.owner.version < 2:
+            ranges = to_ranges(self.received_segments)
+            self.received_segments = []
+            return ranges
+        pass
+
+        if self.writer == None:
+            return [(0, self.next_fragment)] if self.next_fragment > 0 else []
+        pass
+
+        return self.writer.received_ranges((self.owner.max_datagram - self.owner.wire.header_size - RECOVERED.size) // RANGE.size)
+
+    def prepare_upload(self, source: str, dest: str, offset: int, length: int, total: int, delta: bool):
+        try:
+            self.file = open(source, "rb")
+        except Exception as error:
+            tracer.trace(TraceLevel.Error, f"[FILE] Cannot open file: {error}")
+            return None
+        pass
+
+        status = fstat(self.file.fileno())
+        size = status.st_size if length < 0 else length
+        self.file.seek(offset)
+        self.map = map_file(self.file)
+        self.position = offset
+        self.remaining = size
+        self.started = time.monotonic()
+        fragment_size = self.owner.fragment_size()
+        self.fragment_length = fragment_size
+        if (size + fragment_size - 1) // fragment_size > self.owner.wire.id_mask + 1:
+            tracer.trace(TraceLevel.Error, f"[FILE] File is too large for protocol version {self.owner.version}, size: {size}")
+            self.close_file()
+            return None
+        pass
+
+        identity = transfer_identity(status) if Config.RESUME else 0
+        delta = delta and self.owner.version >= 2 and total == 0
+        compression = offered_codecs() if self.owner.version >= 2 and worth_compressing(self.file.fileno(), offset, size, self.owner.planner.throughput.get(1, 0.0)) else 0
+        fec = 1 if self.owner.version >= 2 and Config.FEC else 0
+        return FileMessage(self.id, self.next_message_id, dest, size, offset, total, fragment_size, identity, 1 if delta else 0, compression, fec)
+
+    def delta_request(self, request: FileMessage, encoded: tuple[BufferedIOBase, int] | None):
+        if encoded == None:
+            tracer.trace(TraceLevel.Info, f"[FILE] Destination differs too much for a delta, sending whole file, destination: {request.path}")
+            return replace(request, id=self.next_message_id, delta=0)
+        pass
+
+        self.close_file()
+        self.file, literal = encoded
+        self.map = map_file(self.file)
+        self.position = 0
+        self.remaining = fstat(self.file.fileno()).st_size
+        tracer.trace(TraceLevel.Info, f"[FILE] Sending delta, destination: {request.path}, size: {request.size}, delta size: {self.remaining}, literal bytes: {literal}")
+        return replace(request, id=self.next_message_id, size=self.remaining, resume=0)
+
+    def start_upload(self, reply: AcceptMessage, dest: str):
+        self.resumed = merge_ranges(reply.ranges)
+        if self.resumed.__len__() > 0:
+            tracer.trace(TraceLevel.Info, f"[FILE] Resuming upload, destination: {dest}, fragments already received: {sum(end - start for start, end in self.resumed)}")
+        pass
+
+        if reply.codec != 0:
+            self.encoder = FrameEncoder(codecs[reply.codec], self.read_source)
+            tracer.trace(TraceLevel.Debug, f"[FILE] Compressing upload with {self.encoder.codec.name}, destination: {dest}")
+        pass
+
+    def refused(self, segment: Segment):
+        if not isinstance(segment, TextMessage) or segment.id != self.next_message_id:
+            return False
+        pass
+
+        self.next_message_id = (segment.id + 1) & self.owner.wire.id_mask
+        tracer.trace(TraceLevel.Error, f"[FILE] Cannot send file {segment.text}")
+        return True
+
+    def finish_upload(self, request: FileMessage, fragment_count: int):
+        if self.encoder != None:
+            tracer.trace(TraceLevel.Info, f"[FILE] Compressed {self.encoder.raw} bytes to {self.encoder.encoded} bytes with {self.encoder.codec.name}, destination: {request.path}")
+        pass
+
+        if request.total == 0:
+            tracer.trace(TraceLevel.Info, f"[FILE] Upload finished, destination: {request.path}, size: {request.size}, fragment count: {fragment_count}")
+        else:
+            tracer.trace(TraceLevel.Debug, f"[FILE] Stripe uploaded, destination: {request.path}, offset: {request.offset}, size: {request.size}, fragment count: {fragment_count}")
+        pass
+        self.close_file()
+
+    def record_upload(self, request: FileMessage, fragment_count: int):
+        self.uploaded = fragment_count
+        if request.total == 0 and self.encoder == None:
+            self.owner.planner.observe(1, request.size, time.monotonic() - self.started)
+        pass
+
+    def signature_request(self, segment: FileMessage, signatures: BufferedIOBase):
+        self.file = signatures
+        self.map = map_file(signatures)
+        self.position = 0
+        self.remaining = fstat(signatures.fileno()).st_size
+        self.fragment_length = self.owner.fragment_size()
+        tracer.trace(TraceLevel.Debug, f"[FILE] Sending signatures, destination: {segment.path}, size: {self.remaining}")
+        return FileMessage(self.id, self.next_message_id, segment.path, self.remaining, fragment_size=self.fragment_length)
+
+    def open_signatures(self, header: FileMessage, signatures: BufferedIOBase):
+        self.writer = FragmentWriter(signatures, 0, header.size, header.fragment_size)
+        self.next_fragment = 0
+        self.acknowledging = True
+        return AcceptMessage(self.id, self.next_message_id)
+
+    def accept_download(self, segment: FileMessage):
+        assert self.writer != None
+        self.next_fragment = self.writer.next_fragment
+        resumed = self.writer.received_ranges((self.owner.max_datagram - self.owner.wire.header_size - ACCEPT_OPTIONS.size) // RANGE.size) if segment.resume != 0 else []
+        if resumed.__len__() > 0:
+            tracer.trace(TraceLevel.Info, f"[FILE] Resuming download, destination: {segment.path}, fragments already received: {sum(end - start for start, end in resumed)}")
+        pass
+
+        self.acknowledging = self.owner.version >= 2
+        self.parity = ParityDecoder() if segment.fec != 0 and Config.FEC else None
+        if self.writer.codec != 0:
+            tracer.trace(TraceLevel.Debug, f"[FILE] Receiving data compressed with {codecs[self.writer.codec].name}, destination: {segment.path}")
+        pass
+
+        return AcceptMessage(self.id, self.next_message_id, resumed, self.writer.codec, 1 if self.parity != None else 0)
+
+    def reject_download(self, segment: FileMessage, error: ValueError):
+        error_text = f"Cannot receive file: {error}"
+        tracer.trace(TraceLevel.Error, f"[FILE] {error_text}, destination: {segment.path}")
+        self.acknowledging = False
+        if self.writer != None:
+            self.writer.discard()
+        pass
+
+        return TextMessage(self.id, self.next_message_id, error_text)
+
+    def complete_download(self, segment: FileMessage):
+        if segment.total == 0:
+            discard_records(segment.path)
+            tracer.trace(TraceLevel.Info, f"[FILE] Download complete, destination: {segment.path}, size: {segment.size}, fragment count: {self.next_fragment}")
+            return
+        pass
+
+        tracer.trace(TraceLevel.Debug, f"[FILE] Stripe received, destination: {segment.path}, offset: {segment.offset}, size: {segment.size}")
+        fragment_count = self.owner.stripes.complete(segment.path, segment.total, segment.size, self.next_fragment)
+        if fragment_count != None:
+            discard_records(segment.path)
+            tracer.trace(TraceLevel.Info, f"[FILE] Download complete, destination: {segment.path}, size: {segment.total}, fragment count: {fragment_count}")
+        pass
+
+    def __init__(self, owner: BaseConnection, id: int) -> None:
+        self.owner = owner
+        self.id = id
+        self.next_message_id = 0
+        self.metrics = StreamMetrics(owner.metrics)
+        self.file: BufferedIOBase | None = None
+        self.map: FileMap | None = None
+        self.position = 0
+        self.remaining = 0
+        self.fragment_length = 0
+        self.resumed: list[tuple[int, int]] = []
+        self.encoder: FrameEncoder | None = None
+        self.uploaded: int | None = None
+        self.started = 0.0
+
+        self.next_fragment = 0
+        self.writer: FragmentWriter | None = None
+        self.parity: ParityDecoder | None = None
+        self.received_segments: list[int] = []
+        self.acknowledging = False
+        self.unacknowledged = 0
+        self.echo = 0
+        pass
+
+
+class BaseConnection:
+    def send(self, segment: Segment, flush=True):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def next_stream(self) -> Any:
+        pass
+
+    def wait_for_stripes(self, streams: list[Any], finish: Callable[[], None]):
+        pass
+
+    def set_version(self, version: int, receive_size: int = 0):
+        self.version = version
+        self.wire = formats[version]
+        if receive_size > 0:
+            self.peer_receive_size = receive_size
+        pass
+        tracer.trace(TraceLevel.Info, f"[SIG] Using protocol version {version}")
+
+    def max_fragment_size(self):
+        return min(self.max_datagram, self.peer_receive_size) - self.wire.header_size - (TIMESTAMP.size if self.version >= 2 else 0)
+
+    def fragment_size(self):
+        if Config.FRAGMENT_SIZE > 0:
+            return min(Config.FRAGMENT_SIZE, self.max_fragment_size())
+        return self.max_fragment_size()
+
+    def discover_path(self):
+        if self.version < 2 or not Config.PMTU_DISCOVERY:
+            return
+        self.next_stream().run(lambda v: v.probe_path())
+
+    def send_file(self, source: str, dest: str, delta=False):
+        try:
+            size = stat(source).st_size
+        except OSError as error:
+            tracer.trace(TraceLevel.Error, f"[FILE] Cannot open file: {error}")
+            return
+        pass
+
+        count = self.planner.count(size, self.fragment_size(), self.rtt.srtt) if self.version >= 2 and not delta else 1
+        if count == 1:
+            self.next_stream().run(lambda v: v.send_file(source, dest, delta=delta))
+            return
+        pass
+
+        tracer.trace(TraceLevel.Info, f"[FILE] Sending {source} on {count} streams")
+        started = time.monotonic()
+        streams: list[BaseStream] = []
+        for offset, length in split(size, count, self.fragment_size()):
+            stream = self.next_stream()
+            stream.run(lambda v, offset=offset, length=length: v.send_file(source, dest, offset, length, size))
+            streams.append(stream)
+        pass
+
+        def finish():
+            if any(stream.uploaded == None for stream in streams):
+                tracer.trace(TraceLevel.Error, f"[FILE] Upload failed, destination: {dest}")
+                return
+            pass
+            tracer.trace(TraceLevel.Info, f"[FILE] Upload finished, destination: {dest}, size: {size}, fragment count: {sum(stream.uploaded or 0 for stream in streams)}")
+            self.planner.observe(count, size, time.monotonic() - started)
+
+        self.wait_for_stripes(streams, finish)
+
+    def request_fin(self):
+        self.next_stream().run(lambda v: v.send_fin())
+        tracer.trace(TraceLevel.Info, "[SIG] Sending fin.")
+
+    def idle(self):
+        return Config.IDLE_TIMEOUT > 0 and self.streams.__len__() == 0 and time.monotonic() - self.last_activity_time > Config.IDLE_TIMEOUT
+
+    def __init__(self, target: tuple[str, int], is_server: bool) -> None:
+        self.target = target
+        self.is_server = is_server
+        self.version = 1
+        self.wire = formats[1]
+        self.pending = bytearray()
+        self.max_datagram = Config.MAX_DATAGRAM_SIZE
+        self.peer_receive_size = Config.MAX_DATAGRAM_SIZE
+
+        self.open = True
+        self.streams: dict[int, Any] = {}
+        self.next_stream_id = 0 if is_server else 1
+
+        self.rtt = RttEstimator()
+        self.metrics = ConnectionMetrics()
+        self.stripes = StripeTracker()
+        self.planner = StripePlanner()
+        self.loss = 0.0
+        self.last_segment_time = time.monotonic()
+        self.last_activity_time = self.last_segment_time
+        self.keep_alive_state = KeepAliveState.Normal
+        pass
@@ -0,0 +1,41 @@
+import time
+
+from config import Config
+
+
+def timestamp():
+    return (time.monotonic_ns() // 1000) & 0xFFFFFFFF or 1
+
+
+class RttEstimator:
+    def sample(self, rtt: float):
+        if rtt <= 0:
+            return
+        pass
+
+        self.min_rtt = rtt if self.min_rtt == None else min(self.min_rtt, rtt)
+        if self.srtt == None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        pass
+
+        self.rto = min(Config.MAX_RTO, max(Config.MIN_RTO, self.srtt + max(Config.CLOCK_GRANULARITY, 4 * self.rttvar)))
+        pass
+
+    def echo(self, echoed: int):
+        if echoed == 0:
+            return
+        self.sample(((timestamp() - echoed) & 0xFFFFFFFF) / 1_000_000)
+
+    def timeout(self, attempt: int = 0):
+        return min(Config.MAX_RTO, self.rto * (2**attempt))
+
+    def __init__(self) -> None:
+        self.srtt: float | None = None
+        self.min_rtt: float | None = None
+        self.rttvar = 0.0
+        self.rto = float(Config.TIMEOUT)
+        pass
@@ -1,12 +1,12 @@
-import copy
-from dataclasses import dataclass
+from dataclasses import dataclass, field, fields
 from enum import Enum
-from random import random
-from typing import ClassVar
+from struct import Struct, calcsize, pack, unpack_from
+from typing import Callable, ClassVar, Iterable
 from zlib import crc32
 
-from BinaryRW import BinaryReader, BinaryWriter
-from config import Config
+from BufferPool import PooledBuffer
+from Metrics import ConnectionMetrics
+from Trace import TraceLevel, tracer
 
 
 class SegmentType(Enum):
@@ -20,200 +20,499 @@ class SegmentType(Enum):
     Done = 8
     Next = 9
     Ping = 10
+    Ack = 11
+    Probe = 12
+    ProbeAck = 13
+    Parity = 14
+
+
+CHECKSUM = Struct(">I")
+CHECKSUM_OFFSET = 7
+CHECKSUM_END = CHECKSUM_OFFSET + CHECKSUM.size
+EMPTY_CHECKSUM = bytes(CHECKSUM.size)
+VERSION_FLAG = 0x80
+RANGE = Struct(">II")
+TIMESTAMP = Struct(">I")
+RECEIVE_SIZE = Struct(">H")
+FILE_OPTION = Struct(">BQ")
+PARITY = Struct(">BB")
+RECOVERED = Struct(">I")
+ACCEPT_OPTIONS = Struct(">BB")
+
+
+class WireFormat:
+    __slots__ = ("version", "flag", "header", "header_size", "file_size", "fragment_id", "id_mask", "size_mask")
+
+    def __init__(self, version: int, flag: int, id_format: str, size_format: str) -> None:
+        self.version = version
+        self.flag = flag
+        self.header = Struct(f">BHII{id_format}")
+        self.header_size = self.header.size
+        self.file_size = Struct(f">{size_format}")
+        self.fragment_id = id_format
+        self.id_mask = (1 << (8 * Struct(id_format).size)) - 1
+        self.size_mask = (1 << (8 * self.file_size.size)) - 1
+        pass
+
 
+formats = {
+    1: WireFormat(1, 0, "H", "H"),
+    2: WireFormat(2, VERSION_FLAG, "I", "Q"),
+}
 
-@dataclass
+
+@dataclass(slots=True)
 class Segment:
     type: ClassVar[SegmentType]
     stream: int
 
     def get_printable(self):
-        subject = copy.copy(self)
-        for key in dir(subject):
-            value = subject.__getattribute__(key)
-            if isinstance(value, bytes) and value.__len__() > 50:
-                value = value[0:50]
-                if str(value).__len__() > 50:
-                    value = value[0:10]
-                pass
-                subject.__setattr__(key, value + b"...")
+        values: list[str] = []
+        for entry in fields(self):
+            if not entry.repr:
+                continue
+            value = getattr(self, entry.name)
+            if isinstance(value, (bytes, bytearray, memoryview)) and value.__len__() > 50:
+                values.append(f"{entry.name}={bytes(value[0:10])!r}... ({value.__len__()} bytes)")
+                continue
+            elif isinstance(value, (bytearray, memoryview)):
+                value = bytes(value)
             pass
+            values.append(f"{entry.name}={value!r}")
         pass
 
-        return str(subject)
+        return f"{self.__class__.__name__}({', '.join(values)})"
 
     pass
 
 
-@dataclass
+@dataclass(slots=True)
 class Message(Segment):
     id: int
 
 
-@dataclass
+@dataclass(slots=True)
 class InitMessage(Message):
     type: ClassVar[SegmentType] = SegmentType.Init
+    version: int = 1
+    receive_size: int = 0
     pass
 
 
-@dataclass
+@dataclass(slots=True)
 class FinMessage(Message):
     type: ClassVar[SegmentType] = SegmentType.Fin
     pass
 
 
-@dataclass
+@dataclass(slots=True)
 class OkMessage(Message):
     type: ClassVar[SegmentType] = SegmentType.OK
+    version: int = 0
+    receive_size: int = 0
     pass
 
 
-@dataclass
+@dataclass(slots=True)
 class TextMessage(Message):
     type: ClassVar[SegmentType] = SegmentType.Text
     text: str
     pass
 
 
-@dataclass
+@dataclass(slots=True)
 class FileMessage(Message):
     type: ClassVar[SegmentType] = SegmentType.File
     path: str
     size: int
+    offset: int = 0
+    total: int = 0
+    fragment_size: int = 0
+    resume: int = 0
+    delta: int = 0
+    compression: int = 0
+    fec: int = 0
     pass
 
 
-@dataclass
+@dataclass(slots=True)
 class AcceptMessage(Message):
     type: ClassVar[SegmentType] = SegmentType.Accept
+    ranges: list[tuple[int, int]] = field(default_factory=list)
+    codec: int = 0
+    fec: int = 0
     pass
 
 
-@dataclass
+@dataclass(slots=True)
 class DoneMessage(Message):
     type: ClassVar[SegmentType] = SegmentType.Done
     pass
 
 
-@dataclass
+@dataclass(slots=True)
 class NextMessage(Message):
     type: ClassVar[SegmentType] = SegmentType.Next
-    fragments: list[int]
+    ranges: list[tuple[int, int]]
     pass
 
 
-@dataclass
+@dataclass(slots=True)
 class PingMessage(Message):
     type: ClassVar[SegmentType] = SegmentType.Ping
     pass
 
 
-@dataclass
+@dataclass(slots=True)
 class DataSegment(Segment):
     type: ClassVar[SegmentType] = SegmentType.Data
     fragment_id: int
-    data: bytes | bytearray
+    data: bytes | bytearray | memoryview
+    timestamp: int = 0
+    buffer: PooledBuffer | None = field(default=None, repr=False, compare=False)
+
+    def attach(self, buffer: PooledBuffer):
+        buffer.hold()
+        self.buffer = buffer
+
+    def release(self):
+        if self.buffer != None:
+            self.buffer.release()
+            self.buffer = None
+        pass
 
 
-def parse_segment(input: bytes) -> Segment | None:
-    reader = BinaryReader(input)
-    typeNumber = reader.readInt(1)
+@dataclass(slots=True)
+class AckSegment(Segment):
+    type: ClassVar[SegmentType] = SegmentType.Ack
+    ranges: list[tuple[int, int]]
+    echo: int = 0
+    recovered: int = 0
 
-    if not (typeNumber in SegmentType._value2member_map_):
-        print(f"Received segment with invalid type = {typeNumber}")
-        return None
+
+@dataclass(slots=True)
+class ParitySegment(Segment):
+    type: ClassVar[SegmentType] = SegmentType.Parity
+    first: int
+    index: int
+    count: int
+    data: bytes | bytearray | memoryview
+
+
+@dataclass(slots=True)
+class ProbeSegment(Segment):
+    type: ClassVar[SegmentType] = SegmentType.Probe
+    size: int
+    padding: bytes | bytearray | memoryview = b""
+
+
+@dataclass(slots=True)
+class ProbeAckSegment(Segment):
+    type: ClassVar[SegmentType] = SegmentType.ProbeAck
+    size: int
+
+
+def parse_receive_size(body: memoryview):
+    return RECEIVE_SIZE.unpack_from(body, 1)[0] if body.__len__() >= 1 + RECEIVE_SIZE.size else 0
+
+
+def parse_init(wire: WireFormat, stream: int, id: int, body: memoryview):
+    return InitMessage(stream, id, body[0] if body.__len__() > 0 else 1, parse_receive_size(body))
+
+
+def parse_ok(wire: WireFormat, stream: int, id: int, body: memoryview):
+    return OkMessage(stream, id, body[0] if body.__len__() > 0 else 0, parse_receive_size(body))
+
+
+def parse_file(wire: WireFormat, stream: int, id: int, body: memoryview):
+    (size,) = wire.file_size.unpack_from(body)
+    path, _, options = bytes(body[wire.file_size.size :]).partition(b"\0")
+    segment = FileMessage(stream, id, str(path, "utf-8"), size)
+    for offset in range(0, options.__len__() - FILE_OPTION.size + 1, FILE_OPTION.size):
+        tag, value = FILE_OPTION.unpack_from(options, offset)
+        if tag in file_options:
+            setattr(segment, file_options[tag], value)
+        pass
     pass
-    type = SegmentType(typeNumber)
 
-    length = reader.readInt(2)
-    stream = reader.readInt(4)
+    return segment
 
-    checksum_pointer = reader.index
-    expected_checksum = reader.readInt(4)
 
-    checksum_subject = bytearray(input)
-    for i in range(4):
-        checksum_subject[checksum_pointer + i] = 0
+file_options = {
+    1: "offset",
+    2: "total",
+    3: "fragment_size",
+    4: "resume",
+    5: "delta",
+    6: "compression",
+    7: "fec",
+}
+
+
+def to_ranges(fragments: Iterable[int]) -> list[tuple[int, int]]:
+    ranges: list[tuple[int, int]] = []
+    for fragment in sorted(fragments):
+        if ranges.__len__() > 0 and fragment <= ranges[-1][1]:
+            if fragment == ranges[-1][1]:
+                ranges[-1] = (ranges[-1][0], fragment + 1)
+            pass
+            continue
+        pass
+        ranges.append((fragment, fragment + 1))
     pass
-    actual_checksum = crc32(checksum_subject)
 
-    if actual_checksum != expected_checksum:
-        print("[CRC] Received corrupted segment")
-        return None
+    return ranges
+
+
+def merge_ranges(ranges: Iterable[tuple[int, int]]) -> list[tuple[int, int]]:
+    merged: list[tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged.__len__() > 0 and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+            continue
+        pass
+        merged.append((start, end))
     pass
 
-    if type == SegmentType.Data:
-        fragment_id = reader.readInt(2)
-        data = reader.readBytes(length)
-        return DataSegment(stream, fragment_id, data)
-    else:
-        id = reader.readInt(2)
-        match type:
-            case SegmentType.Init:
-                return InitMessage(stream, id)
-            case SegmentType.Fin:
-                return FinMessage(stream, id)
-            case SegmentType.OK:
-                return OkMessage(stream, id)
-            case SegmentType.Text:
-                text = reader.readBytes(length).decode()
-                return TextMessage(stream, id, text)
-            case SegmentType.File:
-                size = reader.readInt(2)
-                path = reader.readBytes(length - 2).decode()
-                return FileMessage(stream, id, path, size)
-            case SegmentType.Accept:
-                return AcceptMessage(stream, id)
-            case SegmentType.Done:
-                return DoneMessage(stream, id)
-            case SegmentType.Ping:
-                return PingMessage(stream, id)
-            case SegmentType.Next:
-                fragments: list[int] = []
-                for _ in range(length // 2):
-                    fragments.append(reader.readInt(2))
-                return NextMessage(stream, id, fragments)
+    return merged
+
+
+def parse_data(wire: WireFormat, stream: int, fragment_id: int, body: memoryview):
+    if wire.version == 1:
+        return DataSegment(stream, fragment_id, body)
+    pass
+
+    (timestamp,) = TIMESTAMP.unpack_from(body)
+    return DataSegment(stream, fragment_id, body[TIMESTAMP.size :], timestamp)
+
+
+def parse_ranges(body: memoryview):
+    values = unpack_from(f">{body.__len__() // RANGE.size * 2}I", body)
+    return list(zip(values[0::2], values[1::2]))
+
+
+def parse_accept(wire: WireFormat, stream: int, id: int, body: memoryview):
+    if wire.version == 1:
+        return AcceptMessage(stream, id)
+    pass
+
+    options = body[body.__len__() - body.__len__() % RANGE.size :]
+    return AcceptMessage(stream, id, parse_ranges(body), options[0] if options.__len__() > 0 else 0, options[1] if options.__len__() > 1 else 0)
+
+
+def parse_ack(wire: WireFormat, stream: int, echo: int, body: memoryview):
+    recovered = RECOVERED.unpack_from(body, body.__len__() - RECOVERED.size)[0] if body.__len__() % RANGE.size == RECOVERED.size else 0
+    return AckSegment(stream, parse_ranges(body), echo, recovered)
+
+
+def parse_parity(wire: WireFormat, stream: int, first: int, body: memoryview):
+    index, count = PARITY.unpack_from(body)
+    return ParitySegment(stream, first, index, count, bytes(body[PARITY.size :]))
+
+
+def parse_next(wire: WireFormat, stream: int, id: int, body: memoryview):
+    if wire.version == 1:
+        count = body.__len__() // calcsize(wire.fragment_id)
+        return NextMessage(stream, id, to_ranges(unpack_from(f">{count}{wire.fragment_id}", body)))
+    pass
+
+    return NextMessage(stream, id, parse_ranges(body))
+
+
+parsers: dict[int, Callable[[WireFormat, int, int, memoryview], Segment]] = {
+    SegmentType.Init.value: parse_init,
+    SegmentType.Fin.value: lambda wire, stream, id, body: FinMessage(stream, id),
+    SegmentType.OK.value: parse_ok,
+    SegmentType.Text.value: lambda wire, stream, id, body: TextMessage(stream, id, str(body, "utf-8")),
+    SegmentType.File.value: parse_file,
+    SegmentType.Accept.value: parse_accept,
+    SegmentType.Data.value: parse_data,
+    SegmentType.Done.value: lambda wire, stream, id, body: DoneMessage(stream, id),
+    SegmentType.Next.value: parse_next,
+    SegmentType.Ping.value: lambda wire, stream, id, body: PingMessage(stream, id),
+    SegmentType.Ack.value: parse_ack,
+    SegmentType.Probe.value: lambda wire, stream, size, body: ProbeSegment(stream, size, body),
+    SegmentType.ProbeAck.value: lambda wire, stream, size, body: ProbeAckSegment(stream, size),
+    SegmentType.Parity.value: parse_parity,
+}
+
+
+def parse_at(view: memoryview, offset: int, metrics: ConnectionMetrics | None = None) -> tuple[Segment | None, int]:
+    remaining = view.__len__() - offset
+    wire = formats[2] if view[offset] & VERSION_FLAG else formats[1]
+    if remaining < wire.header_size:
+        tracer.trace(TraceLevel.Debug, f"Received truncated segment of {remaining} bytes")
+        if metrics != None:
+            metrics.malformed += 1
         pass
+        return None, view.__len__()
     pass
 
+    typeNumber, length, stream, expected_checksum, id = wire.header.unpack_from(view, offset)
 
-def emit_segment(segment: Segment):
-    output = BinaryWriter()
-    type = segment.type
+    parser = parsers.get(typeNumber & ~VERSION_FLAG)
+    if parser == None:
+        tracer.trace(TraceLevel.Debug, f"Received segment with invalid type = {typeNumber}")
+        if metrics != None:
+            metrics.malformed += 1
+        pass
+        return None, view.__len__()
+    pass
 
-    output.writeInt(1, type.value)
-    lengthPlaceholder = output.writePlaceholder(2)
-    output.writeInt(4, segment.stream)
-    checksumPlaceholder = output.writePlaceholder(4)
-
-    if isinstance(segment, DataSegment):
-        output.writeInt(2, segment.fragment_id)
-        output.writeBytes(segment.data)
-        lengthPlaceholder(segment.data.__len__())
-    elif isinstance(segment, Message):
-        output.writeInt(2, segment.id)
-        if isinstance(segment, TextMessage):
-            text = segment.text.encode()
-            output.writeBytes(text)
-            lengthPlaceholder(text.__len__())
-        elif isinstance(segment, FileMessage):
-            output.writeInt(2, segment.size)
-            path = segment.path.encode()
-            output.writeBytes(path)
-            lengthPlaceholder(path.__len__() + 2)
-        elif isinstance(segment, NextMessage):
-            for fragment in segment.fragments:
-                output.writeInt(2, fragment)
-            pass
-            lengthPlaceholder(2 * segment.fragments.__len__())
+    end = offset + wire.header_size + length
+    if end > view.__len__():
+        tracer.trace(TraceLevel.Debug, f"Received truncated segment of {remaining} bytes")
+        if metrics != None:
+            metrics.malformed += 1
         pass
+        return None, view.__len__()
     pass
 
-    checksum = crc32(output.build())
-    if (segment.type == SegmentType.Data or segment.type == SegmentType.Text) and Config.PACKET_LOSS > 0:
-        checksum += 1
-        Config.PACKET_LOSS -= 1
+    if wire.version == 1:
+        end = view.__len__()
     pass
-    checksumPlaceholder(checksum)
 
-    return output.build()
+    actual_checksum = crc32(view[offset + CHECKSUM_END : end], crc32(EMPTY_CHECKSUM, crc32(view[offset : offset + CHECKSUM_OFFSET])))
+    if actual_checksum != expected_checksum:
+        tracer.trace(TraceLevel.Debug, "[CRC] Received corrupted segment")
+        if metrics != None:
+            metrics.crc_failures += 1
+        pass
+        return None, view.__len__()
+    pass
+
+    return parser(wire, stream, id, view[offset + wire.header_size : offset + wire.header_size + length]), end
+
+
+def parse_segment(input: bytes | bytearray | memoryview, metrics: ConnectionMetrics | None = None) -> Segment | None:
+    view = memoryview(input)
+    if view.__len__() == 0:
+        return None
+    pass
+
+    segment, _ = parse_at(view, 0, metrics)
+    return segment
+
+
+def parse_datagram(input: bytes | bytearray | memoryview, metrics: ConnectionMetrics | None = None) -> list[Segment]:
+    view = memoryview(input)
+    segments: list[Segment] = []
+    offset = 0
+    while offset < view.__len__():
+        segment, offset = parse_at(view, offset, metrics)
+        if segment == None:
+            break
+        segments.append(segment)
+    pass
+
+    return segments
+
+
+def emit_init(wire: WireFormat, segment: InitMessage):
+    return bytes((segment.version,)) + RECEIVE_SIZE.pack(segment.receive_size)
+
+
+def emit_ok(wire: WireFormat, segment: OkMessage):
+    return bytes((segment.version,)) + RECEIVE_SIZE.pack(segment.receive_size) if segment.version != 0 else b""
+
+
+def emit_file(wire: WireFormat, segment: FileMessage):
+    output = wire.file_size.pack(segment.size & wire.size_mask) + segment.path.encode()
+    options = [FILE_OPTION.pack(tag, getattr(segment, name)) for tag, name in file_options.items() if getattr(segment, name) != 0]
+    if wire.version >= 2 and options.__len__() > 0:
+        output += b"\0" + b"".join(options)
+    pass
+
+    return output
+
+
+def emit_next(wire: WireFormat, segment: NextMessage):
+    if wire.version == 1:
+        fragments = [fragment & wire.id_mask for start, end in segment.ranges for fragment in range(start, end)]
+        return pack(f">{fragments.__len__()}{wire.fragment_id}", *fragments)
+    pass
+
+    return emit_ranges(segment.ranges)
+
+
+def emit_accept(wire: WireFormat, segment: AcceptMessage):
+    if wire.version == 1:
+        return b""
+    pass
+
+    output = emit_ranges(segment.ranges)
+    if segment.codec != 0 or segment.fec != 0:
+        output.append(segment.codec)
+    pass
+
+    if segment.fec != 0:
+        output.append(segment.fec)
+    pass
+
+    return output
+
+
+def emit_ack(wire: WireFormat, segment: AckSegment):
+    output = emit_ranges(segment.ranges)
+    if segment.recovered != 0:
+        output += RECOVERED.pack(segment.recovered)
+    pass
+
+    return output
+
+
+def emit_ranges(ranges: list[tuple[int, int]]):
+    output = bytearray(RANGE.size * ranges.__len__())
+    for index, (start, end) in enumerate(ranges):
+        RANGE.pack_into(output, index * RANGE.size, start, end)
+    pass
+
+    return output
+
+
+emitters: dict[SegmentType, Callable[[WireFormat, Segment], bytes | bytearray | memoryview]] = {
+    SegmentType.Init: emit_init,
+    SegmentType.OK: emit_ok,
+    SegmentType.Text: lambda wire, segment: segment.text.encode(),
+    SegmentType.File: emit_file,
+    SegmentType.Next: emit_next,
+    SegmentType.Accept: emit_accept,
+    SegmentType.Ack: emit_ack,
+    SegmentType.Probe: lambda wire, segment: segment.padding,
+    SegmentType.Parity: lambda wire, segment: PARITY.pack(segment.index, segment.count) + segment.data,
+}
+
+
+header_ids: dict[SegmentType, Callable[[Segment], int]] = {
+    SegmentType.Ack: lambda segment: segment.echo,
+    SegmentType.Probe: lambda segment: segment.size,
+    SegmentType.ProbeAck: lambda segment: segment.size,
+    SegmentType.Parity: lambda segment: segment.first,
+}
+
+
+def emit_segment(segment: Segment, version: int = 1):
+    wire = formats[version]
+    type = segment.type
+    if type == SegmentType.Data:
+        id = segment.fragment_id
+        prefix = TIMESTAMP.size if wire.version >= 2 else 0
+        body = segment.data
+    else:
+        id = header_ids[type](segment) if type in header_ids else segment.id
+        prefix = 0
+        emitter = emitters.get(type)
+        body = emitter(wire, segment) if emitter != None else b""
+    pass
+    length = prefix + body.__len__()
+
+    output = bytearray(wire.header_size + length)
+    wire.header.pack_into(output, 0, type.value | wire.flag, length, segment.stream, 0, id & wire.id_mask)
+    if prefix > 0:
+        TIMESTAMP.pack_into(output, wire.header_size, segment.timestamp)
+    pass
+    output[wire.header_size + prefix :] = body
+
+    CHECKSUM.pack_into(output, CHECKSUM_OFFSET, crc32(output))
+
+    return output
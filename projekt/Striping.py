@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from threading import Lock
+
+from config import Config
+
+
+class StripePlanner:
+    def count(self, size: int, fragment_size: int, srtt: float | None):
+        if Config.STRIPES > 0:
+            return max(1, min(Config.STRIPES, (size + fragment_size - 1) // fragment_size))
+        pass
+
+        throughput = self.throughput.get(1, 0.0)
+        if throughput <= 0 and srtt != None and srtt > 0:
+            throughput = Config.INITIAL_WINDOW * fragment_size / srtt
+        pass
+
+        count = size // Config.STRIPE_MIN_SIZE
+        if throughput > 0:
+            count = min(count, int(size / (throughput * Config.STRIPE_MIN_DURATION)))
+        pass
+        count = max(1, min(count, Config.MAX_STRIPES, (size + fragment_size - 1) // fragment_size))
+
+        best = max(self.throughput, key=lambda key: self.throughput[key], default=count)
+        if count in self.throughput and self.throughput[count] < self.throughput[best]:
+            count = best
+        pass
+
+        return count
+
+    def observe(self, count: int, size: int, elapsed: float):
+        if size >= Config.STRIPE_MIN_SIZE and elapsed > 0:
+            self.throughput[count] = size / elapsed
+        pass
+
+    def __init__(self) -> None:
+        self.throughput: dict[int, float] = {}
+        pass
+
+
+def split(size: int, count: int, fragment_size: int):
+    length = (size + count * fragment_size - 1) // (count * fragment_size) * fragment_size
+    return [(offset, min(length, size - offset)) for offset in range(0, size, length)]
+
+
+def open_stripe(path: str, offset: int, total: int):
+    file = os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0o666), "r+b")
+    file.truncate(total)
+    file.seek(offset)
+    return file
+
+
+@dataclass
+class StripeProgress:
+    total: int
+    received: int = 0
+    fragments: int = 0
+
+
+class StripeTracker:
+    def complete(self, path: str, total: int, size: int, fragments: int):
+        with self.lock:
+            progress = self.progress.setdefault(path, StripeProgress(total))
+            progress.received += size
+            progress.fragments += fragments
+            if progress.received < progress.total:
+                return None
+            pass
+
+            self.progress.pop(path)
+            return progress.fragments
+        pass
+
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.progress: dict[str, StripeProgress] = {}
+        pass
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import multiprocessing
+import sys
+import time
+from multiprocessing.process import BaseProcess
+from queue import Empty
+from select import select
+from typing import Any, Callable
+
+from config import Config
+
+
+class Worker:
+    def start(self):
+        self.process = self.context.Process(target=self.target, args=(self.port, self.index, self.commands, self.stats), daemon=False)
+        self.process.start()
+        self.next_start = 0.0
+        print(f"[SUP] Worker {self.index} started, pid {self.process.pid}")
+
+    def backoff(self, now: float):
+        self.restarts = [moment for moment in self.restarts if now - moment < Config.RESTART_WINDOW]
+        if self.restarts.__len__() >= Config.RESTART_LIMIT:
+            return None
+        pass
+
+        return min(Config.RESTART_MAX_BACKOFF, Config.RESTART_BACKOFF * 2 ** self.restarts.__len__())
+
+    def __init__(self, context: Any, target: Callable, port: int, index: int, stats: Any) -> None:
+        self.context = context
+        self.target = target
+        self.port = port
+        self.index = index
+        self.stats = stats
+        self.commands = context.Queue()
+        self.process: BaseProcess | None = None
+        self.restarts: list[float] = []
+        self.next_start = 0.0
+        pass
+
+
+class Supervisor:
+    def aggregate(self):
+        total: dict[str, int] = {}
+        for statistics in self.statistics.values():
+            for key, value in statistics.items():
+                total[key] = total.get(key, 0) + value
+            pass
+        pass
+
+        return total
+
+    def print_stats(self):
+        for index in sorted(self.statistics):
+            print(f"[SUP] Worker {index}: {self.statistics[index]}")
+        pass
+        print(f"[SUP] Total: {self.aggregate()}")
+
+    def command(self, text: str):
+        if text.startswith("STATS"):
+            self.print_stats()
+            return
+        pass
+
+        if text.startswith("FIN"):
+            self.stopping = True
+        pass
+
+        for worker in self.workers:
+            worker.commands.put(text)
+        pass
+
+    def stop(self):
+        self.stopping = True
+        for worker in self.workers:
+            worker.commands.put("FIN")
+        pass
+
+    def collect(self, timeout: float):
+        try:
+            index, statistics = self.stats.get(timeout=timeout)
+        except Empty:
+            return False
+        pass
+
+        self.statistics[index] = statistics
+        return True
+
+    def alive(self):
+        return any(worker.process != None and worker.process.is_alive() for worker in self.workers)
+
+    def supervise(self):
+        now = time.monotonic()
+        for worker in self.workers:
+            assert worker.process != None
+            if worker.process.is_alive() or self.stopping:
+                continue
+            pass
+
+            if worker.next_start == 0:
+                delay = worker.backoff(now)
+                if delay == None:
+                    self.error = f"Worker {worker.index} exited with code {worker.process.exitcode} after {Config.RESTART_LIMIT} restarts within {Config.RESTART_WINDOW} s"
+                    print(f"[SUP] {self.error}, stopping")
+                    self.stop()
+                    return
+                pass
+
+                worker.next_start = now + delay
+                print(f"[SUP] Worker {worker.index} exited with code {worker.process.exitcode}, restarting in {delay:g} s")
+            pass
+
+            if now < worker.next_start:
+                continue
+            pass
+
+            worker.restarts.append(now)
+            worker.commands = self.context.Queue()
+            worker.start()
+        pass
+
+    def read_input(self, timeout: float):
+        if self.input_closed:
+            time.sleep(timeout)
+            return
+        pass
+
+        readable, _, _ = select([sys.stdin], [], [], timeout)
+        if readable.__len__() == 0:
+            return
+        pass
+
+        line = sys.stdin.readline()
+        if line == "":
+            self.input_closed = True
+            return
+        pass
+
+        self.command(line.rstrip("\n"))
+
+    def run(self):
+        for worker in self.workers:
+            worker.start()
+        pass
+
+        try:
+            while self.alive() or not self.stopping:
+                self.read_input(Config.SWEEP_INTERVAL)
+                while self.collect(0):
+                    pass
+                pass
+                self.supervise()
+            pass
+        except KeyboardInterrupt:
+            self.stop()
+            for worker in self.workers:
+                assert worker.process != None
+                worker.process.join(Config.TIMEOUT * Config.REPEAT_LIMIT)
+                if worker.process.is_alive():
+                    worker.process.terminate()
+                pass
+            pass
+        pass
+
+        while self.collect(0.1):
+            pass
+        pass
+        self.print_stats()
+        return self.error
+
+    def __init__(self, port: int, count: int, target: Callable) -> None:
+        self.context = multiprocessing.get_context("fork")
+        self.stats = self.context.Queue()
+        self.workers = [Worker(self.context, target, port, index, self.stats) for index in range(count)]
+        self.statistics: dict[int, dict[str, int]] = {}
+        self.stopping = False
+        self.input_closed = False
+        self.error: str | None = None
+        pass
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+from collections import deque
+from enum import IntEnum
+from queue import Queue
+from threading import Thread
+from typing import Any, TextIO
+
+from config import Config
+
+
+class TraceLevel(IntEnum):
+    Off = 0
+    Error = 1
+    Info = 2
+    Debug = 3
+    Segment = 4
+
+
+TraceEntry = tuple[float, TraceLevel, str, tuple[Any, ...]]
+
+
+def format_entry(entry: TraceEntry):
+    _, _, message, args = entry
+    if args.__len__() == 0:
+        return message
+    pass
+
+    return message.format(*args)
+
+
+def summarize(args: tuple[Any, ...]):
+    return tuple(arg.get_printable() if hasattr(arg, "get_printable") else arg for arg in args)
+
+
+class Tracer:
+    def trace(self, level: TraceLevel, message: str, *args: Any):
+        if level > self.threshold:
+            return
+        pass
+
+        entry = (time.monotonic(), level, message, summarize(args) if args.__len__() > 0 else args)
+        if level <= self.record_level:
+            self.ring.append(entry)
+        pass
+
+        if level <= self.level:
+            if self.writer == None:
+                self.start()
+            pass
+            self.queue.put(entry)
+        pass
+
+    def set_level(self, level: int, record_level: int | None = None):
+        self.level = TraceLevel(level)
+        if record_level != None:
+            self.record_level = TraceLevel(record_level)
+        pass
+        self.threshold = max(self.level, self.record_level)
+
+    def write(self):
+        output: TextIO = open(Config.TRACE_FILE, "a") if Config.TRACE_FILE != "" else sys.stdout
+        while True:
+            entry = self.queue.get()
+            if entry == None:
+                output.flush()
+                self.queue.task_done()
+                return
+            pass
+
+            try:
+                output.write(format_entry(entry) + "\n")
+                if self.queue.empty():
+                    output.flush()
+                pass
+            except Exception as error:
+                output.write(f"[TRACE] Cannot format {entry[2]!r}: {error}\n")
+            pass
+            self.queue.task_done()
+        pass
+
+    def start(self):
+        with self.lock:
+            if self.writer != None:
+                return
+            pass
+
+            self.writer = Thread(target=self.write, daemon=True)
+            self.writer.start()
+        pass
+
+    def flush(self):
+        if self.writer != None:
+            self.queue.join()
+        pass
+
+    def close(self):
+        if self.writer != None:
+            self.queue.put(None)
+            self.writer.join()
+            self.writer = None
+        pass
+
+    def dump(self, path: str | None = None):
+        if path == None:
+            path = Config.TRACE_DUMP_PATH.format(pid=os.getpid())
+        pass
+
+        entries = list(self.ring)
+        with open(path, "w") as output:
+            for entry in entries:
+                output.write(f"{entry[0]:.6f} {entry[1].name:<7} {format_entry(entry)}\n")
+            pass
+        pass
+
+        self.trace(TraceLevel.Error, f"[TRACE] Dumped {entries.__len__()} entries to {path}")
+        return path
+
+    def failure(self):
+        if Config.TRACE_DUMP_ON_FAILURE and self.ring.__len__() > 0:
+            self.dump()
+        pass
+
+    def install(self):
+        excepthook = sys.excepthook
+        thread_excepthook = threading.excepthook
+
+        def on_exception(*args):
+            excepthook(*args)
+            self.failure()
+
+        def on_thread_exception(args):
+            thread_excepthook(args)
+            if args.exc_type != SystemExit:
+                self.failure()
+            pass
+
+        sys.excepthook = on_exception
+        threading.excepthook = on_thread_exception
+
+    def reset(self):
+        self.queue = Queue[TraceEntry | None]()
+        self.lock = threading.Lock()
+        self.writer: Thread | None = None
+
+    def __init__(self) -> None:
+        self.ring: deque[TraceEntry] = deque(maxlen=Config.TRACE_RING_SIZE)
+        self.level = TraceLevel(Config.TRACE_LEVEL)
+        self.record_level = TraceLevel(Config.TRACE_RECORD_LEVEL)
+        self.threshold = max(self.level, self.record_level)
+        self.reset()
+        os.register_at_fork(after_in_child=self.reset)
+        pass
+
+
+tracer = Tracer()
@@ -1,9 +1,77 @@
 class Config:
+    ENGINE: str = "threads"
     PING_INTERVAL: int = 5
+    IDLE_TIMEOUT: int = 300
+    SWEEP_INTERVAL: float = 0.1
+    SERVER_WORKERS: int = 1
+    RESTART_BACKOFF: float = 0.5
+    RESTART_MAX_BACKOFF: float = 30
+    RESTART_LIMIT: int = 5
+    RESTART_WINDOW: float = 60
+    STATS_INTERVAL: float = 1
     TIMEOUT: int = 1
+    MIN_RTO: float = 0.2
+    MAX_RTO: float = 10
+    CLOCK_GRANULARITY: float = 0.001
     REPEAT_LIMIT: int = 5
-    FRAGMENT_SIZE: int = 1024
+    FRAGMENT_SIZE: int = 0
     FRAGMENT_MAX_AGE: int = 2
     WINDOW_SIZE: int = 10
-    PACKET_LOSS: int = 0
     FORCE_REPEAT: int = 0
+    MMAP_SENDER: bool = True
+    RESUME: bool = True
+    RESUME_SUFFIX: str = ".resume"
+    RESUME_SAVE_INTERVAL: float = 1
+    COMPRESSION: str = "zstd,zlib,lzma"
+    COMPRESSION_MIN_RATIO: float = 0.9
+    COMPRESSION_CHUNK_SIZE: int = 262144
+    COMPRESSION_SAMPLES: int = 4
+    COMPRESSION_MAX_BACKOFF: int = 64
+    FEC: bool = False
+    FEC_GROUP_SIZE: int = 16
+    FEC_MAX_PARITY: int = 4
+    FEC_RESIDUAL: float = 0.05
+    FEC_LOSS_GAIN: float = 0.01
+    DELTA_MIN_BLOCK: int = 2048
+    DELTA_MAX_BLOCK: int = 131072
+    DELTA_MAX_LITERAL: float = 0.5
+    DELTA_PROBE_BLOCKS: int = 64
+    DELTA_TIMEOUT: float = 60
+    DELTA_MIN_RATE: int = 262144
+    STRIPES: int = 0
+    MAX_STRIPES: int = 8
+    STRIPE_MIN_SIZE: int = 8388608
+    STRIPE_MIN_DURATION: float = 0.5
+    IMPAIRMENT: str = ""
+    IMPAIRMENT_SEED: int = 1
+    TRACE_LEVEL: int = 2
+    TRACE_RECORD_LEVEL: int = 3
+    TRACE_RING_SIZE: int = 4096
+    TRACE_FILE: str = ""
+    TRACE_DUMP_PATH: str = "trace-{pid}.log"
+    TRACE_DUMP_ON_FAILURE: bool = True
+    RECEIVE_BUFFER_SIZE: int = 16384
+    SOCKET_BUFFER_SIZE: int = 4194304
+    BUFFER_POOL_CAPACITY: int = 256
+    PROTOCOL_VERSION: int = 2
+    COALESCE: bool = True
+    UDP_GSO: bool = True
+    UDP_GRO: bool = True
+    GRO_BUFFER_SIZE: int = 65535
+    MAX_DATAGRAM_SIZE: int = 1472
+    ACK_FREQUENCY: int = 4
+    ACK_DELAY: float = 0.01
+    REORDER_THRESHOLD: int = 3
+    CONGESTION_CONTROL: str = "newreno"
+    INITIAL_WINDOW: int = 10
+    MIN_WINDOW: int = 2
+    MAX_WINDOW: int = 4096
+    PMTU_DISCOVERY: bool = True
+    MIN_DATAGRAM_SIZE: int = 1200
+    MAX_PROBE_SIZE: int = 65507
+    PROBE_PRECISION: int = 32
+    PROBE_ATTEMPTS: int = 2
+    PACING: bool = True
+    PACING_GAIN: float = 1.25
+    PACING_RATE: int = 0
+    PACING_QUANTUM: float = 0.002
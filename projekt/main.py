@@ -1,13 +1,24 @@
 from __future__ import annotations
 
+import asyncio
+import time
+from os import cpu_count
 from queue import Queue
-from socket import AF_INET, SOCK_DGRAM, socket
+from socket import AF_INET, SO_RCVBUF, SO_REUSEPORT, SO_SNDBUF, SOCK_DGRAM, SOL_SOCKET, socket
 from sys import argv, exit
 from threading import Thread
+from typing import Any
 
+from AsyncEngine import AsyncEndpoint
+from BufferPool import BufferPool
 from config import Config
 from ConnectionController import ConnectionController
-from Segment import InitMessage, Segment, parse_segment
+from Impairment import ImpairmentProxy
+from Metrics import export, format_text, formatters, snapshot
+from Offload import enable_gro, receive_segments
+from Segment import DataSegment, InitMessage, Segment, parse_datagram
+from Supervisor import Supervisor
+from Trace import TraceLevel, tracer
 
 
 class UserInputThread(Thread):
@@ -25,7 +36,6 @@ class UserInputThread(Thread):
 
 
 user_input = UserInputThread()
-user_input.start()
 
 
 class Application:
@@ -44,115 +54,245 @@ class Application:
         self.controller.tick()
         pass
 
-    def run(self):
-        self.start()
+    def running(self):
+        return self.controller == None or self.controller.open
 
-        def listener():
-            while True:
-                line = user_input.queue.get()
-                if line == None:
-                    return
-                pass
+    def metrics_for(self, addr: tuple[str, int]):
+        return self.controller.metrics if self.controller != None else None
 
-                if self.controller == None:
-                    continue
-                pass
+    def snapshots(self):
+        return [snapshot(self.controller)] if self.controller != None else []
 
-                text = line
-                if text.startswith("FIN"):
-                    self.controller.request_fin()
-                    continue
-                pass
+    def fragment_limit(self):
+        return self.controller.max_fragment_size() if self.controller != None else 0
 
-                if text.startswith("FILE"):
-                    segments = text[4:].split(",")
-                    if segments.__len__() != 2:
-                        print("Expected source file, destination path")
-                        continue
-                    pass
-                    source = segments[0].strip()
-                    dest = segments[1].strip()
-                    self.controller.next_stream().run(lambda v: v.send_file(source, dest))
-                    continue
-                pass
+    def statistics(self) -> dict[str, int]:
+        return {"datagrams": self.datagrams, "bytes": self.received_bytes}
 
-                if text.startswith("SIZE"):
-                    new_size = None
-                    try:
-                        new_size = int(text[4:])
-                    except ValueError:
-                        print("Expected max fragment size")
-                        continue
-                    pass
+    def report(self):
+        if self.stats != None:
+            self.stats.put((self.worker, self.statistics()))
+        pass
 
-                    if new_size <= 0:
-                        print("Value must be at least 1")
-                        continue
-                    pass
+    def dispose(self):
+        if self.controller != None:
+            self.controller.dispose()
+        pass
+
+    def impair(self, target: tuple[str, int]):
+        if Config.IMPAIRMENT == "":
+            return target
+        pass
+
+        self.impairment = ImpairmentProxy(target, Config.IMPAIRMENT, Config.IMPAIRMENT_SEED).start()
+        print(f"[IMP] Routing through impairment proxy at port {self.impairment.port}")
+        return self.impairment.address
+
+    def command(self, text: str):
+        if text.startswith("STATS"):
+            arguments = text[5:].split()
+            if arguments.__len__() == 0:
+                print(format_text(self.snapshots()))
+                return
+            pass
+
+            if arguments.__len__() != 2 or arguments[0].lower() not in formatters:
+                print(f"Expected STATS [{'|'.join(formatters)} path]")
+                return
+            pass
+
+            try:
+                export(self.snapshots(), arguments[0].lower(), arguments[1])
+            except OSError as error:
+                print(f"Cannot export statistics: {error}")
+                return
+            pass
+            print(f"Exported statistics to {arguments[1]}")
+            return
+        pass
+
+        if self.controller == None:
+            return
+        pass
+
+        if text.startswith("FIN"):
+            self.controller.request_fin()
+            return
+        pass
+
+        if text.startswith("FILE") or text.startswith("SYNC"):
+            segments = text[4:].split(",")
+            if segments.__len__() != 2:
+                print("Expected source file, destination path")
+                return
+            pass
+            source = segments[0].strip()
+            dest = segments[1].strip()
+            self.controller.send_file(source, dest, delta=text.startswith("SYNC"))
+            return
+        pass
+
+        if text.startswith("SIZE"):
+            new_size = None
+            try:
+                new_size = int(text[4:])
+            except ValueError:
+                print("Expected max fragment size")
+                return
+            pass
+
+            if new_size < 0:
+                print("Value must be at least 0")
+                return
+            pass
+
+            limit = self.fragment_limit()
+            if limit > 0 and new_size > limit:
+                print(f"Value must be at most {limit} for the current connection")
+                return
+            pass
 
-                    Config.FRAGMENT_SIZE = new_size
-                    print(f"Setting FRAGMENT_SIZE to {Config.FRAGMENT_SIZE}")
-                    continue
+            Config.FRAGMENT_SIZE = new_size
+            print(f"Setting FRAGMENT_SIZE to {Config.FRAGMENT_SIZE}" if new_size > 0 else "Setting FRAGMENT_SIZE to automatic")
+            return
+        pass
+
+        if text.startswith("LOSS"):
+            if self.impairment == None:
+                print("Set IMPAIRMENT to route the client through the impairment proxy")
+                return
+            pass
+
+            argument = text[4:].strip()
+            try:
+                self.impairment.configure(f"loss={float(argument)}")
+            except ValueError:
+                try:
+                    self.impairment.configure(argument)
+                except ValueError as error:
+                    print(error)
+                    return
                 pass
+            pass
+            return
+        pass
 
-                if text.startswith("LOSS"):
-                    new_loss = None
-                    try:
-                        new_loss = int(text[4:])
-                    except ValueError:
-                        print("Expected max fragment size")
-                        continue
-                    pass
+        if text.startswith("TRACE"):
+            argument = text[5:].strip()
+            if argument == "":
+                tracer.dump()
+                return
+            pass
 
-                    if new_loss <= 0:
-                        print("Value must be at least 0")
-                        continue
-                    pass
+            new_level = None
+            try:
+                new_level = int(argument)
+            except ValueError:
+                print("Expected trace level")
+                return
+            pass
+
+            if new_level < TraceLevel.Off or new_level > TraceLevel.Segment:
+                print(f"Value must be between {TraceLevel.Off.value} and {TraceLevel.Segment.value}")
+                return
+            pass
+
+            tracer.set_level(new_level)
+            print(f"Setting TRACE_LEVEL to {tracer.level.name}")
+            return
+        pass
+
+        self.controller.next_stream().run(lambda v: v.send_text(text))
+
+    def run(self):
+        self.start()
 
-                    Config.PACKET_LOSS = new_loss
-                    print(f"Setting PACKET_LOSS to {Config.PACKET_LOSS}")
-                    continue
+        def listener():
+            while True:
+                line = self.input.get()
+                if line == None:
+                    return
                 pass
 
-                self.controller.next_stream().run(lambda v: v.send_text(text))
+                self.command(line)
             pass
 
         listener_thread = Thread(target=listener)
         listener_thread.start()
 
-        while self.controller == None or self.controller.open:
+        gro = Config.UDP_GRO and enable_gro(self.handle)
+        self.pool = BufferPool(max(Config.RECEIVE_BUFFER_SIZE, Config.GRO_BUFFER_SIZE) if gro else Config.RECEIVE_BUFFER_SIZE, Config.BUFFER_POOL_CAPACITY)
+        buffer = self.pool.acquire()
+        while self.running():
             try:
-                data, addr = self.handle.recvfrom(2048)
-                segment = parse_segment(data)
-                if segment == None:
-                    continue
+                if gro:
+                    size, segment_size, addr = receive_segments(self.handle, buffer.data)
+                else:
+                    size, addr = self.handle.recvfrom_into(buffer.data)
+                    segment_size = max(1, size)
                 pass
-
-                print("[<--]", segment.get_printable())
-
-                self.update(addr, segment)
-                self.tick()
             except (TimeoutError, OSError):
                 self.tick()
                 continue
             pass
-        pass
 
-        if self.controller != None:
-            self.controller.dispose()
+            metrics = self.metrics_for(addr)
+            datagrams = 1 if segment_size >= size else (size + segment_size - 1) // segment_size
+            self.datagrams += datagrams
+            self.received_bytes += size
+            if metrics != None:
+                metrics.datagrams_received += datagrams
+                metrics.bytes_received += size
+            pass
+
+            if datagrams == 1:
+                segments = parse_datagram(buffer.view[:size], metrics)
+            else:
+                segments = []
+                for offset in range(0, size, segment_size):
+                    segments += parse_datagram(buffer.view[offset : min(size, offset + segment_size)], metrics)
+                pass
+            pass
+
+            if any(isinstance(segment, DataSegment) for segment in segments):
+                for segment in segments:
+                    if isinstance(segment, DataSegment):
+                        segment.attach(buffer)
+                    pass
+                pass
+                buffer.release()
+                buffer = self.pool.acquire()
+            pass
+
+            for segment in segments:
+                tracer.trace(TraceLevel.Segment, "[<--] {}", segment)
+                self.update(addr, segment)
+            pass
+            self.tick()
         pass
+        buffer.release()
+        self.dispose()
 
-        user_input.stop()
+        self.input.put(None)
         listener_thread.join()
         pass
 
     def __init__(self) -> None:
         self.init()
         self.controller: ConnectionController | None = None
+        self.impairment: ImpairmentProxy | None = None
+        self.input: Any = user_input.queue
+        self.stats: Any = None
+        self.worker = 0
+        self.datagrams = 0
+        self.received_bytes = 0
 
         self.handle = socket(AF_INET, SOCK_DGRAM)
         self.handle.settimeout(0.1)
-
+        if Config.SOCKET_BUFFER_SIZE > 0:
+            self.handle.setsockopt(SOL_SOCKET, SO_RCVBUF, Config.SOCKET_BUFFER_SIZE)
+            self.handle.setsockopt(SOL_SOCKET, SO_SNDBUF, Config.SOCKET_BUFFER_SIZE)
+        pass
         pass
 
 
@@ -161,25 +301,104 @@ class ServerApplication(Application):
         print(f"Starting server at {port}")
 
     def start(self):
+        if self.reuse_port:
+            self.handle.setsockopt(SOL_SOCKET, SO_REUSEPORT, 1)
+        pass
         self.handle.bind(("", port))
 
     def update(self, addr: tuple[str, int], segment: Segment):
-        if self.controller == None:
-            if isinstance(segment, InitMessage):
-                self.controller = ConnectionController(self.handle, addr, True)
-                self.controller.handle_segment(segment)
-                print(f"New client [{addr[0]}]:{addr[1]}")
+        controller = self.controllers.get(addr)
+        if controller == None:
+            if self.stopping or not isinstance(segment, InitMessage):
+                if isinstance(segment, DataSegment):
+                    segment.release()
+                pass
+                return
             pass
 
+            controller = ConnectionController(self.handle, addr, True)
+            self.controllers[addr] = controller
+            self.connections += 1
+            self.controller = controller
+            tracer.trace(TraceLevel.Info, f"New client [{addr[0]}]:{addr[1]}")
+        pass
+
+        controller.handle_segment(segment)
+        pass
+
+    def tick(self):
+        now = time.monotonic()
+        if now < self.next_sweep:
             return
         pass
+        self.next_sweep = now + Config.SWEEP_INTERVAL
 
-        self.controller.handle_segment(segment)
+        for addr, controller in list(self.controllers.items()):
+            if controller.open:
+                controller.tick()
+            pass
+
+            if not controller.open:
+                controller.dispose()
+                self.controllers.pop(addr)
+            pass
+        pass
+
+        if self.controller != None and not self.controller.open:
+            self.controller = next(reversed(self.controllers.values()), None)
+        pass
+
+        if now >= self.next_report:
+            self.next_report = now + Config.STATS_INTERVAL
+            self.report()
+        pass
+
+    def running(self):
+        return not self.stopping or self.controllers.__len__() > 0
+
+    def metrics_for(self, addr: tuple[str, int]):
+        controller = self.controllers.get(addr)
+        return controller.metrics if controller != None else None
+
+    def snapshots(self):
+        return [snapshot(controller) for controller in list(self.controllers.values())]
+
+    def fragment_limit(self):
+        return min((controller.max_fragment_size() for controller in list(self.controllers.values())), default=0)
+
+    def statistics(self):
+        return {"clients": self.controllers.__len__(), "connections": self.connections, **super().statistics()}
+
+    def dispose(self):
+        for controller in self.controllers.values():
+            controller.dispose()
         pass
 
-    def __init__(self, port: int) -> None:
+        self.controllers.clear()
+        self.report()
+
+    def command(self, text: str):
+        if text.startswith("FIN"):
+            self.stopping = True
+            for controller in list(self.controllers.values()):
+                if controller.open:
+                    controller.request_fin()
+                pass
+            pass
+            return
+        pass
+
+        super().command(text)
+
+    def __init__(self, port: int, reuse_port=False) -> None:
         super().__init__()
         self.port = port
+        self.reuse_port = reuse_port
+        self.controllers: dict[tuple[str, int], ConnectionController] = {}
+        self.connections = 0
+        self.stopping = False
+        self.next_sweep = 0.0
+        self.next_report = 0.0
 
 
 class ClientApplication(Application):
@@ -198,9 +417,152 @@ class ClientApplication(Application):
         super().__init__()
         self.addr = addr
         self.port = port
-        self.target = (addr, port)
+        self.target = self.impair((addr, port))
+        pass
+
+
+class AsyncApplication(Application):
+    def command(self, text: str):
+        self.controller = self.endpoint.controller if self.endpoint != None else None
+        super().command(text)
+
+    def snapshots(self):
+        assert self.endpoint != None
+        return [snapshot(connection) for connection in list(self.endpoint.connections.values())]
+
+    def fragment_limit(self):
+        assert self.endpoint != None
+        return min((connection.max_fragment_size() for connection in list(self.endpoint.connections.values())), default=0)
+
+    def statistics(self):
+        assert self.endpoint != None
+        return {"clients": self.endpoint.connections.__len__(), "connections": self.endpoint.connection_count, "datagrams": self.endpoint.datagrams, "bytes": self.endpoint.received_bytes}
+
+    def reporter(self):
+        self.report()
+        asyncio.get_running_loop().call_later(Config.STATS_INTERVAL, self.reporter)
+
+    def run(self):
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        self.endpoint = AsyncEndpoint(self.is_server)
+        await loop.create_datagram_endpoint(lambda: self.endpoint, sock=self.handle)
+        self.start()
+
+        def listener():
+            while True:
+                line = self.input.get()
+                if line == None:
+                    return
+                pass
+
+                loop.call_soon_threadsafe(self.command, line)
+            pass
+
+        listener_thread = Thread(target=listener)
+        listener_thread.start()
+
+        if self.stats != None:
+            self.reporter()
+        pass
+
+        await self.endpoint.finished
+        await asyncio.sleep(0.01)
+        self.endpoint.transport.close()
+        self.report()
+
+        self.input.put(None)
+        listener_thread.join()
+        pass
+
+    def __init__(self, is_server: bool) -> None:
+        self.endpoint: AsyncEndpoint | None = None
+        self.is_server = is_server
+        super().__init__()
+        self.handle.setblocking(False)
+        pass
+
+
+class AsyncServerApplication(AsyncApplication):
+    def init(self):
+        print(f"Starting server at {port}")
+
+    def command(self, text: str):
+        if text.startswith("FIN"):
+            assert self.endpoint != None
+            self.endpoint.shutdown()
+            return
+        pass
+
+        super().command(text)
+
+    def __init__(self, port: int, reuse_port=False) -> None:
+        super().__init__(True)
+        self.port = port
+        if reuse_port:
+            self.handle.setsockopt(SOL_SOCKET, SO_REUSEPORT, 1)
+        pass
+        self.handle.bind(("", port))
+
+
+class AsyncClientApplication(AsyncApplication):
+    def init(self):
+        print(f"Starting client and connecting to [{addr}]:{port}")
+
+    def start(self):
+        assert self.endpoint != None
+        self.endpoint.connect(self.target)
+
+    def __init__(self, addr: str, port: int) -> None:
+        super().__init__(False)
+        self.addr = addr
+        self.port = port
+        self.target = self.impair((addr, port))
+        pass
+
+
+def run_worker(port: int, index: int, commands: Any, stats: Any):
+    application = (AsyncServerApplication if Config.ENGINE == "asyncio" else ServerApplication)(port, True)
+    application.input = commands
+    application.stats = stats
+    application.worker = index
+    application.run()
+    tracer.close()
+
+
+def run_proxy(port: int, target: tuple[str, int], profile: str):
+    try:
+        proxy = ImpairmentProxy(target, profile, Config.IMPAIRMENT_SEED, ("", port)).start()
+    except ValueError as error:
+        exit(str(error))
+    pass
+    print(f"Starting impairment proxy at {port} for [{target[0]}]:{target[1]}")
+    print(f"[IMP] Up {proxy.up.profile.describe()}, down {proxy.down.profile.describe()}")
+
+    user_input.start()
+    while True:
+        line = user_input.queue.get()
+        if line == None or line.startswith("FIN"):
+            break
         pass
 
+        if line.startswith("STATS"):
+            print(proxy.statistics())
+            continue
+        pass
+
+        try:
+            proxy.configure(line)
+        except ValueError as error:
+            print(error)
+        pass
+    pass
+
+    print(proxy.statistics())
+    proxy.stop()
+
 
 if argv.__len__() < 2:
     exit("Expected arguments")
@@ -208,15 +570,46 @@ if argv.__len__() < 2:
 if argv[1] == "client":
     if argv.__len__() != 4:
         exit("Expected 4 arguments")
+    tracer.install()
     addr = argv[2]
     port = int(argv[3])
-    ClientApplication(addr, port).run()
+    user_input.start()
+    client = (AsyncClientApplication if Config.ENGINE == "asyncio" else ClientApplication)(addr, port)
+    client.run()
+    if client.impairment != None:
+        client.impairment.stop()
+    pass
+    tracer.close()
     print("Done")
 elif argv[1] == "server":
-    if argv.__len__() != 3:
-        exit("Expected 3 arguments")
+    if argv.__len__() not in (3, 4):
+        exit("Expected 3 or 4 arguments")
+    tracer.install()
     port = int(argv[2])
-    ServerApplication(port).run()
+    workers = int(argv[3]) if argv.__len__() == 4 else Config.SERVER_WORKERS
+    if workers <= 0:
+        workers = cpu_count() or 1
+    pass
+
+    if workers > 1:
+        print(f"Starting server at {port} with {workers} workers")
+        error = Supervisor(port, workers, run_worker).run()
+        if error != None:
+            tracer.close()
+            exit(error)
+        pass
+    else:
+        user_input.start()
+        (AsyncServerApplication if Config.ENGINE == "asyncio" else ServerApplication)(port).run()
+    pass
+    tracer.close()
+    print("Done")
+elif argv[1] == "proxy":
+    if argv.__len__() not in (5, 6):
+        exit("Expected 5 or 6 arguments")
+    tracer.install()
+    run_proxy(int(argv[2]), (argv[3], int(argv[4])), argv[5] if argv.__len__() == 6 else Config.IMPAIRMENT)
+    tracer.close()
     print("Done")
 else:
     exit("Invalid type")
@@ -0,0 +1,93 @@
+import random
+
+import pytest
+
+from Compression import FRAME, FRAME_COMPRESSED, FRAME_RAW, FrameDecoder, FrameEncoder, codecs, encoded_bound
+from config import Config
+
+
+def encode(codec, data: bytes, length=1400):
+    offset = 0
+
+    def source(size: int):
+        nonlocal offset
+        chunk = data[offset : offset + size]
+        offset += chunk.__len__()
+        return chunk
+
+    encoder = FrameEncoder(codec, source)
+    output = []
+    while True:
+        fragment = encoder.read(length)
+        if fragment.__len__() == 0:
+            break
+        pass
+        output.append(fragment)
+    pass
+
+    return encoder, output
+
+
+def decode(codec, fragments: list[bytes]):
+    decoder = FrameDecoder(codec)
+    return b"".join(decoder.decode(fragment) for fragment in fragments)
+
+
+def kinds(encoded: bytes):
+    offset = 0
+    output = []
+    while offset < encoded.__len__():
+        kind, length = FRAME.unpack_from(encoded, offset)
+        output.append(kind)
+        offset += FRAME.size + length
+    pass
+
+    return output
+
+
+text = b"".join(b"line %d of a very compressible text file\n" % index for index in range(200000))
+noise = random.Random(1).randbytes(3 * Config.COMPRESSION_CHUNK_SIZE + 1234)
+
+
+@pytest.mark.parametrize("codec", codecs.values(), ids=lambda codec: codec.name)
+@pytest.mark.parametrize("data", [text, noise, noise + text, b""], ids=["text", "noise", "mixed", "empty"])
+def test_round_trip(codec, data):
+    encoder, fragments = encode(codec, data)
+    assert all(fragment.__len__() == 1400 for fragment in fragments[:-1])
+    assert decode(codec, fragments) == data
+    assert encoder.raw == data.__len__()
+    assert encoder.encoded == sum(fragment.__len__() for fragment in fragments) <= encoded_bound(data.__len__())
+
+
+def test_compressible_data_shrinks():
+    encoder, _ = encode(codecs[1], text)
+    assert encoder.encoded < text.__len__() * Config.COMPRESSION_MIN_RATIO
+    assert set(kinds(b"".join(encode(codecs[1], text)[1]))) == {FRAME_COMPRESSED}
+
+
+def test_incompressible_data_backs_off():
+    encoder, fragments = encode(codecs[1], noise)
+    frames = kinds(b"".join(fragments))
+    assert frames == [FRAME_RAW] * frames.__len__()
+    assert encoder.backoff > 0
+
+
+def test_decoder_handles_split_frames():
+    _, fragments = encode(codecs[1], text, 7)
+    assert decode(codecs[1], fragments) == text
+
+
+def test_invalid_frames():
+    with pytest.raises(ValueError):
+        FrameDecoder(codecs[1]).decode(FRAME.pack(FRAME_COMPRESSED, 4) + b"junk")
+    pass
+
+    with pytest.raises(ValueError):
+        FrameDecoder(codecs[1]).decode(FRAME.pack(7, 1) + b"x")
+    pass
+
+
+def test_encoded_bound():
+    assert encoded_bound(0) == 0
+    assert encoded_bound(1) == 1 + FRAME.size
+    assert encoded_bound(Config.COMPRESSION_CHUNK_SIZE + 1) == Config.COMPRESSION_CHUNK_SIZE + 1 + 2 * FRAME.size
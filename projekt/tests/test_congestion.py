@@ -0,0 +1,70 @@
+from CongestionControl import FixedWindow, NewReno, create_congestion_controller
+from config import Config
+
+
+def test_fixed_window():
+    controller = FixedWindow()
+    controller.on_ack(100)
+    controller.on_loss(1, 2)
+    controller.on_timeout(3)
+    assert controller.limit() == Config.WINDOW_SIZE
+
+
+def test_slow_start():
+    controller = NewReno()
+    assert controller.limit() == Config.INITIAL_WINDOW
+    controller.on_ack(Config.INITIAL_WINDOW)
+    assert controller.limit() == 2 * Config.INITIAL_WINDOW
+
+
+def test_congestion_avoidance():
+    controller = NewReno()
+    controller.threshold = controller.window = 20.0
+    for _ in range(20):
+        controller.on_ack(1)
+    pass
+    assert controller.limit() == 20
+    assert 20.9 < controller.window < 21
+
+
+def test_one_reduction_per_loss_episode():
+    controller = NewReno()
+    controller.window = 40.0
+    controller.on_loss(5, 50)
+    assert controller.limit() == 20
+    assert controller.threshold == 20
+
+    controller.on_loss(10, 52)
+    controller.on_loss(50, 53)
+    assert controller.limit() == 20
+
+    controller.on_loss(51, 60)
+    assert controller.limit() == 10
+
+
+def test_timeout_collapses_window():
+    controller = NewReno()
+    controller.window = 40.0
+    controller.on_timeout(100)
+    assert controller.limit() == Config.MIN_WINDOW
+    assert controller.threshold == 20
+
+    controller.on_loss(99, 120)
+    assert controller.limit() == Config.MIN_WINDOW
+
+
+def test_window_bounds():
+    controller = NewReno()
+    controller.on_ack(Config.MAX_WINDOW * 2)
+    assert controller.limit() == Config.MAX_WINDOW
+
+    controller.window = float(Config.MIN_WINDOW)
+    controller.on_loss(1, 2)
+    assert controller.limit() == Config.MIN_WINDOW
+
+
+def test_factory(monkeypatch):
+    monkeypatch.setattr(Config, "CONGESTION_CONTROL", "newreno")
+    assert isinstance(create_congestion_controller(), NewReno)
+    monkeypatch.setattr(Config, "CONGESTION_CONTROL", "fixed")
+    assert isinstance(create_congestion_controller(), FixedWindow)
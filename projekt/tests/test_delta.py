@@ -0,0 +1,112 @@
+import os
+import random
+
+import pytest
+
+from config import Config
+from Delta import apply_delta, block_size, delta_timeout, read_signatures, write_delta, write_signatures
+
+
+def write(path, data: bytes):
+    with open(path, "wb") as file:
+        file.write(data)
+    pass
+
+    return str(path)
+
+
+def read(path):
+    with open(path, "rb") as file:
+        return file.read()
+    pass
+
+
+def synchronize(tmp_path, basis: bytes, target: bytes):
+    destination = write(tmp_path / "destination.bin", basis)
+    signatures = write_signatures(destination)
+    assert signatures != None
+
+    with open(write(tmp_path / "source.bin", target), "rb") as source:
+        encoded = write_delta(source, signatures)
+    pass
+    signatures.close()
+    if encoded == None:
+        return None
+    pass
+
+    delta, literal_bytes = encoded
+    with delta:
+        assert apply_delta(delta, destination) == target.__len__()
+    pass
+    assert read(destination) == target
+    return literal_bytes
+
+
+def test_signatures(tmp_path):
+    data = random.Random(1).randbytes(Config.DELTA_MIN_BLOCK * 10 + 100)
+    signatures = write_signatures(write(tmp_path / "basis.bin", data))
+    assert signatures != None
+
+    with signatures:
+        block, table = read_signatures(signatures)
+    pass
+    assert block == block_size(data.__len__())
+    assert sum(entries.__len__() for entries in table.values()) == data.__len__() // block
+
+
+def test_signatures_skip_small_and_missing_files(tmp_path):
+    assert write_signatures(write(tmp_path / "small.bin", b"x" * 100)) == None
+    assert write_signatures(str(tmp_path / "missing.bin")) == None
+
+
+def test_identical_file(tmp_path):
+    data = random.Random(2).randbytes(1 << 20)
+    assert synchronize(tmp_path, data, data) == 0
+
+
+def test_edited_file(tmp_path):
+    generator = random.Random(3)
+    basis = generator.randbytes(1 << 20)
+    target = bytearray(basis)
+    target[1000:1050] = generator.randbytes(50)
+    target = target[:500000] + generator.randbytes(3333) + target[500000:-7000]
+
+    literal_bytes = synchronize(tmp_path, basis, bytes(target))
+    assert literal_bytes != None
+    assert literal_bytes < 4 * block_size(basis.__len__()) + 3333
+
+
+def test_unrelated_file_is_not_worth_a_delta(tmp_path):
+    generator = random.Random(4)
+    assert synchronize(tmp_path, generator.randbytes(1 << 20), generator.randbytes(1 << 20)) == None
+
+
+def test_corrupted_delta_keeps_destination(tmp_path):
+    generator = random.Random(5)
+    basis = generator.randbytes(1 << 20)
+    target = basis[:-100] + generator.randbytes(100)
+    destination = write(tmp_path / "destination.bin", basis)
+    signatures = write_signatures(destination)
+    assert signatures != None
+
+    with open(write(tmp_path / "source.bin", target), "rb") as source:
+        encoded = write_delta(source, signatures)
+    pass
+    assert encoded != None
+
+    delta, _ = encoded
+    data = bytearray(delta.read())
+    data[-1] ^= 0xFF
+    delta.seek(0)
+    delta.write(data)
+
+    with pytest.raises(ValueError):
+        apply_delta(delta, destination)
+    pass
+    assert read(destination) == basis
+    assert os.listdir(tmp_path).__len__() == 2
+
+
+def test_delta_timeout_scales_with_size():
+    assert delta_timeout(0) == Config.DELTA_TIMEOUT
+    assert delta_timeout(10 * Config.DELTA_MIN_RATE) == Config.DELTA_TIMEOUT + 10
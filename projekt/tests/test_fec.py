@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+from config import Config
+from FEC import ParityDecoder, ParityEncoder, parity_count
+
+
+def encode(fragments: list[bytes], loss=0.1):
+    encoder = ParityEncoder(loss)
+    parities = []
+    for fragment_id, data in enumerate(fragments):
+        parities += encoder.add(fragment_id, data, 64)
+    pass
+
+    return parities + encoder.flush()
+
+
+def decode(fragments: list[bytes], parities, missing: set[int]):
+    decoder = ParityDecoder()
+    recovered = []
+    for fragment_id, data in enumerate(fragments):
+        if fragment_id not in missing:
+            recovered += decoder.add_data(fragment_id, data, min(missing, default=0))
+        pass
+    pass
+
+    for first, index, count, data in parities:
+        recovered += decoder.add_parity(first, index, count, data, min(missing, default=0))
+    pass
+
+    return dict(recovered)
+
+
+def source(count: int, size=1000):
+    generator = random.Random(count)
+    return [generator.randbytes(size) for _ in range(count - 1)] + [generator.randbytes(size // 3)]
+
+
+def test_parity_count():
+    assert parity_count(0, Config.FEC_GROUP_SIZE) == 0
+    assert 0 < parity_count(0.05, Config.FEC_GROUP_SIZE) <= Config.FEC_MAX_PARITY
+    assert parity_count(0.5, Config.FEC_GROUP_SIZE) == Config.FEC_MAX_PARITY
+
+
+def test_no_parity_without_loss():
+    assert encode(source(Config.FEC_GROUP_SIZE), 0) == []
+
+
+@pytest.mark.parametrize("missing", [{0}, {15}, {3, 9}, {0, 7, 15}, {1, 2, 3, 4}])
+def test_recovers_erasures(missing):
+    fragments = source(Config.FEC_GROUP_SIZE)
+    parities = encode(fragments, 0.2)
+    assert parities.__len__() == Config.FEC_MAX_PARITY
+
+    recovered = decode(fragments, parities, missing)
+    assert recovered == {fragment_id: fragments[fragment_id] for fragment_id in missing}
+
+
+def test_too_many_erasures():
+    fragments = source(Config.FEC_GROUP_SIZE)
+    parities = encode(fragments, 0.2)
+    assert decode(fragments, parities, set(range(Config.FEC_MAX_PARITY + 1))) == {}
+
+
+def test_partial_group_on_flush():
+    fragments = source(5)
+    parities = encode(fragments, 0.2)
+    assert all(count == 5 for _, _, count, _ in parities)
+    assert decode(fragments, parities, {4}) == {4: fragments[4]}
+
+
+def test_gap_starts_new_group():
+    encoder = ParityEncoder(0.2)
+    fragments = source(8)
+    parities = []
+    for fragment_id, data in enumerate(fragments[:4]):
+        parities += encoder.add(fragment_id, data, 64)
+    pass
+    for fragment_id, data in enumerate(fragments[4:], 10):
+        parities += encoder.add(fragment_id, data, 64)
+    pass
+    parities += encoder.flush()
+
+    assert sorted({(first, count) for first, _, count, _ in parities}) == [(0, 4), (10, 4)]
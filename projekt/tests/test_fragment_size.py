@@ -0,0 +1,33 @@
+from config import Config
+from Protocol import BaseConnection
+from Segment import TIMESTAMP, formats
+
+
+def connection(version: int, receive_size: int = 0):
+    result = BaseConnection(("127.0.0.1", 1), False)
+    result.set_version(version, receive_size)
+    return result
+
+
+def test_automatic_size_fills_datagram():
+    assert connection(1).fragment_size() == Config.MAX_DATAGRAM_SIZE - formats[1].header_size
+    assert connection(2).fragment_size() == Config.MAX_DATAGRAM_SIZE - formats[2].header_size - TIMESTAMP.size
+
+
+def test_manual_size_is_used_when_it_fits(monkeypatch):
+    monkeypatch.setattr(Config, "FRAGMENT_SIZE", 1024)
+    assert connection(2).fragment_size() == 1024
+
+
+def test_manual_size_is_clamped_to_datagram(monkeypatch):
+    monkeypatch.setattr(Config, "FRAGMENT_SIZE", 20000)
+    target = connection(2)
+    assert target.fragment_size() == target.max_fragment_size()
+    assert target.fragment_size() + formats[2].header_size + TIMESTAMP.size == Config.MAX_DATAGRAM_SIZE
+
+
+def test_manual_size_is_clamped_to_peer_receive_size(monkeypatch):
+    monkeypatch.setattr(Config, "FRAGMENT_SIZE", 20000)
+    target = connection(2, 16384)
+    target.max_datagram = 65507
+    assert target.fragment_size() == 16384 - formats[2].header_size - TIMESTAMP.size
@@ -0,0 +1,346 @@
+import os
+import random
+
+import pytest
+
+from Compression import FrameEncoder, codecs
+from config import Config
+from FragmentWriter import FragmentWriter, discard_records, load_resume, open_download, records, resume_path, transfer_identity
+from Segment import FileMessage
+
+FRAGMENT_SIZE = 100
+
+
+def fragments(size: int):
+    data = random.Random(size).randbytes(size)
+    return data, [data[offset : offset + FRAGMENT_SIZE] for offset in range(0, size, FRAGMENT_SIZE)]
+
+
+def test_out_of_order_writes(tmp_path):
+    data, parts = fragments(1050)
+    with open(tmp_path / "file.bin", "wb") as file:
+        writer = FragmentWriter(file, 0, data.__len__(), FRAGMENT_SIZE)
+        assert writer.fragment_total == 11
+        for fragment_id in [3, 1, 10, 0]:
+            assert writer.write(fragment_id, parts[fragment_id])
+        pass
+        assert writer.next_fragment == 2
+        assert writer.bitmap[0] == 0b1011
+        assert writer.bitmap[1] == 0b100
+
+        assert writer.write(2, parts[2])
+        assert writer.next_fragment == 4
+        for fragment_id in range(4, 10):
+            assert writer.write(fragment_id, parts[fragment_id])
+        pass
+        assert writer.next_fragment == 11
+    pass
+
+    assert (tmp_path / "file.bin").read_bytes() == data
+
+
+def test_duplicates_and_out_of_range(tmp_path):
+    data, parts = fragments(300)
+    with open(tmp_path / "file.bin", "wb") as file:
+        writer = FragmentWriter(file, 0, data.__len__(), FRAGMENT_SIZE)
+        assert writer.write(1, parts[1])
+        assert not writer.write(1, parts[1])
+        assert writer.received(1)
+        assert not writer.received(0)
+        assert not writer.write(3, parts[0])
+        assert not writer.received(3)
+    pass
+
+
+def test_offset_writes(tmp_path):
+    data, parts = fragments(250)
+    path = tmp_path / "file.bin"
+    path.write_bytes(b"\0" * 1000)
+    with open(path, "r+b") as file:
+        writer = FragmentWriter(file, 500, data.__len__(), FRAGMENT_SIZE)
+        for fragment_id in reversed(range(parts.__len__())):
+            writer.write(fragment_id, parts[fragment_id])
+        pass
+    pass
+
+    content = path.read_bytes()
+    assert content[500:750] == data
+    assert content[:500] == b"\0" * 500
+    assert content[750:] == b"\0" * 250
+
+
+def test_preallocates(tmp_path):
+    with open(tmp_path / "file.bin", "wb") as file:
+        FragmentWriter(file, 0, 12345, FRAGMENT_SIZE)
+        assert os.fstat(file.fileno()).st_size == 12345
+    pass
+
+
+def test_sequential_mode(tmp_path):
+    data, parts = fragments(1000)
+    with open(tmp_path / "file.bin", "wb") as file:
+        writer = FragmentWriter(file, 0, data.__len__(), 0)
+        for fragment_id in [2, 1, 5, 0]:
+            assert writer.write(fragment_id, parts[fragment_id])
+        pass
+        assert writer.next_fragment == 3
+        assert sorted(writer.pending) == [5]
+        assert writer.received(1) and writer.received(5) and not writer.received(4)
+        assert not writer.write(5, parts[5])
+
+        for fragment_id in range(3, parts.__len__()):
+            writer.write(fragment_id, parts[fragment_id])
+        pass
+        assert writer.pending == {}
+    pass
+
+    assert (tmp_path / "file.bin").read_bytes() == data
+
+
+def test_received_ranges(tmp_path):
+    data, parts = fragments(2000)
+    with open(tmp_path / "file.bin", "wb") as file:
+        writer = FragmentWriter(file, 0, data.__len__(), FRAGMENT_SIZE)
+        assert writer.received_ranges(100) == []
+        for fragment_id in [0, 1, 4, 5, 6, 9, 19]:
+            writer.write(fragment_id, parts[fragment_id])
+        pass
+        assert writer.received_ranges(100) == [(0, 2), (4, 7), (9, 10), (19, 20)]
+        assert writer.received_ranges(2) == [(0, 2), (4, 7)]
+    pass
+
+
+def test_received_ranges_sequential(tmp_path):
+    _, parts = fragments(1000)
+    with open(tmp_path / "file.bin", "wb") as file:
+        writer = FragmentWriter(file, 0, 1000, 0)
+        for fragment_id in [0, 2, 3, 6]:
+            writer.write(fragment_id, parts[fragment_id])
+        pass
+        assert writer.received_ranges(100) == [(0, 1), (2, 4), (6, 7)]
+        assert writer.received_ranges(1) == [(0, 1)]
+    pass
+
+
+def test_received_ranges_scan_whole_bytes(tmp_path):
+    with open(tmp_path / "file.bin", "wb") as file:
+        writer = FragmentWriter(file, 0, 100 * FRAGMENT_SIZE, FRAGMENT_SIZE)
+        for fragment_id in [1, *range(16, 41), 99]:
+            writer.write(fragment_id, b"x" * FRAGMENT_SIZE)
+        pass
+        assert writer.received_ranges(100) == [(1, 2), (16, 41), (99, 100)]
+    pass
+
+
+def download(tmp_path, identity: int, size=1000, **options):
+    return FileMessage(1, 2, str(tmp_path / "file.bin"), size, fragment_size=FRAGMENT_SIZE, resume=identity, **options)
+
+
+def test_resume_record(tmp_path):
+    data, parts = fragments(1000)
+    segment = download(tmp_path, 1234)
+    file, writer = open_download(segment)
+    for fragment_id in [0, 1, 2, 7]:
+        writer.write(fragment_id, parts[fragment_id])
+    pass
+    writer.close()
+    file.close()
+    assert os.path.exists(segment.path + Config.RESUME_SUFFIX)
+    assert records == {}
+
+    bitmap = load_resume(segment)
+    assert bitmap != None and bitmap[0] == 0b10000111
+
+    file, writer = open_download(segment)
+    assert writer.next_fragment == 3
+    assert writer.received_ranges(100) == [(0, 3), (7, 8)]
+    for fragment_id in [3, 4, 5, 6, 8, 9]:
+        writer.write(fragment_id, parts[fragment_id])
+    pass
+    assert writer.complete()
+    writer.close()
+    file.close()
+
+    assert not os.path.exists(segment.path + Config.RESUME_SUFFIX)
+    assert (tmp_path / "file.bin").read_bytes() == data
+
+
+def test_resume_identity_mismatch(tmp_path):
+    _, parts = fragments(1000)
+    segment = download(tmp_path, 1234)
+    file, writer = open_download(segment)
+    writer.write(0, parts[0])
+    writer.close()
+    file.close()
+
+    changed = download(tmp_path, 5678)
+    assert load_resume(changed) == None
+    assert load_resume(download(tmp_path, 1234, offset=100)) == None
+
+    file, writer = open_download(changed)
+    assert writer.next_fragment == 0
+    assert not os.path.exists(segment.path + Config.RESUME_SUFFIX)
+    writer.close()
+    file.close()
+
+
+def test_corrupt_record_is_ignored(tmp_path):
+    segment = download(tmp_path, 1234)
+    (tmp_path / "file.bin").write_bytes(b"")
+    (tmp_path / ("file.bin" + Config.RESUME_SUFFIX)).write_bytes(b"garbage")
+    assert load_resume(segment) == None
+
+
+def test_stripe_resume_path(tmp_path):
+    segment = download(tmp_path, 1234, offset=4096, total=8192)
+    assert resume_path(segment) == f"{segment.path}.4096{Config.RESUME_SUFFIX}"
+    assert resume_path(download(tmp_path, 1234)) == segment.path + Config.RESUME_SUFFIX
+
+
+def interrupted_stripes(tmp_path, identity: int):
+    _, parts = fragments(1000)
+    for offset, size in [(0, 500), (500, 500)]:
+        file, writer = open_download(download(tmp_path, identity, offset=offset, total=1000, size=size))
+        writer.write(0, parts[0])
+        writer.close()
+        file.close()
+    pass
+
+    return [tmp_path / f"file.bin.{offset}{Config.RESUME_SUFFIX}" for offset in [0, 500]]
+
+
+def test_fresh_start_discards_stale_records(tmp_path):
+    stale = interrupted_stripes(tmp_path, 1234)
+    other = tmp_path / ("file.bin.7" + Config.RESUME_SUFFIX)
+    file, writer = open_download(FileMessage(1, 2, str(tmp_path / "file.bin.7"), 1000, fragment_size=FRAGMENT_SIZE, resume=1234))
+    writer.close()
+    file.close()
+    assert all(path.exists() for path in [*stale, other])
+
+    file, writer = open_download(download(tmp_path, 5678))
+    assert not any(path.exists() for path in stale)
+    assert other.exists()
+    writer.close()
+    file.close()
+
+
+def test_fresh_stripe_keeps_matching_records(tmp_path):
+    kept = interrupted_stripes(tmp_path, 1234)
+    file, writer = open_download(download(tmp_path, 1234, offset=200, total=1000, size=300))
+    assert all(path.exists() for path in kept)
+    writer.close()
+    file.close()
+
+    file, writer = open_download(download(tmp_path, 5678, offset=0, total=1000, size=500))
+    assert not any(path.exists() for path in kept)
+    writer.close()
+    file.close()
+
+
+def test_fresh_start_detaches_stale_writers(tmp_path):
+    _, parts = fragments(1000)
+    stale = download(tmp_path, 1234, offset=500, total=1000, size=500)
+    old_file, old_writer = open_download(stale)
+    old_writer.write(0, parts[0])
+
+    file, writer = open_download(download(tmp_path, 5678))
+    old_writer.close()
+    old_file.close()
+    assert not os.path.exists(resume_path(stale))
+    writer.close()
+    file.close()
+
+
+def test_discard_records_detaches_active_writers(tmp_path):
+    stale = interrupted_stripes(tmp_path, 1234)
+    file, writer = open_download(download(tmp_path, 1234, offset=500, total=1000, size=500))
+    discard_records(str(tmp_path / "file.bin"))
+    assert records == {}
+    writer.close()
+    file.close()
+    assert not any(path.exists() for path in stale)
+
+
+def test_transfer_identity(tmp_path):
+    path = tmp_path / "source.bin"
+    path.write_bytes(b"one")
+    identity = transfer_identity(os.stat(path))
+    assert identity > 0
+    assert identity == transfer_identity(os.stat(path))
+
+    path.write_bytes(b"other")
+    assert identity != transfer_identity(os.stat(path))
+
+
+def compressed(size: int):
+    data = b"".join(b"line %d of a compressible file\n" % index for index in range(size))
+    source = [data]
+
+    def read(length: int):
+        chunk = source[0][:length]
+        source[0] = source[0][length:]
+        return chunk
+
+    encoder = FrameEncoder(codecs[1], read)
+    parts = []
+    while True:
+        fragment = encoder.read(FRAGMENT_SIZE)
+        if fragment.__len__() == 0:
+            break
+        pass
+        parts.append(fragment)
+    pass
+
+    return data, parts
+
+
+def test_spool_mode(tmp_path):
+    data, parts = compressed(2000)
+    with open(tmp_path / "file.bin", "wb") as file:
+        writer = FragmentWriter(file, 0, data.__len__(), FRAGMENT_SIZE, 1)
+        assert writer.spool != None
+        order = list(range(parts.__len__()))
+        random.Random(1).shuffle(order)
+        for fragment_id in order[1:]:
+            assert writer.write(fragment_id, parts[fragment_id])
+        pass
+        assert not writer.complete()
+        assert writer.decoded < data.__len__()
+
+        assert writer.write(order[0], parts[order[0]])
+        assert writer.complete()
+        assert writer.received_ranges(100) == [(0, parts.__len__())]
+        writer.close()
+        assert writer.spool == None
+    pass
+
+    assert (tmp_path / "file.bin").read_bytes() == data
+
+
+def test_spool_resume_bitmap_counts_decoded_bytes(tmp_path):
+    data, parts = compressed(2000)
+    with open(tmp_path / "file.bin", "wb") as file:
+        writer = FragmentWriter(file, 0, data.__len__(), FRAGMENT_SIZE, 1)
+        for fragment_id in range(parts.__len__() // 2):
+            writer.write(fragment_id, parts[fragment_id])
+        pass
+        count = writer.decoded // FRAGMENT_SIZE
+        bitmap = writer.resume_bitmap()
+        assert bitmap.__len__() == ((data.__len__() + FRAGMENT_SIZE - 1) // FRAGMENT_SIZE + 7) // 8
+        assert all(bitmap[fragment_id >> 3] & (1 << (fragment_id & 7)) for fragment_id in range(count))
+        assert not bitmap[count >> 3] & (1 << (count & 7))
+        writer.close()
+    pass
+
+
+def test_spool_rejects_oversized_output(tmp_path):
+    data, parts = compressed(2000)
+    with open(tmp_path / "file.bin", "wb") as file:
+        writer = FragmentWriter(file, 0, data.__len__() // 2, FRAGMENT_SIZE, 1)
+        with pytest.raises(ValueError):
+            for fragment_id in range(parts.__len__()):
+                writer.write(fragment_id, parts[fragment_id])
+            pass
+        pass
+        writer.close()
+    pass
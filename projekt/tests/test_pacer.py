@@ -0,0 +1,65 @@
+import pytest
+
+import Pacer as pacing
+from config import Config
+from Pacer import Pacer
+
+
+class Clock:
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, delay: float):
+        self.sleeps.append(delay)
+        self.now += delay
+
+    def __init__(self) -> None:
+        self.now = 100.0
+        self.sleeps: list[float] = []
+        pass
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(pacing.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(pacing.time, "sleep", clock.sleep)
+    monkeypatch.setattr(Config, "PACING_GAIN", 1.0)
+    monkeypatch.setattr(Config, "PACING_RATE", 0)
+    monkeypatch.setattr(Config, "PACING_QUANTUM", 0.002)
+    return clock
+
+
+def test_interval(clock):
+    pacer = Pacer()
+    assert pacer.interval(10, 0.1, 1000) == pytest.approx(0.01)
+    assert pacer.interval(10, None, 1000) == 0
+    assert pacer.interval(0, 0.1, 1000) == 0
+
+
+def test_interval_rate_limit(clock, monkeypatch):
+    monkeypatch.setattr(Config, "PACING_RATE", 100000)
+    pacer = Pacer()
+    assert pacer.interval(10, None, 1000) == pytest.approx(0.01)
+    assert pacer.interval(1000, 0.1, 1000) == pytest.approx(0.01)
+
+
+def test_delay_spreads_window(clock):
+    pacer = Pacer()
+    delays = [pacer.delay(10, 0.1, 1000) for _ in range(10)]
+    assert delays == [pytest.approx(0.01 * (index + 1)) for index in range(10)]
+    assert clock.sleeps == []
+
+
+def test_delay_skips_quantum(clock):
+    pacer = Pacer()
+    assert pacer.delay(1000, 0.1, 1000) == 0
+    assert pacer.delay(10, None, 1000) == 0
+
+
+def test_idle_pacer_does_not_burst(clock):
+    pacer = Pacer()
+    clock.now += 5
+    assert pacer.delay(10, 0.1, 1000) == pytest.approx(0.01)
+    clock.now += 0.01
+    assert pacer.delay(10, 0.1, 1000) == pytest.approx(0.01)
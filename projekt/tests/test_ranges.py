@@ -0,0 +1,27 @@
+import pytest
+
+from Segment import AckSegment, NextMessage, emit_segment, merge_ranges, parse_segment
+
+
+def test_merge_ranges():
+    assert merge_ranges([(5, 8), (0, 2), (1, 3), (3, 4)]) == [(0, 4), (5, 8)]
+    assert merge_ranges([(0, 10), (2, 4), (10, 12)]) == [(0, 12)]
+    assert merge_ranges([]) == []
+
+
+@pytest.mark.parametrize("version", [1, 2])
+def test_next_ranges(version):
+    segment = NextMessage(1, 2, [(0, 4), (6, 7), (9, 12)])
+    assert parse_segment(emit_segment(segment, version)) == segment
+
+
+def test_next_ranges_are_compact():
+    ranges = [(0, 1000), (1001, 2000)]
+    assert emit_segment(NextMessage(1, 2, ranges), 2).__len__() < emit_segment(NextMessage(1, 2, ranges[:1]), 1).__len__()
+    assert parse_segment(emit_segment(NextMessage(1, 2, []), 2)) == NextMessage(1, 2, [])
+
+
+def test_ack_ranges():
+    segment = AckSegment(3, [(0, 100), (150, 151), (200, 70000)])
+    assert parse_segment(emit_segment(segment, 2)) == segment
+    assert parse_segment(emit_segment(AckSegment(3, []), 2)) == AckSegment(3, [])
@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+
+import pytest
+
+from config import Config
+from Metrics import ConnectionMetrics, StreamMetrics
+from Protocol import RoundSender
+
+
+class Owner:
+    def send(self, segment, flush=True):
+        self.sent.append(segment.fragment_id)
+
+    def __init__(self) -> None:
+        self.sent: list[int] = []
+        pass
+
+
+def sender(count: int):
+    fragments = [bytes([index]) * 10 for index in range(count)]
+    stream = SimpleNamespace(id=1, owner=Owner(), metrics=StreamMetrics(ConnectionMetrics()), read_fragment=lambda: fragments.pop(0) if fragments.__len__() > 0 else b"")
+    return RoundSender(stream)
+
+
+@pytest.fixture(autouse=True)
+def window(monkeypatch):
+    monkeypatch.setattr(Config, "WINDOW_SIZE", 4)
+    monkeypatch.setattr(Config, "FRAGMENT_MAX_AGE", 2)
+    monkeypatch.setattr(Config, "FORCE_REPEAT", 1)
+
+
+def test_fill_sends_one_window():
+    target = sender(10)
+    target.fill()
+    assert target.owner.sent == [0, 1, 2, 3]
+    assert list(target.fragment_buffer) == [0, 1, 2, 3]
+    target.fill()
+    assert target.owner.sent == [0, 1, 2, 3]
+
+
+def test_unconfirmed_fragments_wait_for_max_age():
+    target = sender(4)
+    target.fill()
+    target.owner.sent.clear()
+    target.confirm([(0, 1)])
+    target.confirm([])
+    assert target.owner.sent == []
+    target.confirm([])
+    assert target.owner.sent == [1, 2, 3]
+    assert target.metrics.retransmissions == 3
+    assert all(fragment.age == 0 and fragment.transmissions == 2 for fragment in target.fragment_buffer.values())
+
+
+def test_resends_are_limited_per_round(monkeypatch):
+    target = sender(4)
+    target.fill()
+    target.owner.sent.clear()
+    for _ in range(Config.FRAGMENT_MAX_AGE):
+        target.confirm([])
+    pass
+    monkeypatch.setattr(Config, "WINDOW_SIZE", 2)
+    target.confirm([])
+    assert target.owner.sent == [0, 1]
+    assert target.send_limit == 0
+    target.fill()
+    assert target.owner.sent == [0, 1]
+
+
+def test_finished_after_all_confirmed():
+    target = sender(3)
+    target.fill()
+    assert not target.finished()
+    target.confirm([(0, 3)])
+    target.fill()
+    assert target.finished()
+    assert target.next_fragment_id == 3
+    assert target.metrics.bytes_acknowledged == 30
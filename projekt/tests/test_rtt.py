@@ -0,0 +1,66 @@
+import pytest
+
+from config import Config
+from RttEstimator import RttEstimator, timestamp
+
+
+def test_initial_timeout():
+    estimator = RttEstimator()
+    assert estimator.srtt == None
+    assert estimator.timeout() == Config.TIMEOUT
+
+
+def test_first_sample():
+    estimator = RttEstimator()
+    estimator.sample(0.1)
+    assert estimator.srtt == 0.1
+    assert estimator.rttvar == 0.05
+    assert estimator.rto == pytest.approx(max(Config.MIN_RTO, 0.1 + max(Config.CLOCK_GRANULARITY, 0.2)))
+
+
+def test_minimum_rtt():
+    estimator = RttEstimator()
+    assert estimator.min_rtt == None
+    for rtt in [0.3, 0.1, 0.2]:
+        estimator.sample(rtt)
+    pass
+    assert estimator.min_rtt == 0.1
+
+
+def test_smoothing():
+    estimator = RttEstimator()
+    estimator.sample(0.1)
+    estimator.sample(0.3)
+    assert estimator.srtt == pytest.approx(0.875 * 0.1 + 0.125 * 0.3)
+    assert estimator.rttvar == pytest.approx(0.75 * 0.05 + 0.25 * 0.2)
+
+
+def test_timeout_bounds():
+    estimator = RttEstimator()
+    estimator.sample(0.0001)
+    assert estimator.rto == Config.MIN_RTO
+
+    estimator = RttEstimator()
+    estimator.sample(Config.MAX_RTO * 2)
+    assert estimator.rto == Config.MAX_RTO
+
+
+def test_backoff():
+    estimator = RttEstimator()
+    estimator.sample(0.2)
+    assert [estimator.timeout(attempt) for attempt in range(3)] == [estimator.rto, estimator.rto * 2, estimator.rto * 4]
+    assert estimator.timeout(30) == Config.MAX_RTO
+
+
+def test_invalid_samples_are_ignored():
+    estimator = RttEstimator()
+    estimator.sample(0)
+    estimator.sample(-1)
+    estimator.echo(0)
+    assert estimator.srtt == None
+
+
+def test_echo():
+    estimator = RttEstimator()
+    estimator.echo(timestamp())
+    assert estimator.srtt != None and 0 < estimator.srtt < 1
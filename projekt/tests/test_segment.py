@@ -0,0 +1,68 @@
+import pytest
+
+from Segment import AcceptMessage, AckSegment, DataSegment, DoneMessage, FileMessage, FinMessage, InitMessage, NextMessage, OkMessage, ParitySegment, PingMessage, ProbeAckSegment, ProbeSegment, TextMessage, emit_segment, parse_datagram, parse_segment, to_ranges
+
+shared = [
+    InitMessage(1, 7, 2, 1400),
+    FinMessage(1, 8),
+    OkMessage(2, 9, 2, 1400),
+    TextMessage(3, 10, "Ahoj, svet"),
+    FileMessage(3, 11, "folder/file.bin", 12345),
+    DoneMessage(3, 12),
+    NextMessage(3, 13, [(0, 4), (6, 9)]),
+    PingMessage(0, 14),
+    DataSegment(3, 15, b"payload"),
+]
+
+wide = [
+    FileMessage(5, 70000, "file.bin", 5 << 32, offset=4096, total=6 << 32, fragment_size=1400, resume=1, delta=1, compression=6, fec=1),
+    AcceptMessage(5, 70001, [(0, 10), (20, 25)], 1, 1),
+    AcceptMessage(5, 70002),
+    DataSegment(5, 70003, bytes(range(256)) * 4, 123456789),
+    AckSegment(5, [(0, 100), (101, 200)], 987654, 3),
+    AckSegment(5, [], 1),
+    ParitySegment(5, 70016, 1, 16, b"\x01\x02" * 700),
+    ProbeSegment(0, 1472, bytes(1400)),
+    ProbeAckSegment(0, 1472),
+]
+
+
+@pytest.mark.parametrize("segment", shared, ids=lambda segment: segment.__class__.__name__)
+def test_round_trip_v1(segment):
+    assert parse_segment(emit_segment(segment, 1)) == segment
+
+
+@pytest.mark.parametrize("segment", shared + wide, ids=lambda segment: segment.__class__.__name__)
+def test_round_trip_v2(segment):
+    assert parse_segment(emit_segment(segment, 2)) == segment
+
+
+def test_v1_drops_wide_fields():
+    parsed = parse_segment(emit_segment(FileMessage(1, 2, "file.bin", 100, offset=10, resume=1), 1))
+    assert parsed == FileMessage(1, 2, "file.bin", 100)
+
+    parsed = parse_segment(emit_segment(DataSegment(1, 3, b"data", 42), 1))
+    assert parsed == DataSegment(1, 3, b"data")
+
+
+def test_parse_datagram_coalesced():
+    segments = [DataSegment(7, index, bytes([index]) * 100, index) for index in range(5)] + [AckSegment(8, [(0, 3)], 5)]
+    datagram = b"".join(emit_segment(segment, 2) for segment in segments)
+    assert parse_datagram(datagram) == segments
+
+
+def test_corrupted_segment_is_rejected():
+    data = emit_segment(TextMessage(1, 2, "corrupt me"), 2)
+    data[-1] ^= 0xFF
+    assert parse_segment(data) == None
+
+
+def test_truncated_segment_is_rejected():
+    data = emit_segment(DataSegment(1, 2, b"x" * 100, 3), 2)
+    assert parse_segment(data[:-10]) == None
+    assert parse_segment(data[:5]) == None
+
+
+def test_to_ranges():
+    assert to_ranges([5, 1, 2, 3, 7, 8, 2]) == [(1, 4), (5, 6), (7, 9)]
+    assert to_ranges([]) == []
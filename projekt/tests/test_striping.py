@@ -0,0 +1,68 @@
+import pytest
+
+from config import Config
+from Striping import StripePlanner, StripeTracker, split
+
+
+@pytest.mark.parametrize("size, count, fragment_size", [(10000, 3, 1000), (10000, 4, 1400), (999, 2, 1000), (1 << 20, 8, 1472), (5000, 5, 1000)])
+def test_split(size, count, fragment_size):
+    stripes = split(size, count, fragment_size)
+    assert 0 < stripes.__len__() <= count
+    assert stripes[0][0] == 0
+    assert sum(length for _, length in stripes) == size
+    for (offset, length), (next_offset, _) in zip(stripes, stripes[1:]):
+        assert offset + length == next_offset
+        assert length % fragment_size == 0
+    pass
+
+
+def test_configured_stripes(monkeypatch):
+    monkeypatch.setattr(Config, "STRIPES", 4)
+    planner = StripePlanner()
+    assert planner.count(1 << 30, 1000, 0.01) == 4
+    assert planner.count(2500, 1000, 0.01) == 3
+
+
+def test_small_files_use_one_stripe(monkeypatch):
+    monkeypatch.setattr(Config, "STRIPES", 0)
+    assert StripePlanner().count(Config.STRIPE_MIN_SIZE - 1, 1000, None) == 1
+
+
+def test_size_limits_stripes(monkeypatch):
+    monkeypatch.setattr(Config, "STRIPES", 0)
+    planner = StripePlanner()
+    assert planner.count(3 * Config.STRIPE_MIN_SIZE, 1000, None) == min(3, Config.MAX_STRIPES)
+    assert planner.count(100 * Config.STRIPE_MIN_SIZE, 1000, None) == Config.MAX_STRIPES
+
+
+def test_measured_throughput_limits_stripes(monkeypatch):
+    monkeypatch.setattr(Config, "STRIPES", 0)
+    monkeypatch.setattr(Config, "STRIPE_MIN_DURATION", 0.5)
+    planner = StripePlanner()
+    planner.observe(1, Config.STRIPE_MIN_SIZE, 0.25)
+    assert planner.count(4 * Config.STRIPE_MIN_SIZE, 1000, None) == 2
+
+
+def test_prefers_best_observed_count(monkeypatch):
+    monkeypatch.setattr(Config, "STRIPES", 0)
+    planner = StripePlanner()
+    planner.observe(Config.MAX_STRIPES, Config.STRIPE_MIN_SIZE, 2.0)
+    planner.observe(2, Config.STRIPE_MIN_SIZE, 1.0)
+    assert planner.count(100 * Config.STRIPE_MIN_SIZE, 1000, None) == 2
+
+
+def test_tracker():
+    tracker = StripeTracker()
+    assert tracker.complete("file", 300, 100, 1) == None
+    assert tracker.complete("other", 50, 50, 4) == 4
+    assert tracker.complete("file", 300, 200, 2) == 3
+    assert tracker.progress == {}
+
+
+def test_fallback_uses_initial_window(monkeypatch):
+    monkeypatch.setattr(Config, "STRIPES", 0)
+    monkeypatch.setattr(Config, "STRIPE_MIN_DURATION", 0.5)
+    monkeypatch.setattr(Config, "INITIAL_WINDOW", 10)
+    size = 8 * Config.STRIPE_MIN_SIZE
+    srtt = 10 * 1000 * 0.5 * 2 / size
+    assert StripePlanner().count(size, 1000, srtt) == 2
@@ -0,0 +1,44 @@
+import multiprocessing
+import sys
+
+import pytest
+
+from config import Config
+from Supervisor import Supervisor, Worker
+
+
+def crash(port, index, commands, stats):
+    sys.exit(3)
+
+
+@pytest.fixture(autouse=True)
+def restarts(monkeypatch):
+    monkeypatch.setattr(Config, "RESTART_BACKOFF", 0.01)
+    monkeypatch.setattr(Config, "RESTART_MAX_BACKOFF", 0.04)
+    monkeypatch.setattr(Config, "RESTART_LIMIT", 3)
+    monkeypatch.setattr(Config, "RESTART_WINDOW", 60)
+    monkeypatch.setattr(Config, "SWEEP_INTERVAL", 0.01)
+
+
+def test_backoff_doubles_up_to_maximum():
+    worker = Worker(multiprocessing.get_context("fork"), crash, 0, 0, None)
+    assert worker.backoff(100) == 0.01
+    worker.restarts = [100, 100]
+    assert worker.backoff(100) == 0.04
+    worker.restarts = [100, 100, 100]
+    assert worker.backoff(100) == None
+
+
+def test_old_restarts_leave_the_window():
+    worker = Worker(multiprocessing.get_context("fork"), crash, 0, 0, None)
+    worker.restarts = [0, 0, 0, 90]
+    assert worker.backoff(100) == 0.02
+    assert worker.restarts == [90]
+
+
+def test_gives_up_after_restart_limit():
+    supervisor = Supervisor(0, 1, crash)
+    supervisor.input_closed = True
+    error = supervisor.run()
+    assert error != None and "code 3" in error
+    assert supervisor.workers[0].restarts.__len__() == Config.RESTART_LIMIT
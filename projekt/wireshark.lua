@@ -12,52 +12,105 @@ local types = {
     [7] = "Data",
     [8] = "Done",
     [9] = "Next",
-    [10] = "Ping"
+    [10] = "Ping",
+    [11] = "Ack",
+    [12] = "Probe",
+    [13] = "ProbeAck",
+    [14] = "Parity"
 }
 
-fields.type = ProtoField.uint8("pks_protocol.type", "Type", base.DEC, types)
+fields.type = ProtoField.uint8("pks_protocol.type", "Type", base.DEC, types, 0x7F)
+fields.version = ProtoField.uint8("pks_protocol.version", "Wide (v2)", base.DEC, nil, 0x80)
 fields.length = ProtoField.uint16("pks_protocol.length", "Length", base.DEC)
 fields.stream = ProtoField.uint32("pks_protocol.stream", "Stream", base.DEC)
 fields.checksum = ProtoField.uint32("pks_protocol.checksum", "Checksum", base.DEC)
 fields.id = ProtoField.uint16("pks_protocol.id", "ID", base.DEC)
 fields.fragment_id = ProtoField.uint16("pks_protocol.fragment_id", "Fragment", base.DEC)
+fields.id_wide = ProtoField.uint32("pks_protocol.id_wide", "ID", base.DEC)
+fields.fragment_id_wide = ProtoField.uint32("pks_protocol.fragment_id_wide", "Fragment", base.DEC)
+fields.timestamp = ProtoField.uint32("pks_protocol.timestamp", "Timestamp (us)", base.DEC)
+fields.first = ProtoField.uint16("pks_protocol.first", "First fragment", base.DEC)
+fields.first_wide = ProtoField.uint32("pks_protocol.first_wide", "First fragment", base.DEC)
+fields.index = ProtoField.uint8("pks_protocol.index", "Parity index", base.DEC)
+fields.count = ProtoField.uint8("pks_protocol.count", "Group size", base.DEC)
 fields.data = ProtoField.string("pks_protocol.data", "Data", base.ASCII)
 
-function pks_protocol_proto.dissector(buffer, pinfo, tree)
-    pinfo.cols.protocol = "PksProtocol"
-    local subtree = tree:add(pks_protocol_proto, buffer(), "PKS Protokol")
-
-    local p_type = 0
+local function dissect_segment(buffer, offset, tree)
+    local p_type = offset
     local p_length = p_type + 1
     local p_stream = p_length + 2
     local p_checksum = p_stream + 4
     local p_id = p_checksum + 4
-    local p_data = p_id + 2
 
-    subtree:add(fields.type, buffer(p_type, 1))
-    subtree:add(fields.length, buffer(p_length, 2))
-    subtree:add(fields.stream, buffer(p_stream, 4))
-    subtree:add(fields.checksum, buffer(p_checksum, 4))
+    local wide = bit.band(buffer(p_type, 1):uint(), 0x80) ~= 0
+    local id_size = wide and 4 or 2
+    local p_data = p_id + id_size
+    if (p_data > buffer:len()) then
+        tree:add(pks_protocol_proto, buffer(offset), "PKS Protokol (truncated)")
+        return buffer:len(), "Truncated"
+    end
 
-    local type = buffer(p_type, p_length):int()
-    local length = buffer(p_length, 2):int()
-    local stream = buffer(p_stream, 4):int()
-    local id = buffer(p_id, 2):int()
-    pinfo.cols.info = ""
+    local type = bit.band(buffer(p_type, 1):uint(), 0x7F)
+    local length = buffer(p_length, 2):uint()
+    local stream = buffer(p_stream, 4):uint()
+    local id = buffer(p_id, id_size):uint()
+    local info = ""
         .. "Stream: " .. stream .. (stream % 2 == 0 and "(Server)" or "(Client)") .. ", "
-        .. (type == 7 and "Fragment: " or "ID: ") .. id .. ", "
+        .. (type == 7 and "Fragment: " or type == 14 and "First: " or "ID: ") .. id .. ", "
         .. "Len: " .. length .. ", "
         .. (types[type] or "Unknown") .. " (" .. type .. ")"
 
+    local p_end = math.min(p_data + length, buffer:len())
+    length = p_end - p_data
+
+    local subtree = tree:add(pks_protocol_proto, buffer(offset, p_end - offset), "PKS Protokol")
+    subtree:add(fields.type, buffer(p_type, 1))
+    subtree:add(fields.version, buffer(p_type, 1))
+    subtree:add(fields.length, buffer(p_length, 2))
+    subtree:add(fields.stream, buffer(p_stream, 4))
+    subtree:add(fields.checksum, buffer(p_checksum, 4))
+    subtree:append_text(", " .. info)
+
     if (type == 7) then
-        subtree:add(fields.fragment_id, buffer(p_id, 2))
+        subtree:add(wide and fields.fragment_id_wide or fields.fragment_id, buffer(p_id, id_size))
+    elseif (type == 14) then
+        subtree:add(wide and fields.first_wide or fields.first, buffer(p_id, id_size))
     else
-        subtree:add(fields.id, buffer(p_id, 2))
+        subtree:add(wide and fields.id_wide or fields.id, buffer(p_id, id_size))
+    end
+
+    if (type == 7 and wide and length >= 4) then
+        subtree:add(fields.timestamp, buffer(p_data, 4))
+        p_data = p_data + 4
+        length = length - 4
+    end
+
+    if (type == 14 and length >= 2) then
+        subtree:add(fields.index, buffer(p_data, 1))
+        subtree:add(fields.count, buffer(p_data + 1, 1))
+        p_data = p_data + 2
+        length = length - 2
     end
 
     if (length > 0) then
         subtree:add(fields.data, buffer(p_data, length))
     end
+
+    return p_end, info
+end
+
+function pks_protocol_proto.dissector(buffer, pinfo, tree)
+    pinfo.cols.protocol = "PksProtocol"
+
+    local offset = 0
+    local infos = {}
+    while (offset < buffer:len()) do
+        local info
+        offset, info = dissect_segment(buffer, offset, tree)
+        table.insert(infos, info)
+    end
+
+    pinfo.cols.info = table.concat(infos, " | ")
 end
 
 DissectorTable.get("udp.port"):add(8080, pks_protocol_proto)